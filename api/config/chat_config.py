@@ -1,10 +1,14 @@
 import os
 from functools import partial
-from typing import Type, Union
+from typing import Union
 
 import openai
 from anthropic import Anthropic, AnthropicBedrock
 
+OPENAI_MODEL = "gpt-4o-mini"
+# Response length requested from every model
+LLM_MAX_TOKENS = 4096
+
 # Client configurations
 ANTHROPIC_SONNET_CLIENT = partial(Anthropic, model="claude-3-5-sonnet-latest")
 ANTHROPIC_BEDROCK_CLIENT = partial(
@@ -17,5 +21,22 @@ ANTHROPIC_BEDROCK_CLIENT = partial(
 # Default client
 CURRENT_CLIENT = openai
 
+
+def current_provider() -> str:
+    """Name of the provider behind the current client"""
+    if CURRENT_CLIENT is openai:
+        return "openai"
+    if CURRENT_CLIENT.func is AnthropicBedrock:
+        return "bedrock"
+    return "anthropic"
+
+
+def current_model_name() -> str:
+    """Model used by the current client"""
+    if CURRENT_CLIENT is openai:
+        return OPENAI_MODEL
+    return CURRENT_CLIENT.keywords["model"]
+
+
 # Type alias for client types
-ChatClient = Union[Type[openai], partial[Union[Anthropic, AnthropicBedrock]]]
+ChatClient = Union[type[openai], partial[Anthropic | AnthropicBedrock]]
@@ -0,0 +1,192 @@
+# jobs/assets/admission.py
+
+import logging
+import math
+import os
+import time
+
+from config.chat_config import current_model_name
+from rq import Queue
+from services.queue import get_async_redis, get_redis
+from utils.db_utils import update_asset_status
+from utils.metrics_utils import incr_metrics
+from utils.rate_limit_utils import model_budget
+
+logger = logging.getLogger(__name__)
+
+# Waiting stage jobs at which new uploads are deferred / refused
+ADMISSION_DEFER_DEPTH = int(os.getenv("ADMISSION_DEFER_DEPTH", "200"))
+ADMISSION_REJECT_DEPTH = int(os.getenv("ADMISSION_REJECT_DEPTH", "2000"))
+# Estimated time to drain the queues at which uploads are deferred / refused
+ADMISSION_DEFER_WAIT_SECONDS = int(os.getenv("ADMISSION_DEFER_WAIT_SECONDS", "600"))
+ADMISSION_REJECT_WAIT_SECONDS = int(os.getenv("ADMISSION_REJECT_WAIT_SECONDS", "3600"))
+# How far back stage completions count towards throughput
+ADMISSION_THROUGHPUT_WINDOW_SECONDS = int(
+    os.getenv("ADMISSION_THROUGHPUT_WINDOW_SECONDS", "300")
+)
+# Average LLM calls and tokens a stage spends; with the model's shared rate
+# limit budget they cap how many stages a minute the pipeline can finish
+ADMISSION_LLM_CALLS_PER_STAGE = int(os.getenv("ADMISSION_LLM_CALLS_PER_STAGE", "10"))
+ADMISSION_LLM_TOKENS_PER_STAGE = int(
+    os.getenv("ADMISSION_LLM_TOKENS_PER_STAGE", "20000")
+)
+RETRY_AFTER_MIN_SECONDS = 30
+RETRY_AFTER_MAX_SECONDS = 3600
+
+BACKLOG_KEY = "admission:backlog"
+THROUGHPUT_PREFIX = "admission:completed"
+BUCKET_SECONDS = 60
+
+PROCESS_NOW = "now"
+DEFER = "defer"
+REJECT = "reject"
+
+
+def _bucket_key(bucket: int) -> str:
+    return f"{THROUGHPUT_PREFIX}:{bucket}"
+
+
+def _recent_buckets() -> list[str]:
+    current = int(time.time()) // BUCKET_SECONDS
+    count = max(1, ADMISSION_THROUGHPUT_WINDOW_SECONDS // BUCKET_SECONDS)
+    # The current minute is still filling up, so the window ends before it
+    return [_bucket_key(current - offset) for offset in range(1, count + 1)]
+
+
+async def record_stage_completion_async():
+    """Count a finished stage towards recent pipeline throughput"""
+    try:
+        key = _bucket_key(int(time.time()) // BUCKET_SECONDS)
+        pipeline = get_async_redis().pipeline(transaction=False)
+        pipeline.incr(key)
+        pipeline.expire(key, ADMISSION_THROUGHPUT_WINDOW_SECONDS + 2 * BUCKET_SECONDS)
+        await pipeline.execute()
+    except Exception as e:
+        logger.warning(f"Failed to record stage completion: {e!s}")
+
+
+def pipeline_load() -> dict:
+    """Waiting stage jobs, deferred uploads and recent stage throughput"""
+    # Imported lazily: jobs.assets.base calls back into this module
+    from jobs.assets.base import AssetProcessor
+
+    redis_conn = get_redis()
+    buckets = _recent_buckets()
+    pipeline = redis_conn.pipeline(transaction=False)
+    for name in AssetProcessor.stage_queues():
+        pipeline.llen(Queue(name, connection=redis_conn).key)
+    pipeline.llen(BACKLOG_KEY)
+    pipeline.mget(buckets)
+    *depths, backlog, completions = pipeline.execute()
+
+    completed = sum(int(count) for count in completions if count)
+    return {
+        "queue_depth": sum(depths),
+        "backlog": backlog,
+        "throughput_per_minute": completed * 60 / (len(buckets) * BUCKET_SECONDS),
+        "llm_ceiling_per_minute": llm_stage_ceiling(),
+    }
+
+
+def llm_stage_ceiling() -> float:
+    """Stages a minute the LLM token bucket can refill for, at the average
+    calls and tokens a stage spends"""
+    rpm, tpm = model_budget(current_model_name())
+    return min(
+        rpm / ADMISSION_LLM_CALLS_PER_STAGE, tpm / ADMISSION_LLM_TOKENS_PER_STAGE
+    )
+
+
+def _stages_per_second(load: dict) -> float:
+    # Measured throughput can briefly exceed what the budget sustains (bucket
+    # bursts), and is zero when nothing finished lately; either way stages
+    # cannot finish faster than their LLM calls are allowed
+    measured = load["throughput_per_minute"]
+    ceiling = load["llm_ceiling_per_minute"]
+    return (min(measured, ceiling) if measured else ceiling) / 60
+
+
+def decide_admission() -> dict:
+    """Whether a new upload's pipeline run should start now, wait, or be refused"""
+    load = pipeline_load()
+    waiting = load["queue_depth"] + load["backlog"]
+    per_second = _stages_per_second(load)
+    estimated_wait = waiting / per_second if per_second else None
+    wait = estimated_wait or 0
+
+    decision = {**load, "estimated_wait_seconds": estimated_wait}
+    if waiting >= ADMISSION_REJECT_DEPTH or wait >= ADMISSION_REJECT_WAIT_SECONDS:
+        # Time until the queues are back under the defer threshold
+        excess = waiting - ADMISSION_DEFER_DEPTH
+        retry_after = excess / per_second if per_second else RETRY_AFTER_MAX_SECONDS
+        decision["action"] = REJECT
+        decision["retry_after_seconds"] = min(
+            RETRY_AFTER_MAX_SECONDS,
+            max(RETRY_AFTER_MIN_SECONDS, math.ceil(retry_after)),
+        )
+    elif (
+        load["backlog"]
+        or waiting >= ADMISSION_DEFER_DEPTH
+        or wait >= ADMISSION_DEFER_WAIT_SECONDS
+    ):
+        # Anything already deferred goes first, so the backlog stays FIFO
+        decision["action"] = DEFER
+    else:
+        decision["action"] = PROCESS_NOW
+
+    incr_metrics("admission", {decision["action"]: 1})
+    return decision
+
+
+def admission_thresholds() -> dict:
+    return {
+        "defer_depth": ADMISSION_DEFER_DEPTH,
+        "reject_depth": ADMISSION_REJECT_DEPTH,
+        "defer_wait_seconds": ADMISSION_DEFER_WAIT_SECONDS,
+        "reject_wait_seconds": ADMISSION_REJECT_WAIT_SECONDS,
+        "throughput_window_seconds": ADMISSION_THROUGHPUT_WINDOW_SECONDS,
+        "llm_calls_per_stage": ADMISSION_LLM_CALLS_PER_STAGE,
+        "llm_tokens_per_stage": ADMISSION_LLM_TOKENS_PER_STAGE,
+    }
+
+
+def defer_run(file_hash: str):
+    """Park an upload's pipeline run on the low-priority backlog"""
+    get_redis().rpush(BACKLOG_KEY, file_hash)
+    update_asset_status(file_hash, "deferred")
+    logger.info(f"Deferred processing of {file_hash}")
+
+
+def drain_backlog() -> list[str]:
+    """Start deferred runs while the queues are under the defer thresholds"""
+    from jobs.assets.base import AssetProcessor
+
+    redis_conn = get_redis()
+    started = []
+    while True:
+        load = pipeline_load()
+        per_second = _stages_per_second(load)
+        wait = load["queue_depth"] / per_second if per_second else 0
+        if (
+            load["queue_depth"] >= ADMISSION_DEFER_DEPTH
+            or wait >= ADMISSION_DEFER_WAIT_SECONDS
+        ):
+            break
+        file_hash = redis_conn.lpop(BACKLOG_KEY)
+        if file_hash is None:
+            break
+        file_hash = file_hash.decode()
+        try:
+            AssetProcessor.queue_initial_processors(file_hash)
+            started.append(file_hash)
+        except Exception as e:
+            logger.error(f"Error starting deferred run for {file_hash}: {e!s}")
+    if started:
+        incr_metrics("admission", {"backlog_started": len(started)})
+    return started
+
+
+def admission_state() -> dict:
+    """Thresholds and the current load they are compared against"""
+    load = pipeline_load()
+    return {"thresholds": admission_thresholds(), **load}
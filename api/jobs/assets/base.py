@@ -1,21 +1,125 @@
 # jobs/assets/base.py
 
+import asyncio
 import logging
-import time
-from datetime import datetime
-from typing import Dict, Optional, TypeVar
+import os
+from contextvars import ContextVar
+from datetime import UTC, datetime
+from typing import TypeVar
 
+import bson
 import requests
+from jobs.assets.admission import drain_backlog, record_stage_completion_async
+from jobs.assets.batches import finish_batch_run
+from jobs.assets.scheduler import PipelineDAG, RunScheduler, stage_queue_name
 from langfuse import Langfuse
-from redis import Redis
 from rq import Queue, get_current_job
+from rq.exceptions import NoSuchJobError
 from rq.job import Job
+from services.events import publish_asset_event, publish_asset_event_async
+from services.llm_batches import (
+    BATCH_PENDING,
+    batch_mode_unavailable,
+    set_run_llm_mode,
+)
+from services.queue import get_redis
 from utils.db_utils import init_mongo, update_asset_status
+from utils.metrics_utils import incr_metrics, incr_metrics_async
 
 logger = logging.getLogger(__name__)
 
 T = TypeVar("T", bound="AssetProcessor")
 
+# "http" posts each stage to the API's /assets/process_* endpoint; "inprocess"
+# runs the processor inside the worker, skipping nginx and the API replicas.
+PROCESSOR_EXECUTION_MODE = os.getenv("PROCESSOR_EXECUTION_MODE", "http")
+
+
+# Set by the asyncio worker, where RQ's get_current_job() cannot see the job
+CURRENT_JOB: ContextVar[Job | None] = ContextVar("current_job", default=None)
+
+
+def _seconds_since(timestamp: datetime) -> float:
+    if timestamp.tzinfo is None:  # RQ < 2 stores naive UTC
+        timestamp = timestamp.replace(tzinfo=UTC)
+    return (datetime.now(UTC) - timestamp).total_seconds()
+
+
+async def _record_queue_wait(processor_type: str, job: Job):
+    if not job.enqueued_at:
+        return
+    wait_ms = _seconds_since(job.enqueued_at) * 1000
+    await incr_metrics_async(
+        f"queue_wait:{processor_type}", {"jobs": 1, "wait_ms": int(wait_ms)}
+    )
+
+
+def stage_job_id(processor_type: str, file_hash: str, run_id: str) -> str:
+    return f"{processor_type}_{file_hash}_{run_id}"
+
+
+def _update_job_meta(job: Job, **meta):
+    """Merge into a job's meta without dropping progress the stage saved"""
+    job.get_meta(refresh=True)
+    job.meta.update(meta)
+    job.save_meta()
+
+
+def record_job_progress(
+    processor_type: str, file_hash: str, run_id: str, done: int, total: int
+):
+    """Expose a running stage's progress fraction in its RQ job meta"""
+    try:
+        job = Job.fetch(
+            stage_job_id(processor_type, file_hash, run_id), connection=get_redis()
+        )
+    except NoSuchJobError:
+        return  # Triggered by hand through the HTTP endpoint
+    try:
+        _update_job_meta(
+            job,
+            progress=round(done / total, 4) if total else 1.0,
+            progress_items={"done": done, "total": total},
+        )
+    except Exception as e:
+        logger.warning(f"Failed to record progress for {job.id}: {e!s}")
+
+
+def _post_stage(processor_type: str, file_hash: str, run_id: str, span_id: str):
+    """Run a processor stage through the API's HTTP endpoint"""
+    headers = {"X-Span-ID": span_id, "X-Run-ID": run_id}
+    response = requests.post(
+        f"http://nginx:80/assets/process_{processor_type}/{file_hash}",
+        headers=headers,
+    )
+
+    if not response.ok:
+        raise Exception(
+            f"Processing API call failed with status {response.status_code}"
+        )
+
+    return response.json()
+
+
+async def _run_in_process(
+    processor_type: str, file_hash: str, run_id: str, span_id: str
+):
+    """Run a processor stage on this worker with the API endpoint's semantics"""
+    # Imported lazily: the routers package imports this module
+    from routers.assets import PROCESSORS
+
+    return await PROCESSORS[processor_type].run(
+        file_hash, run_id=run_id, span_id=span_id
+    )
+
+
+def flush_stage_traces():
+    """Send the spans of stages run in-process on this worker"""
+    from routers.assets import PROCESSORS
+
+    for processor in PROCESSORS.values():
+        processor.langfuse.flush()
+
 
 class AssetProcessor:
     """Base class for asset processors with simplified API-based processing"""
@@ -32,13 +136,23 @@ class AssetProcessor:
         "definitions": ["citations"],
     }
 
+    # The scheduler only needs run bookkeeping and trace metadata
+    ASSET_FIELDS = {
+        "current_run_id": 1,
+        "original_name": 1,
+        "file_type": 1,
+        "file_size": 1,
+    }
+
     def __init__(self, file_hash: str, processor_type: str):
         self.file_hash = file_hash
         self.processor_type = processor_type
         self.db = init_mongo()
         self.asset = self._get_asset()
-        self.redis_conn = Redis.from_url("redis://redis:6379")
-        self.queue = Queue("default", connection=self.redis_conn)
+        self.redis_conn = get_redis()
+        self.scheduler = RunScheduler(
+            self.redis_conn, PipelineDAG(self.PROCESSOR_REGISTRY)
+        )
 
         self.run_id = self.asset.get("current_run_id")
         if not self.run_id:
@@ -56,11 +170,18 @@ class AssetProcessor:
         )
 
     @classmethod
-    def execute_job(cls, file_hash: str, processor_type: str, run_id: str):
-        """Execute a processing job"""
-        processor = cls(file_hash, processor_type)
-        current_job = get_current_job(connection=processor.redis_conn)
+    async def execute_job_async(cls, file_hash: str, processor_type: str, run_id: str):
+        """Execute a processing job without blocking the event loop"""
+        processor = await asyncio.to_thread(cls, file_hash, processor_type)
+        current_job = CURRENT_JOB.get() or get_current_job(
+            connection=processor.redis_conn
+        )
         span = None
+        if current_job:
+            await _record_queue_wait(processor_type, current_job)
+        await publish_asset_event_async(
+            "job", file_hash, stage=processor_type, state="started", run_id=run_id
+        )
 
         try:
             span = processor.trace.span(
@@ -72,28 +193,60 @@ class AssetProcessor:
                 },
             )
 
-            # Make API call to appropriate endpoint
-            headers = {"X-Span-ID": span.id, "X-Run-ID": run_id}
-            response = requests.post(
-                f"http://nginx:80/assets/process_{processor_type}/{file_hash}",
-                headers=headers,
-            )
-
-            if not response.ok:
-                raise Exception(
-                    f"Processing API call failed with status {response.status_code}"
+            if PROCESSOR_EXECUTION_MODE == "inprocess":
+                # Stages await their LLM calls, so they share the worker's loop
+                # and its pooled database and LLM connections
+                result = await _run_in_process(
+                    processor_type, file_hash, run_id, span.id
+                )
+            else:
+                result = await asyncio.to_thread(
+                    _post_stage, processor_type, file_hash, run_id, span.id
                 )
 
-            result = response.json()
+            if isinstance(result, dict) and result.get("status") == BATCH_PENDING:
+                # Not complete: poll_llm_batches re-queues the stage once the
+                # provider has answered, and its dependents follow from there
+                if current_job:
+                    await asyncio.to_thread(
+                        _update_job_meta,
+                        current_job,
+                        status=BATCH_PENDING,
+                        batch_id=result["batch_id"],
+                    )
+                await publish_asset_event_async(
+                    "job",
+                    file_hash,
+                    stage=processor_type,
+                    state=BATCH_PENDING,
+                    run_id=run_id,
+                    batch_id=result["batch_id"],
+                )
+                span.event(name=f"{processor_type}_batch_pending", metadata=result)
+                return True
 
-            # Explicitly mark job as finished
             if current_job:
-                current_job.meta["status"] = "finished"
-                current_job.save_meta()
-                current_job.set_status("finished")
+                await asyncio.to_thread(
+                    _update_job_meta, current_job, status="finished", progress=1.0
+                )
+
+            await publish_asset_event_async(
+                "job", file_hash, stage=processor_type, state="finished", run_id=run_id
+            )
+            await record_stage_completion_async()
 
             # Queue dependent jobs
-            processor.queue_dependent_jobs(run_id)
+            await asyncio.to_thread(processor.queue_dependent_jobs, run_id)
+            if await asyncio.to_thread(processor.scheduler.run_complete, run_id):
+                await publish_asset_event_async(
+                    "run", file_hash, state="complete", run_id=run_id
+                )
+                await asyncio.to_thread(finish_batch_run, run_id)
+                await asyncio.to_thread(drain_backlog)
+            elif await asyncio.to_thread(processor.scheduler.run_finished, run_id):
+                # The last stage still running after a sibling failed
+                await asyncio.to_thread(finish_batch_run, run_id, True)
+                await asyncio.to_thread(drain_backlog)
 
             span.event(
                 name=f"{processor_type}_completed",
@@ -106,17 +259,36 @@ class AssetProcessor:
             return True
 
         except Exception as e:
-            error_msg = f"Error in {processor_type} processor: {str(e)}"
+            error_msg = f"Error in {processor_type} processor: {e!s}"
             logger.error(error_msg)
+            await publish_asset_event_async(
+                "job",
+                file_hash,
+                stage=processor_type,
+                state="failed",
+                run_id=run_id,
+                error=str(e),
+            )
 
             if current_job:
                 try:
-                    current_job.meta["status"] = "failed"
-                    current_job.meta["error"] = str(e)
-                    current_job.save_meta()
-                    current_job.set_status("failed")
+                    await asyncio.to_thread(
+                        _update_job_meta, current_job, status="failed", error=str(e)
+                    )
                 except Exception as job_error:
-                    logger.error(f"Error updating job status: {str(job_error)}")
+                    logger.error(f"Error updating job status: {job_error!s}")
+
+            try:
+                await asyncio.to_thread(
+                    processor.scheduler.fail_stage, run_id, processor_type
+                )
+                # Sibling stages may still be queued or running on the slot
+                if await asyncio.to_thread(processor.scheduler.run_finished, run_id):
+                    await asyncio.to_thread(finish_batch_run, run_id, True)
+                # The failed stage no longer holds its place in the queues
+                await asyncio.to_thread(drain_backlog)
+            except Exception as batch_error:
+                logger.error(f"Error releasing batch run: {batch_error!s}")
 
             if span:
                 try:
@@ -129,7 +301,7 @@ class AssetProcessor:
                         level="error",
                     )
                 except Exception as span_error:
-                    logger.error(f"Error recording span event: {str(span_error)}")
+                    logger.error(f"Error recording span event: {span_error!s}")
 
             raise
 
@@ -138,96 +310,53 @@ class AssetProcessor:
                 try:
                     span.end()
                 except Exception as span_error:
-                    logger.error(f"Error ending span: {str(span_error)}")
-            time.sleep(0.5)
+                    logger.error(f"Error ending span: {span_error!s}")
 
-    def queue_dependent_jobs(self, run_id: str):
-        """Queue jobs that depend on this processor"""
-        try:
-            # Find processors that list this one as a dependency
-            direct_dependents = [
-                proc_type
-                for proc_type, deps in self.PROCESSOR_REGISTRY.items()
-                if self.processor_type in deps
-            ]
-
-            logger.info(
-                f"Processor {self.processor_type} completed - checking {len(direct_dependents)} "
-                f"direct dependents"
-            )
-
-            # Check dependencies for each dependent processor
-            for dependent_type in direct_dependents:
-                self._queue_if_dependencies_met(dependent_type, run_id)
+    @classmethod
+    def stage_queues(cls) -> list[str]:
+        """Stage queue names, earliest stages first (the order workers poll)"""
+        return [
+            stage_queue_name(stage)
+            for stage in PipelineDAG(cls.PROCESSOR_REGISTRY).priority_order
+        ]
 
-        except Exception as e:
-            logger.error(f"Error queueing dependent jobs: {str(e)}")
+    @classmethod
+    def queue_stats(cls) -> dict[str, dict]:
+        """Depth and age of the oldest waiting job for every stage queue"""
+        redis_conn = get_redis()
+        stats = {}
+        for stage in PipelineDAG(cls.PROCESSOR_REGISTRY).priority_order:
+            queue = Queue(stage_queue_name(stage), connection=redis_conn)
+            oldest_wait = None
+            oldest = queue.get_job_ids(0, 1)
+            if oldest:
+                job = queue.fetch_job(oldest[0])
+                if job and job.enqueued_at:
+                    oldest_wait = _seconds_since(job.enqueued_at)
+            stats[stage] = {
+                "queue": queue.name,
+                "depth": queue.count,
+                "oldest_wait_seconds": oldest_wait,
+            }
+        return stats
 
-    def _queue_if_dependencies_met(self, processor_type: str, run_id: str):
-        """Queue a processor if all its dependencies are completed"""
+    def queue_dependent_jobs(self, run_id: str):
+        """Queue the dependents this stage was the last outstanding dependency of"""
         try:
-            dependencies = self.PROCESSOR_REGISTRY[processor_type]
-            logger.debug(
-                f"Checking dependencies for {processor_type}: needs {dependencies}"
-            )
-
-            # Check status of each dependency
-            all_deps_complete = True
-            dependency_status = {}
-
-            for dep in dependencies:
-                dep_job_id = f"{dep}_{self.file_hash}"
-                try:
-                    dep_job = Job.fetch(dep_job_id, connection=self.redis_conn)
-
-                    if not dep_job:
-                        logger.debug(f"Dependency job {dep_job_id} not found")
-                        dependency_status[dep] = "missing"
-                        all_deps_complete = False
-                        continue
-
-                    status = dep_job.get_status()
-                    meta_status = dep_job.meta.get("status")
-
-                    if status == "finished" and meta_status == "finished":
-                        dependency_status[dep] = "finished"
-                    else:
-                        dependency_status[dep] = f"status={status}, meta={meta_status}"
-                        all_deps_complete = False
-                        logger.debug(
-                            f"Dependency {dep} not ready: status={status}, meta={meta_status}"
-                        )
-
-                except Exception as e:
-                    logger.error(f"Error checking dependency {dep}: {str(e)}")
-                    dependency_status[dep] = f"error: {str(e)}"
-                    all_deps_complete = False
-
-            # Log comprehensive dependency status
+            ready = self.scheduler.complete_stage(run_id, self.processor_type)
             logger.info(
-                f"Dependency check for {processor_type}: "
-                f"complete={all_deps_complete}, "
-                f"statuses={dependency_status}"
+                f"Processor {self.processor_type} completed - {len(ready)} dependents ready"
             )
-
-            # If all dependencies complete, queue the processor
-            if all_deps_complete:
-                job_id = self.queue_processor(processor_type, run_id)
-                logger.info(
-                    f"Queued {processor_type} (job_id={job_id}) after all dependencies completed"
-                )
-            else:
-                logger.debug(
-                    f"Not queueing {processor_type} - waiting for dependencies: {dependency_status}"
-                )
+            for dependent_type in ready:
+                self.queue_processor(dependent_type, run_id)
 
         except Exception as e:
-            logger.error(f"Error checking dependencies for {processor_type}: {str(e)}")
+            logger.error(f"Error queueing dependent jobs: {e!s}")
 
-    def queue_processor(self, processor_type: str, run_id: str) -> Optional[str]:
+    def queue_processor(self, processor_type: str, run_id: str) -> str | None:
         """Queue a processor for execution"""
         try:
-            job_id = f"{processor_type}_{self.file_hash}"
+            job_id = stage_job_id(processor_type, self.file_hash, run_id)
 
             # Check if job already exists
             try:
@@ -239,12 +368,12 @@ class AssetProcessor:
                     return existing_job.id
             except Exception as e:
                 # Job doesn't exist or other error - proceed with creating new job
-                logger.debug(f"No existing job found for {job_id}: {str(e)}")
-                pass
+                logger.debug(f"No existing job found for {job_id}: {e!s}")
 
-            # Queue the job
-            job = self.queue.enqueue(
-                f"{self.__class__.__module__}.{self.__class__.__name__}.execute_job",
+            # Queue the job on its stage's own queue
+            queue = Queue(stage_queue_name(processor_type), connection=self.redis_conn)
+            job = queue.enqueue(
+                f"{self.__class__.__module__}.{self.__class__.__name__}.execute_job_async",
                 args=(self.file_hash, processor_type, run_id),
                 job_timeout="1h",
                 job_id=job_id,
@@ -255,26 +384,80 @@ class AssetProcessor:
             logger.info(
                 f"Queued {processor_type} processor for {self.file_hash} with job_id={job.id}"
             )
+            publish_asset_event(
+                "job",
+                self.file_hash,
+                stage=processor_type,
+                state="queued",
+                run_id=run_id,
+                job_id=job.id,
+            )
             return job.id
 
         except Exception as e:
             logger.error(
-                f"Error queueing {processor_type} processor for {self.file_hash}: {str(e)}"
+                f"Error queueing {processor_type} processor for {self.file_hash}: {e!s}"
             )
             return None
 
     @classmethod
-    def queue_initial_processors(cls, file_hash: str) -> Dict[str, str]:
-        """Queue processors with no dependencies"""
+    def resume_stage(
+        cls, file_hash: str, processor_type: str, run_id: str
+    ) -> str | None:
+        """Re-queue a stage of a run that was waiting on a provider batch"""
         try:
-            run_id = f"asset-{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+            Job.fetch(
+                stage_job_id(processor_type, file_hash, run_id),
+                connection=get_redis(),
+            ).delete()
+        except NoSuchJobError:
+            pass
+        return cls(file_hash, processor_type).queue_processor(processor_type, run_id)
+
+    @staticmethod
+    def new_run_id() -> str:
+        return f"asset-{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+
+    @classmethod
+    def queue_rerun(
+        cls, file_hash: str, from_stage: str, llm_mode: str | None = None
+    ) -> dict:
+        """Re-run one stage and everything downstream of it under a new run.
+
+        Upstream stages are not queued; their stored outputs are what the
+        re-run stages read, and stages whose inputs turn out unchanged reuse
+        their stored results.
+        """
+        stages = PipelineDAG(cls.PROCESSOR_REGISTRY).descendants(from_stage)
+        run_id = cls.new_run_id()
+        job_ids = cls.queue_initial_processors(
+            file_hash, stages=stages, run_id=run_id, llm_mode=llm_mode
+        )
+        return {"run_id": run_id, "stages": stages, "job_ids": job_ids}
 
+    @classmethod
+    def queue_initial_processors(
+        cls,
+        file_hash: str,
+        stages: list[str] | None = None,
+        run_id: str | None = None,
+        llm_mode: str | None = None,
+    ) -> dict[str, str]:
+        """Queue processors with no dependencies (within `stages`, if given).
+        llm_mode "batch" lets the run's stages use the provider's batch API"""
+        if llm_mode == "batch" and (reason := batch_mode_unavailable()):
+            raise ValueError(reason)
+        run_id = run_id or cls.new_run_id()
+        if llm_mode:
+            set_run_llm_mode(run_id, llm_mode)
+        try:
             trace = Langfuse().trace(
                 name="asset-processing",
                 id=run_id,
                 metadata={
                     "run_id": run_id,
                     "file_hash": file_hash,
+                    "stages": stages,
                     "timestamp": datetime.now().isoformat(),
                 },
             )
@@ -284,12 +467,8 @@ class AssetProcessor:
                 {"file_hash": file_hash}, {"$set": {"current_run_id": run_id}}
             )
 
-            # Get processors with no dependencies
-            initial_processors = [
-                p_type for p_type, deps in cls.PROCESSOR_REGISTRY.items() if not deps
-            ]
-
             processor = cls(file_hash, "initial")
+            initial_processors = processor.scheduler.start_run(run_id, stages)
             job_ids = {}
 
             trace.event(
@@ -302,20 +481,32 @@ class AssetProcessor:
                     job_ids[proc_type] = job_id
 
             if job_ids:
-                update_asset_status(file_hash, "processing_queued", job_ids=job_ids)
+                update_asset_status(
+                    file_hash, "processing_queued", job_ids=job_ids, run_id=run_id
+                )
 
             return job_ids
 
         except Exception as e:
-            logger.error(f"Error queueing initial processors for {file_hash}: {str(e)}")
+            logger.error(f"Error queueing initial processors for {file_hash}: {e!s}")
             if "trace" in locals():
                 trace.event(name="queue_error", metadata={"error": str(e)})
-            update_asset_status(file_hash, "queue_error", error=str(e))
+            update_asset_status(
+                file_hash,
+                "queue_error",
+                error=str(e),
+                run_id=run_id,
+            )
             raise
 
     def _get_asset(self):
         """Get asset from database"""
-        asset = self.db["raw_assets"].find_one({"file_hash": self.file_hash})
+        asset = self.db["raw_assets"].find_one(
+            {"file_hash": self.file_hash}, self.ASSET_FIELDS
+        )
         if not asset:
             raise Exception(f"Asset not found: {self.file_hash}")
+        incr_metrics(
+            "asset_reads:job_scheduler", {"reads": 1, "bytes": len(bson.encode(asset))}
+        )
         return asset
@@ -0,0 +1,101 @@
+# jobs/assets/batches.py
+
+import logging
+import os
+from datetime import datetime
+
+from pymongo import ReturnDocument
+from services.queue import get_redis
+from utils.db_utils import init_mongo
+
+logger = logging.getLogger(__name__)
+
+# Pipeline runs that batches may have in flight at once, across all batches
+BATCH_MAX_ACTIVE_RUNS = int(os.getenv("BATCH_MAX_ACTIVE_RUNS", "16"))
+BATCHES_COLLECTION = "batches"
+
+PENDING_KEY = "batches:pending"
+ACTIVE_KEY = "batches:active"
+RUN_STATE_TTL = int(os.getenv("PIPELINE_RUN_STATE_TTL", str(7 * 24 * 3600)))
+
+# Moves waiting assets into the active set while there is budget left.
+# KEYS[1] = waiting "<batch_id>:<file_hash>" entries (list, FIFO)
+# KEYS[2] = entries with a run in flight (set)
+# ARGV[1] = budget
+_ADMIT = """
+local admitted = {}
+while redis.call('SCARD', KEYS[2]) < tonumber(ARGV[1]) do
+    local entry = redis.call('LPOP', KEYS[1])
+    if not entry then
+        break
+    end
+    redis.call('SADD', KEYS[2], entry)
+    table.insert(admitted, entry)
+end
+return admitted
+"""
+
+
+def _run_key(run_id: str) -> str:
+    return f"pipeline:{run_id}:batch"
+
+
+def enqueue_batch(batch_id: str, file_hashes: list[str]) -> list[str]:
+    """Add a batch's assets to the shared backlog; returns the run ids started"""
+    if file_hashes:
+        get_redis().rpush(
+            PENDING_KEY, *[f"{batch_id}:{file_hash}" for file_hash in file_hashes]
+        )
+    return admit_batch_runs()
+
+
+def admit_batch_runs() -> list[str]:
+    """Start runs for waiting batch assets while the global budget allows"""
+    # Imported lazily: jobs.assets.base calls back into this module
+    from jobs.assets.base import AssetProcessor
+
+    redis_conn = get_redis()
+    admit = redis_conn.register_script(_ADMIT)
+    entries = admit(keys=[PENDING_KEY, ACTIVE_KEY], args=[BATCH_MAX_ACTIVE_RUNS])
+
+    db = init_mongo()
+    run_ids = []
+    for entry in entries:
+        entry = entry.decode() if isinstance(entry, bytes) else entry
+        batch_id, file_hash = entry.split(":", 1)
+        run_id = AssetProcessor.new_run_id()
+        # Registered before queueing: a quick run may finish before we return
+        redis_conn.set(_run_key(run_id), entry, ex=RUN_STATE_TTL)
+        db[BATCHES_COLLECTION].update_one({"_id": batch_id}, {"$inc": {"admitted": 1}})
+        try:
+            AssetProcessor.queue_initial_processors(file_hash, run_id=run_id)
+            run_ids.append(run_id)
+        except Exception as e:
+            logger.error(f"Error starting batch {batch_id} run for {file_hash}: {e}")
+            finish_batch_run(run_id, failed=True)
+    return run_ids
+
+
+def finish_batch_run(run_id: str, failed: bool = False):
+    """Release a finished run's budget slot and admit the next waiting assets"""
+    redis_conn = get_redis()
+    entry = redis_conn.getdel(_run_key(run_id))
+    if entry is None:
+        return  # Not a batch run, or already released
+    entry = entry.decode() if isinstance(entry, bytes) else entry
+    redis_conn.srem(ACTIVE_KEY, entry)
+
+    batch_id, _ = entry.split(":", 1)
+    batch = init_mongo()[BATCHES_COLLECTION].find_one_and_update(
+        {"_id": batch_id},
+        {"$inc": {"failed" if failed else "completed": 1}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if batch and batch["completed"] + batch["failed"] >= batch["total"]:
+        init_mongo()[BATCHES_COLLECTION].update_one(
+            {"_id": batch_id},
+            {"$set": {"status": "complete", "completed_at": datetime.now()}},
+        )
+        logger.info(f"Batch {batch_id} complete")
+
+    admit_batch_runs()
@@ -0,0 +1,157 @@
+# jobs/assets/scheduler.py
+
+import logging
+import os
+
+from redis import Redis
+
+logger = logging.getLogger(__name__)
+
+RUN_STATE_TTL = int(os.getenv("PIPELINE_RUN_STATE_TTL", str(7 * 24 * 3600)))
+
+# Marks a stage done and releases its dependents in one atomic step.
+# KEYS[1] = remaining dependency counts per stage (hash)
+# KEYS[2] = completed stages (set)
+# ARGV[1] = completed stage, ARGV[2] = TTL, ARGV[3..] = its dependents
+# Returns the dependents whose last dependency this was. A repeated completion
+# returns nothing, so every stage is released exactly once.
+_COMPLETE_STAGE = """
+if redis.call('SADD', KEYS[2], ARGV[1]) == 0 then
+    return {}
+end
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+local ready = {}
+for i = 3, #ARGV do
+    if redis.call('HINCRBY', KEYS[1], ARGV[i], -1) == 0 then
+        table.insert(ready, ARGV[i])
+    end
+end
+return ready
+"""
+
+
+class PipelineDAG:
+    """A processor registry compiled into dependency counts and dependents"""
+
+    def __init__(self, registry: dict[str, list[str]]):
+        unknown = {dep for deps in registry.values() for dep in deps} - set(registry)
+        if unknown:
+            raise ValueError(f"Unknown dependencies in registry: {sorted(unknown)}")
+
+        self.dependencies = {stage: list(deps) for stage, deps in registry.items()}
+        self.dependency_counts = {stage: len(deps) for stage, deps in registry.items()}
+        self.dependents = {stage: [] for stage in registry}
+        for stage, deps in registry.items():
+            for dep in deps:
+                self.dependents[dep].append(stage)
+        self.roots = [
+            stage for stage, count in self.dependency_counts.items() if not count
+        ]
+        self.depths = self._topological_depths()
+        # Earlier stages first, registry order within a level
+        self.priority_order = sorted(registry, key=lambda stage: self.depths[stage])
+
+    def descendants(self, stage: str) -> list[str]:
+        """A stage and everything downstream of it, in priority order"""
+        if stage not in self.dependents:
+            raise ValueError(f"Unknown stage: {stage}")
+        found = {stage}
+        pending = [stage]
+        while pending:
+            for dependent in self.dependents[pending.pop()]:
+                if dependent not in found:
+                    found.add(dependent)
+                    pending.append(dependent)
+        return [s for s in self.priority_order if s in found]
+
+    def _topological_depths(self) -> dict[str, int]:
+        """Longest dependency chain above each stage; raises on cycles"""
+        remaining = dict(self.dependency_counts)
+        depths = {stage: 0 for stage in self.roots}
+        ready = list(self.roots)
+        while ready:
+            stage = ready.pop()
+            for dependent in self.dependents[stage]:
+                depths[dependent] = max(depths.get(dependent, 0), depths[stage] + 1)
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    ready.append(dependent)
+        if any(remaining[stage] for stage in remaining):
+            raise ValueError("Processor registry contains a dependency cycle")
+        return depths
+
+
+def stage_queue_name(stage: str) -> str:
+    """Name of the RQ queue a pipeline stage is routed to"""
+    return f"assets_{stage}"
+
+
+class RunScheduler:
+    """Tracks which stages of a pipeline run are ready, atomically in Redis"""
+
+    def __init__(self, redis: Redis, dag: PipelineDAG):
+        self.redis = redis
+        self.dag = dag
+        self._complete_stage = redis.register_script(_COMPLETE_STAGE)
+
+    @staticmethod
+    def _keys(run_id: str) -> list[str]:
+        return [f"pipeline:{run_id}:remaining", f"pipeline:{run_id}:done"]
+
+    def start_run(self, run_id: str, stages: list[str] | None = None) -> list[str]:
+        """Initialise a run's dependency counts; returns the stages ready now.
+
+        `stages` limits the run to part of the DAG. It must be closed under
+        dependents (see PipelineDAG.descendants); dependencies outside it are
+        treated as already done.
+        """
+        stages = set(stages) if stages is not None else set(self.dag.dependents)
+        counts = {
+            stage: sum(dep in stages for dep in self.dag.dependencies[stage])
+            for stage in stages
+        }
+        remaining_key, done_key = self._keys(run_id)
+        pipeline = self.redis.pipeline()
+        pipeline.delete(remaining_key, done_key)
+        pipeline.hset(remaining_key, mapping=counts)
+        pipeline.expire(remaining_key, RUN_STATE_TTL)
+        pipeline.execute()
+        return [stage for stage in self.dag.priority_order if counts.get(stage) == 0]
+
+    def complete_stage(self, run_id: str, stage: str) -> list[str]:
+        """Record a finished stage; returns dependents that became ready"""
+        ready = self._complete_stage(
+            keys=self._keys(run_id),
+            args=[stage, RUN_STATE_TTL, *self.dag.dependents[stage]],
+        )
+        ready = [s.decode() if isinstance(s, bytes) else s for s in ready]
+        logger.debug(f"Run {run_id}: {stage} complete, released {ready}")
+        return ready
+
+    def run_complete(self, run_id: str) -> bool:
+        """Whether every stage in the run has completed"""
+        remaining_key, done_key = self._keys(run_id)
+        pipeline = self.redis.pipeline()
+        pipeline.hlen(remaining_key)
+        pipeline.scard(done_key)
+        stages, done = pipeline.execute()
+        return stages > 0 and done >= stages
+
+    def fail_stage(self, run_id: str, stage: str):
+        """Record a failed stage; its dependents can no longer run, so they are
+        settled along with it"""
+        failed_key = f"pipeline:{run_id}:failed"
+        pipeline = self.redis.pipeline()
+        pipeline.sadd(failed_key, *self.dag.descendants(stage))
+        pipeline.expire(failed_key, RUN_STATE_TTL)
+        pipeline.execute()
+
+    def run_finished(self, run_id: str) -> bool:
+        """Whether no stage of the run is still queued or running: each one has
+        completed, failed, or been skipped because a dependency failed"""
+        remaining_key, done_key = self._keys(run_id)
+        pipeline = self.redis.pipeline()
+        pipeline.hkeys(remaining_key)
+        pipeline.sunion(done_key, f"pipeline:{run_id}:failed")
+        stages, settled = pipeline.execute()
+        return bool(stages) and set(stages) <= set(settled)
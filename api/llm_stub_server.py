@@ -0,0 +1,150 @@
+# api/llm_stub_server.py
+"""OpenAI-compatible stand-in for the chat completions and batch APIs.
+
+Every prompt is answered with LLM_STUB_RESPONSE, and batches finish
+LLM_STUB_BATCH_SECONDS after they are created, so batch-mode pipeline runs
+can be exercised without a provider:
+
+uvicorn llm_stub_server:app --port 8100   # then OPENAI_BASE_URL=http://<host>:8100/v1
+"""
+
+import json
+import os
+import time
+import uuid
+
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import PlainTextResponse
+
+LLM_STUB_RESPONSE = os.getenv("LLM_STUB_RESPONSE", "{}")
+LLM_STUB_BATCH_SECONDS = float(os.getenv("LLM_STUB_BATCH_SECONDS", "5"))
+
+app = FastAPI(title="LLM stub")
+
+# In memory: the stub is for local runs and tests, not for keeping results
+_files: dict[str, dict] = {}
+_batches: dict[str, dict] = {}
+
+
+def _completion(body: dict) -> dict:
+    prompt_tokens = len(json.dumps(body.get("messages", []))) // 4 + 1
+    completion_tokens = len(LLM_STUB_RESPONSE) // 4 + 1
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": LLM_STUB_RESPONSE},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def _store_file(content: str, filename: str, purpose: str) -> dict:
+    file = {
+        "id": f"file-{uuid.uuid4().hex}",
+        "object": "file",
+        "bytes": len(content),
+        "created_at": int(time.time()),
+        "filename": filename,
+        "purpose": purpose,
+        "status": "processed",
+    }
+    _files[file["id"]] = {"file": file, "content": content}
+    return file
+
+
+def _finish_batch(batch: dict):
+    outputs = []
+    for line in filter(None, _files[batch["input_file_id"]]["content"].splitlines()):
+        request = json.loads(line)
+        outputs.append(
+            json.dumps(
+                {
+                    "id": f"batch_req_{uuid.uuid4().hex}",
+                    "custom_id": request["custom_id"],
+                    "response": {
+                        "status_code": 200,
+                        "request_id": uuid.uuid4().hex,
+                        "body": _completion(request["body"]),
+                    },
+                    "error": None,
+                }
+            )
+        )
+    output = _store_file(
+        "\n".join(outputs), f"{batch['id']}_output.jsonl", "batch_output"
+    )
+    batch.update(
+        status="completed",
+        output_file_id=output["id"],
+        completed_at=int(time.time()),
+        request_counts={"total": len(outputs), "completed": len(outputs), "failed": 0},
+    )
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(body: dict):
+    return _completion(body)
+
+
+@app.post("/v1/files")
+async def upload_file(file: UploadFile = File(...), purpose: str = Form(...)):
+    content = (await file.read()).decode()
+    return _store_file(content, file.filename, purpose)
+
+
+@app.get("/v1/files/{file_id}/content", response_class=PlainTextResponse)
+async def file_content(file_id: str):
+    if file_id not in _files:
+        raise HTTPException(status_code=404, detail=f"No such file: {file_id}")
+    return _files[file_id]["content"]
+
+
+@app.post("/v1/batches")
+async def create_batch(body: dict):
+    if body.get("input_file_id") not in _files:
+        raise HTTPException(status_code=400, detail="Unknown input_file_id")
+    now = int(time.time())
+    total = len(_files[body["input_file_id"]]["content"].splitlines())
+    batch = {
+        "id": f"batch_{uuid.uuid4().hex}",
+        "object": "batch",
+        "endpoint": body["endpoint"],
+        "errors": None,
+        "input_file_id": body["input_file_id"],
+        "completion_window": body["completion_window"],
+        "status": "in_progress",
+        "output_file_id": None,
+        "error_file_id": None,
+        "created_at": now,
+        "in_progress_at": now,
+        "expires_at": now + 24 * 3600,
+        "completed_at": None,
+        "request_counts": {"total": total, "completed": 0, "failed": 0},
+        "metadata": body.get("metadata"),
+    }
+    _batches[batch["id"]] = batch
+    return batch
+
+
+@app.get("/v1/batches/{batch_id}")
+async def retrieve_batch(batch_id: str):
+    batch = _batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"No such batch: {batch_id}")
+    if (
+        batch["status"] == "in_progress"
+        and time.time() - batch["created_at"] >= LLM_STUB_BATCH_SECONDS
+    ):
+        _finish_batch(batch)
+    return batch
@@ -5,14 +5,21 @@ import os
 
 import fastapi
 from fastapi.middleware.cors import CORSMiddleware
+from jobs.assets.admission import admission_state
+from jobs.assets.base import AssetProcessor
 from routers.assets import assets_router
 from routers.chat import chat_router
 from routers.concepts import concepts_router
+from routers.events import events_router
 from routers.files import files_router
 from routers.operations import operations_router
 from routers.relationships import relationships_router
+from services.database import close_db, connect_db, get_async_db, get_db, get_pool_stats
+from services.migrations import run_migrations
+from services.token_usage import USAGE_DIMENSIONS, token_usage_report
 from utils.langfuse_utils import configure_langfuse
 from utils.logging_utils import configure_logging
+from utils.metrics_utils import get_metrics
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +32,14 @@ async def startup_event():
     initial_level = os.getenv("LOG_LEVEL", "INFO")
     result = configure_logging(initial_level)
     logger.info(result)
+    connect_db()
+    schema_version = run_migrations(get_db())
+    logger.info(f"Database schema at version {schema_version}")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    close_db()
 
 
 app.add_middleware(
@@ -41,9 +56,66 @@ def read_root():
     return {"message": "Hello World"}
 
 
+@app.get("/health/db")
+def db_health():
+    """Connection pool statistics for this replica's MongoDB client"""
+    return get_pool_stats()
+
+
+@app.get("/metrics")
+def metrics():
+    """Counters shared by all API replicas and workers"""
+    return get_metrics()
+
+
+@app.get("/metrics/queues")
+def queue_metrics():
+    """Depth and wait times of the per-stage pipeline queues"""
+    waits = get_metrics()
+    stats = AssetProcessor.queue_stats()
+    for stage, queue in stats.items():
+        wait = waits.get(f"queue_wait:{stage}", {})
+        queue["jobs_started"] = wait.get("jobs", 0)
+        queue["average_wait_seconds"] = (
+            wait["wait_ms"] / wait["jobs"] / 1000 if wait.get("jobs") else None
+        )
+    return stats
+
+
+@app.get("/metrics/admission")
+def admission_metrics():
+    """Upload admission thresholds and the load they are checked against"""
+    return {**admission_state(), "decisions": get_metrics().get("admission", {})}
+
+
+@app.get("/metrics/tokens")
+async def token_metrics(
+    group_by: str = "processor",
+    processor: str | None = None,
+    run_id: str | None = None,
+    file_hash: str | None = None,
+):
+    """LLM calls and input/output tokens, grouped by a comma-separated list of
+    processor, run_id, file_hash and model"""
+    fields = [field.strip() for field in group_by.split(",") if field.strip()]
+    unknown = set(fields) - set(USAGE_DIMENSIONS)
+    if unknown:
+        raise fastapi.HTTPException(
+            status_code=400, detail=f"Cannot group by: {', '.join(sorted(unknown))}"
+        )
+    return await token_usage_report(
+        await get_async_db(),
+        fields,
+        processor=processor,
+        run_id=run_id,
+        file_hash=file_hash,
+    )
+
+
 app.include_router(assets_router)
 app.include_router(chat_router)
 app.include_router(concepts_router)
+app.include_router(events_router)
 app.include_router(files_router)
 app.include_router(operations_router)
 app.include_router(relationships_router)
@@ -0,0 +1,23 @@
+# api/models/assets.py
+
+from typing import Literal
+
+from pydantic import BaseModel
+
+
+class RerunRequest(BaseModel):
+    file_hashes: list[str]
+    from_stage: str
+    # "batch" sends the re-run's LLM calls through the provider's batch API
+    llm_mode: Literal["interactive", "batch"] | None = None
+
+
+class RerunRun(BaseModel):
+    run_id: str
+    job_ids: dict[str, str]
+
+
+class RerunResponse(BaseModel):
+    from_stage: str
+    stages: list[str]
+    runs: dict[str, RerunRun]
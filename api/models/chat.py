@@ -1,19 +1,19 @@
 # api/models/chat.py
-from typing import Dict, List, Optional
 
 from pydantic import BaseModel
 
 
 class ChatRequest(BaseModel):
-    query: Optional[str] = None
-    messages: Optional[List[Dict[str, str]]] = None
+    query: str | None = None
+    messages: list[dict[str, str]] | None = None
     expect_json: bool = False
-    session_id: Optional[str] = None
-    user_id: Optional[str] = None
+    use_cache: bool = True
+    session_id: str | None = None
+    user_id: str | None = None
 
 
 class ChatResponse(BaseModel):
     message: str
-    result_json: Optional[Dict] = None
-    error: Optional[str] = None
-    raw_content: Optional[str] = None
+    result_json: dict | None = None
+    error: str | None = None
+    raw_content: str | None = None
@@ -1,6 +1,5 @@
 # api/models/files.py
 
-from typing import Dict, List, Optional
 
 from pydantic import BaseModel
 
@@ -13,37 +12,38 @@ class TablePaths(BaseModel):
 class TableMetadataResponse(BaseModel):
     num_rows: int
     num_cols: int
-    headers: List[str]
+    headers: list[str]
     empty_cells: int
     total_cells: int
 
 
 class ProcessedPaths(BaseModel):
     markdown: str = ""
-    images: Dict[str, str] = {}
-    tables: Dict[str, TablePaths] = {}
+    images: dict[str, str] = {}
+    tables: dict[str, TablePaths] = {}
     meta: str = ""
-    metadata: Optional[str] = ""
+    metadata: str | None = ""
 
 
 class FileResponse(BaseModel):
     id: str
+    file_hash: str | None = None
     name: str
     size: int
     type: str
     status: str
     upload_date: str
-    processed_date: Optional[str] = None
-    error: Optional[str] = None
-    processed_paths: Optional[ProcessedPaths] = None
+    processed_date: str | None = None
+    error: str | None = None
+    processed_paths: ProcessedPaths | None = None
     has_images: bool = False
     image_count: int = 0
     has_tables: bool = False
     table_count: int = 0
-    metadata: Optional[dict] = None
-    file_path: Optional[str] = None
+    metadata: dict | None = None
+    file_path: str | None = None
 
 
 class FileDetailResponse(FileResponse):
-    preview: Optional[str] = None
-    processing_details: Optional[dict] = None
+    preview: str | None = None
+    processing_details: dict | None = None
@@ -1,72 +1,156 @@
 import json
+import logging
+import os
 from datetime import datetime
 
 from processors.base import BaseAssetProcessor
+from pymongo import UpdateOne
 from routers.chat import chat_call
+from services.asset_results import get_asset_result
+from utils.token_utils import chunk_for_context
+
+logger = logging.getLogger(__name__)
+
+CITATIONS_BATCH_SIZE = int(os.getenv("CITATIONS_BATCH_SIZE", "50"))
 
 
 class ProcessCitations(BaseAssetProcessor):
     def __init__(self):
         super().__init__("citations", "citations")
         self.required_paths = ["markdown", "metadata"]
+        self.prompt_paths = ["citation/extraction.txt", "citation/verification.txt"]
+        self.supports_llm_batch = True
 
     async def process_asset(self, file_hash: str, asset: dict, db: dict, span):
         citations_collection = db["citations"]
 
-        lexemes = asset.get("lexemes", [])
+        lexemes = await get_asset_result(db, file_hash, "lexemes", [])
         with open(asset["processed_paths"]["markdown"], "r") as f:
             processed_content = f.read()
         with open(asset["processed_paths"]["metadata"], "r") as f:
             metadata = json.load(f)
 
+        # Documents too long for one request are searched part by part
+        chunks = self._content_chunks(processed_content, metadata)
+
+        checkpoints = self.checkpoints(db, file_hash, asset)
+        checkpointed = await checkpoints.load()
+
         citations_results = {}
-        for lexeme in lexemes:
-            citations = self._extract_and_validate_citations(
-                lexeme["term"], processed_content, metadata, file_hash, span
-            )
+        # Keyed by lexeme so a repeated term keeps its last result, as the
+        # serial upserts did; flushed in unordered batches as it fills up.
+        pending = {}
+        try:
+            for done, lexeme in enumerate(lexemes, start=1):
+                citations = checkpointed.get(lexeme["term"])
+                if citations is None:
+                    citations = await self._extract_and_validate_citations(
+                        lexeme["term"], chunks, metadata, file_hash, span
+                    )
+                    await checkpoints.save(lexeme["term"], citations)
 
-            if citations["valid_citations"]:
-                citations_collection.update_one(
-                    {"lexeme": lexeme["term"]},
-                    {
-                        "$set": {
-                            "lexeme": lexeme["term"],
-                            f"citations.{file_hash}": citations["valid_citations"],
-                            "last_updated": datetime.now(),
+                if citations["valid_citations"]:
+                    pending[lexeme["term"]] = UpdateOne(
+                        {"lexeme": lexeme["term"]},
+                        {
+                            "$set": {
+                                "lexeme": lexeme["term"],
+                                f"citations.{file_hash}": citations["valid_citations"],
+                                "last_updated": datetime.now(),
+                            },
+                            "$addToSet": {"documents": file_hash},
                         },
-                        "$addToSet": {"documents": file_hash},
-                    },
-                    upsert=True,
-                )
+                        upsert=True,
+                    )
 
-                citations_results[lexeme["term"]] = {
-                    "valid_count": len(citations["valid_citations"]),
-                    "issues_count": len(citations["issues"]),
-                }
+                    citations_results[lexeme["term"]] = {
+                        "valid_count": len(citations["valid_citations"]),
+                        "issues_count": len(citations["issues"]),
+                    }
 
-            if citations["issues"]:
-                span.event(
-                    name="citation_issues",
-                    metadata={"lexeme": lexeme["term"], "issues": citations["issues"]},
-                )
+                if citations["issues"]:
+                    span.event(
+                        name="citation_issues",
+                        metadata={
+                            "lexeme": lexeme["term"],
+                            "issues": citations["issues"],
+                        },
+                    )
 
+                if len(pending) >= CITATIONS_BATCH_SIZE:
+                    await self._write_citations(citations_collection, pending)
+                await self.report_progress(file_hash, asset, done, len(lexemes))
+        finally:
+            # Keep whatever was extracted before a failure
+            await self._write_citations(citations_collection, pending)
+
+        await checkpoints.clear()
         return {"status": "success", "citations": citations_results}
 
-    def _extract_and_validate_citations(
-        self, lexeme, content, metadata, file_hash, span
-    ):
-        extraction_data = {
-            "lexeme": lexeme,
-            "metadata": metadata,
-            "documents": {"processed": content, "original": None, "metadata": metadata},
+    async def _write_citations(self, citations_collection, pending: dict):
+        """Write buffered citation upserts in one unordered bulk_write"""
+        if not pending:
+            return
+        operations = list(pending.values())
+        pending.clear()
+        await citations_collection.bulk_write(operations, ordered=False)
+        logger.debug(f"Wrote citations for {len(operations)} lexemes")
+
+    async def snapshot_outputs(self, file_hash: str, db) -> dict:
+        """This document's citations, keyed by lexeme"""
+        snapshot = await super().snapshot_outputs(file_hash, db)
+        snapshot["citations"] = {}
+        async for doc in db["citations"].find(
+            {"documents": file_hash}, {"lexeme": 1, f"citations.{file_hash}": 1}
+        ):
+            snapshot["citations"][doc["lexeme"]] = doc["citations"][file_hash]
+        return snapshot
+
+    async def restore_outputs(self, file_hash: str, db, snapshot: dict):
+        await super().restore_outputs(file_hash, db, snapshot)
+        pending = {
+            lexeme: UpdateOne(
+                {"lexeme": lexeme},
+                {
+                    "$set": {
+                        "lexeme": lexeme,
+                        f"citations.{file_hash}": citations,
+                        "last_updated": datetime.now(),
+                    },
+                    "$addToSet": {"documents": file_hash},
+                },
+                upsert=True,
+            )
+            for lexeme, citations in snapshot.get("citations", {}).items()
         }
+        await self._write_citations(db["citations"], pending)
 
+    async def _extract_and_validate_citations(
+        self, lexeme, chunks, metadata, file_hash, span
+    ):
         extraction_generation = span.generation(
             name="citation_extraction", metadata={"lexeme": lexeme}
         )
 
-        extraction_response = self._get_citations(extraction_data)
-        extraction_generation.end(output=extraction_response)
+        # Each citation is validated against the part it was found in
+        found = []
+        for chunk in chunks:
+            extraction_data = {
+                "lexeme": lexeme,
+                "metadata": metadata,
+                "documents": {
+                    "processed": chunk,
+                    "original": None,
+                    "metadata": metadata,
+                },
+            }
+            extraction_response = await self._get_citations(extraction_data)
+            found.extend(
+                (citation, chunk) for citation in extraction_response["citations"]
+            )
+        extraction_generation.end(
+            output={"citations": [citation for citation, _ in found]}
+        )
 
         valid_citations = []
         validation_issues = []
@@ -75,8 +159,8 @@ class ProcessCitations(BaseAssetProcessor):
             name="citation_validation", metadata={"lexeme": lexeme}
         )
 
-        for citation in extraction_response["citations"]:
-            validation = self._validate_citation(citation, content, metadata)
+        for citation, chunk in found:
+            validation = await self._validate_citation(citation, chunk, metadata)
 
             if validation["verified"]:
                 if validation["recommendations"].get("correctedQuote"):
@@ -102,10 +186,27 @@ class ProcessCitations(BaseAssetProcessor):
 
         return {"valid_citations": valid_citations, "issues": validation_issues}
 
-    def _get_citations(self, data):
+    def _content_chunks(self, content, metadata):
+        """Parts of the document that fit either citation prompt's request"""
+        framings = [
+            self.read_prompt_template(prompt_path)
+            + "\n\nInput:\n"
+            + json.dumps(
+                {
+                    "lexeme": "",
+                    "metadata": metadata,
+                    "citation": {"quote": "", "location": ""},
+                    "documents": {"original": None, "metadata": metadata},
+                }
+            )
+            for prompt_path in self.prompt_paths
+        ]
+        return chunk_for_context(content, max(framings, key=len))
+
+    async def _get_citations(self, data):
         prompt = self.read_prompt_template("citation/extraction.txt")
         try:
-            response = chat_call(
+            response = await chat_call(
                 query=prompt + "\n\nInput:\n" + json.dumps(data), expect_json=True
             )
 
@@ -120,17 +221,17 @@ class ProcessCitations(BaseAssetProcessor):
             else:
                 return {"citations": []}  # Invalid response format
         except Exception as e:
-            print(f"Error in citation extraction: {str(e)}")
+            print(f"Error in citation extraction: {e!s}")
             return {"citations": []}  # Return empty citations on error
 
-    def _validate_citation(self, citation, content, metadata):
+    async def _validate_citation(self, citation, content, metadata):
         validation_data = {
             "citation": {"quote": citation["quote"], "location": citation["location"]},
             "documents": {"processed": content, "original": None, "metadata": metadata},
         }
         prompt = self.read_prompt_template("citation/verification.txt")
         try:
-            response = chat_call(
+            response = await chat_call(
                 query=prompt + "\n\nInput:\n" + json.dumps(validation_data),
                 expect_json=True,
             )
@@ -153,9 +254,9 @@ class ProcessCitations(BaseAssetProcessor):
                 "recommendations": validation.get("recommendations", {}),
             }
         except Exception as e:
-            print(f"Error in citation validation: {str(e)}")
+            print(f"Error in citation validation: {e!s}")
             return {
                 "verified": False,
-                "status": f"Validation Error: {str(e)}",
+                "status": f"Validation Error: {e!s}",
                 "recommendations": {},
             }
@@ -1,76 +1,145 @@
 import json
+import logging
 from datetime import datetime
 
 from processors.base import BaseAssetProcessor
 from routers.chat import chat_call
+from services.asset_results import get_asset_result, save_asset_result
+from services.collection_versions import bump_collection_version
+from services.llm_batches import BATCH_PENDING, batch_calls_pending
+from services.stage_results import hash_value
+
+logger = logging.getLogger(__name__)
 
 
 class ProcessDefinitions(BaseAssetProcessor):
     def __init__(self):
         super().__init__("definitions", "definitions")
         self.required_paths = ["markdown", "metadata"]
+        self.prompt_paths = ["concept/definition.txt"]
+        self.result_kinds = ["definitions"]
+        self.supports_llm_batch = True
 
     async def process_asset(self, file_hash: str, asset: dict, db: dict, span):
-        existing_citations = self._get_existing_citations(
-            db, asset.get("citations", {})
-        )
+        existing_citations = await self._get_existing_citations(db, file_hash)
+        metadata = await get_asset_result(db, file_hash, "metadata", {})
+
+        checkpoints = self.checkpoints(db, file_hash, asset)
+        checkpointed = await checkpoints.load()
 
         definitions = {}
         concepts_collection = db["concepts"]
 
-        for lexeme, citations_by_doc in existing_citations.items():
-            all_citations = [
-                c for doc_citations in citations_by_doc.values() for c in doc_citations
-            ]
-
-            input_data = {
-                "lexeme": lexeme,
-                "citations": all_citations,
-                "domainContext": asset.get("metadata", {})
-                .get("documentMetadata", {})
-                .get("domain", ""),
-            }
-
-            definition_response = self._generate_definition(input_data)
-            definitions[lexeme] = definition_response
-
-            concept_data = {
-                "name": lexeme,
-                "definition": definition_response["definition"]["primaryStatement"],
-                "citations": [c["quote"] for c in all_citations],
-                "synonyms": [],
-                "understanding_level": "Practical",
-                "created_at": datetime.now().strftime("%Y-%m-%d"),
-            }
-
-            concepts_collection.update_one(
-                {"name": lexeme}, {"$set": concept_data}, upsert=True
-            )
-
-        db["raw_assets"].update_one(
-            {"file_hash": file_hash}, {"$set": {"definitions": definitions}}
-        )
+        total = len(existing_citations)
+        upserted = False
+        try:
+            for done, (lexeme, citations_by_doc) in enumerate(
+                existing_citations.items(), start=1
+            ):
+                all_citations = [
+                    c
+                    for doc_citations in citations_by_doc.values()
+                    for c in doc_citations
+                ]
+
+                input_data = {
+                    "lexeme": lexeme,
+                    "citations": all_citations,
+                    "domainContext": metadata.get("documentMetadata", {}).get(
+                        "domain", ""
+                    ),
+                }
+
+                definition = checkpointed.get(lexeme)
+                if definition is None:
+                    response = await self._generate_definition(input_data)
+                    if response.get("batch_pending"):
+                        # Written once the stage resumes with the batch's answer
+                        continue
+                    if "error" in response:
+                        # Left uncheckpointed, so a re-run asks for it again
+                        logger.error(
+                            f"Chat API error for {lexeme}: {response['error']}"
+                        )
+                        continue
+                    definition = response["json"]
+                    await checkpoints.save(lexeme, definition)
+                definitions[lexeme] = definition
+
+                concept_data = {
+                    "name": lexeme,
+                    "definition": definition["definition"]["primaryStatement"],
+                    "citations": [c["quote"] for c in all_citations],
+                    "synonyms": [],
+                    "understanding_level": "Practical",
+                    "created_at": datetime.now().strftime("%Y-%m-%d"),
+                }
+
+                await concepts_collection.update_one(
+                    {"name": lexeme}, {"$set": concept_data}, upsert=True
+                )
+                upserted = True
+                await self.report_progress(file_hash, asset, done, total)
+        finally:
+            # Also on failure or a pending batch: /concepts must not 304 over
+            # concepts already written
+            if upserted:
+                await bump_collection_version("concepts")
+
+        if batch_calls_pending():
+            # Partial: the stage runs again once the batch is answered and
+            # writes its result then, so keep the checkpoints until that run
+            return {"status": BATCH_PENDING, "definition_count": len(definitions)}
+
+        await save_asset_result(db, file_hash, "definitions", definitions)
+        await checkpoints.clear()
 
         return {"status": "success", "definition_count": len(definitions)}
 
-    def _get_existing_citations(self, db, current_citations):
+    async def stage_inputs(self, file_hash: str, asset: dict, db) -> dict:
+        """Definitions also draw on other documents' citations of the same lexemes"""
+        inputs = await super().stage_inputs(file_hash, asset, db)
+        inputs["citations_hash"] = hash_value(
+            await self._get_existing_citations(db, file_hash)
+        )
+        return inputs
+
+    async def snapshot_outputs(self, file_hash: str, db) -> dict:
+        snapshot = await super().snapshot_outputs(file_hash, db)
+        names = list(snapshot["results"].get("definitions") or {})
+        snapshot["concepts"] = [
+            concept
+            async for concept in db["concepts"].find(
+                {"name": {"$in": names}}, {"_id": 0}
+            )
+        ]
+        return snapshot
+
+    async def restore_outputs(self, file_hash: str, db, snapshot: dict):
+        await super().restore_outputs(file_hash, db, snapshot)
+        for concept in snapshot.get("concepts", []):
+            await db["concepts"].update_one(
+                {"name": concept["name"]}, {"$set": concept}, upsert=True
+            )
+        if snapshot.get("concepts"):
+            await bump_collection_version("concepts")
+
+    async def _get_existing_citations(self, db, file_hash):
+        """Citations from every document for the lexemes cited in this one"""
         citations_by_lexeme = {}
 
-        docs_with_citations = db["raw_assets"].find(
-            {"citations": {"$exists": True}}, {"file_hash": 1, "citations": 1}
+        docs_with_citations = db["citations"].find(
+            {"documents": file_hash}, {"lexeme": 1, "citations": 1}
         )
 
-        for doc in docs_with_citations:
-            for lexeme, citations in doc["citations"].items():
-                if lexeme not in citations_by_lexeme:
-                    citations_by_lexeme[lexeme] = {}
-                citations_by_lexeme[lexeme][doc["file_hash"]] = citations
+        async for doc in docs_with_citations:
+            citations_by_lexeme[doc["lexeme"]] = doc.get("citations", {})
 
         return citations_by_lexeme
 
-    def _generate_definition(self, data):
+    async def _generate_definition(self, data):
         prompt = self.read_prompt_template("concept/definition.txt")
-        response = chat_call(
+        response = await chat_call(
             query=prompt + "\n\nInput:\n" + json.dumps(data), expect_json=True
         )
         return response
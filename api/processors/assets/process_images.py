@@ -2,7 +2,7 @@ import hashlib
 import logging
 import os
 import zipfile
-from typing import Any, Dict
+from typing import Any
 
 from processors.base import BaseAssetProcessor
 
@@ -12,12 +12,16 @@ logger = logging.getLogger(__name__)
 class ProcessImages(BaseAssetProcessor):
     def __init__(self):
         super().__init__(
-            processor_name="images", processor_type="images", requires_docx=True
+            processor_name="images",
+            processor_type="images",
+            requires_docx=True,
+            output_fields=["has_images", "image_count", "processed_paths.images"],
+            uses_model=False,
         )
 
     async def process_asset(
-        self, file_hash: str, asset: Dict[str, Any], db: Any, span: Any
-    ) -> Dict[str, Any]:
+        self, file_hash: str, asset: dict[str, Any], db: Any, span: Any
+    ) -> dict[str, Any]:
         processed_dir = self.get_processed_dir(file_hash)
         images_dir = os.path.join(processed_dir, "images")
         os.makedirs(images_dir, exist_ok=True)
@@ -52,7 +56,9 @@ class ProcessImages(BaseAssetProcessor):
             "image_count": len(image_paths),
             "processed_paths.images": image_paths,
         }
-        db["raw_assets"].update_one({"file_hash": file_hash}, {"$set": update_data})
+        await db["raw_assets"].update_one(
+            {"file_hash": file_hash}, {"$set": update_data}
+        )
 
         return {
             "status": "success",
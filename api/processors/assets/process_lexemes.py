@@ -5,7 +5,9 @@ import re
 from fastapi import HTTPException
 from processors.base import BaseAssetProcessor
 from routers.chat import chat_call
+from services.asset_results import get_asset_result, save_asset_result
 from utils.lexeme_utils import get_prompts_for_category, merge_lexeme_results
+from utils.token_utils import chunk_for_context
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +16,10 @@ class ProcessLexemes(BaseAssetProcessor):
     def __init__(self):
         super().__init__("lexemes", "lexemes")
         self.required_paths = ["markdown", "metadata"]
+        self.prompt_paths = ["lexeme"]
+        self.output_fields = ["lexeme_count", "processing_errors"]
+        self.result_kinds = ["lexemes"]
+        self.supports_llm_batch = True
 
     def _parse_chat_response(self, response, prompt_file):
         """Helper method to safely parse chat API response"""
@@ -62,9 +68,9 @@ class ProcessLexemes(BaseAssetProcessor):
             with open(asset["processed_paths"]["markdown"], "r") as f:
                 content = f.read()
 
+            metadata = await get_asset_result(db, file_hash, "metadata", {})
             category = (
-                asset.get("metadata", {})
-                .get("documentMetadata", {})
+                metadata.get("documentMetadata", {})
                 .get("primaryType", {})
                 .get("category", "General/Mixed")
             )
@@ -76,47 +82,60 @@ class ProcessLexemes(BaseAssetProcessor):
 
             for prompt_file in prompts_to_run:
                 try:
-                    prompt = (
+                    template = (
                         self.read_prompt_template(prompt_file, is_lexeme=True)
                         + "\n\nDocument Content:\n"
-                        + content
                     )
+                    # Documents too long for one request are read in parts
+                    chunks = chunk_for_context(content, template)
+                except Exception as e:
+                    error_msg = f"Error preparing {prompt_file}: {e!s}"
+                    logger.error(error_msg)
+                    errors.append(error_msg)
+                    continue
 
-                    generation = span.generation(
-                        name=f"lexeme_generation_{prompt_file}",
-                        input={"prompt_file": prompt_file},
+                for index, chunk in enumerate(chunks):
+                    label = (
+                        f"{prompt_file} part {index + 1}/{len(chunks)}"
+                        if len(chunks) > 1
+                        else prompt_file
                     )
+                    try:
+                        generation = span.generation(
+                            name=f"lexeme_generation_{prompt_file}",
+                            input={"prompt_file": prompt_file, "chunk": index},
+                        )
 
-                    response = chat_call(query=prompt, expect_json=True)
-                    generation.end(output={"status": "completed"})
-
-                    if "error" in response:
-                        error_msg = (
-                            f"Chat API error for {prompt_file}: {response['error']}"
+                        response = await chat_call(
+                            query=template + chunk, expect_json=True
                         )
+                        generation.end(output={"status": "completed"})
+
+                        if "error" in response:
+                            error_msg = (
+                                f"Chat API error for {label}: {response['error']}"
+                            )
+                            logger.error(error_msg)
+                            errors.append(error_msg)
+                            continue
+
+                        parsed_data = self._parse_chat_response(response, label)
+                        prompt_lexemes = parsed_data.get("lexemes", [])
+
+                        if prompt_lexemes:
+                            all_lexemes.extend(prompt_lexemes)
+                            logger.info(
+                                f"Extracted {len(prompt_lexemes)} lexemes from {label}"
+                            )
+                        else:
+                            logger.warning(f"No lexemes found in response for {label}")
+
+                    except Exception as e:
+                        error_msg = f"Error processing {label}: {e!s}"
                         logger.error(error_msg)
                         errors.append(error_msg)
                         continue
 
-                    parsed_data = self._parse_chat_response(response, prompt_file)
-                    prompt_lexemes = parsed_data.get("lexemes", [])
-
-                    if prompt_lexemes:
-                        all_lexemes.extend(prompt_lexemes)
-                        logger.info(
-                            f"Extracted {len(prompt_lexemes)} lexemes from {prompt_file}"
-                        )
-                    else:
-                        logger.warning(
-                            f"No lexemes found in response for {prompt_file}"
-                        )
-
-                except Exception as e:
-                    error_msg = f"Error processing {prompt_file}: {str(e)}"
-                    logger.error(error_msg)
-                    errors.append(error_msg)
-                    continue
-
             if not all_lexemes:
                 error_details = "; ".join(errors) if errors else "No lexemes found"
                 raise HTTPException(
@@ -126,13 +145,16 @@ class ProcessLexemes(BaseAssetProcessor):
 
             merged_lexemes = merge_lexeme_results(all_lexemes)
 
+            await save_asset_result(db, file_hash, "lexemes", merged_lexemes)
+
             update_data = {
-                "lexemes": merged_lexemes,
                 "lexeme_count": len(merged_lexemes),
                 "processing_errors": errors if errors else None,
             }
 
-            db["raw_assets"].update_one({"file_hash": file_hash}, {"$set": update_data})
+            await db["raw_assets"].update_one(
+                {"file_hash": file_hash}, {"$set": update_data}
+            )
 
             return {
                 "status": "success",
@@ -141,5 +163,5 @@ class ProcessLexemes(BaseAssetProcessor):
             }
 
         except Exception as e:
-            logger.error(f"Lexeme processing failed: {str(e)}")
+            logger.error(f"Lexeme processing failed: {e!s}")
             raise HTTPException(status_code=500, detail=str(e))
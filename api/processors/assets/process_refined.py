@@ -3,14 +3,10 @@ import json
 import logging
 import os
 import time
-from typing import Dict
 
 import requests
-from fastapi import HTTPException
 from processors.base import BaseAssetProcessor
 from routers.chat import multimodal_chat_call
-from utils import handle_error
-from utils.db_utils import update_asset_status
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +14,17 @@ logger = logging.getLogger(__name__)
 class ProcessRefined(BaseAssetProcessor):
     def __init__(self):
         super().__init__("refined", "refined")
+        self.output_fields = [
+            "processed_paths.markdown",
+            "processed_paths.meta",
+            "page_count",
+            "processed_paths.images",
+            "has_images",
+            "image_count",
+            "processed_paths.tables",
+            "has_tables",
+            "table_count",
+        ]
 
     async def process_asset(self, file_hash: str, asset: dict, db: dict, span):
         file_path = os.path.join(
@@ -77,16 +84,18 @@ class ProcessRefined(BaseAssetProcessor):
                 update_data["has_tables"] = True
                 update_data["table_count"] = len(table_paths)
 
-            db["raw_assets"].update_one({"file_hash": file_hash}, {"$set": update_data})
+            await db["raw_assets"].update_one(
+                {"file_hash": file_hash}, {"$set": update_data}
+            )
 
             return result
 
         except Exception as e:
-            error_msg = f"Error in refined processing: {str(e)}"
-            handle_error(span, file_hash, error_msg, logger, update_asset_status)
-            raise HTTPException(status_code=500, detail=error_msg)
+            # run() records the refined_error status once; only mark the span here
+            span.event(name="refinement_error", metadata={"error": str(e)})
+            raise
 
-    async def _process_pdf(self, file_path: str, asset: dict, file_hash: str) -> Dict:
+    async def _process_pdf(self, file_path: str, asset: dict, file_hash: str) -> dict:
         """Process a PDF file using multiple Marker API endpoints"""
         # First get the main content and images using marker endpoint
         marker_result = await self._process_with_marker_api(
@@ -110,7 +119,7 @@ class ProcessRefined(BaseAssetProcessor):
 
         return combined_result
 
-    async def _process_image(self, file_path: str) -> Dict:
+    async def _process_image(self, file_path: str) -> dict:
         """Process an image file using the chat/with-image endpoint"""
         prompt = """
         Please analyze this image and convert it into well-formatted markdown. If you see:
@@ -126,7 +135,7 @@ class ProcessRefined(BaseAssetProcessor):
 
         Please return EXACTLY the markdown output only with no formatting, no backticks wrapping the output.
         """
-        response = multimodal_chat_call(file_path, prompt)
+        response = await multimodal_chat_call(file_path, prompt)
         message_text = response["message"]
         response_data = {
             "markdown": message_text,
@@ -141,8 +150,8 @@ class ProcessRefined(BaseAssetProcessor):
         return response_data
 
     async def _process_with_marker_api(
-        self, file_path: str, asset: dict, headers: Dict
-    ) -> Dict:
+        self, file_path: str, asset: dict, headers: dict
+    ) -> dict:
         """Process a document using the Marker API"""
         base_url = "https://www.datalab.to/api/v1/marker"
 
@@ -153,7 +162,9 @@ class ProcessRefined(BaseAssetProcessor):
                 "force_ocr": (None, False),
                 "paginate": (None, False),
             }
-            response = requests.post(base_url, files=files, headers=headers)
+            response = await asyncio.to_thread(
+                requests.post, base_url, files=files, headers=headers
+            )
 
         if not response.ok:
             raise Exception(f"Marker API request failed: {response.text}")
@@ -166,8 +177,10 @@ class ProcessRefined(BaseAssetProcessor):
         poll_interval = 2
 
         for attempt in range(max_polls):
-            time.sleep(poll_interval)
-            response = requests.get(request_check_url, headers=headers)
+            await asyncio.sleep(poll_interval)
+            response = await asyncio.to_thread(
+                requests.get, request_check_url, headers=headers
+            )
             data = response.json()
 
             if data["status"] == "complete":
@@ -198,7 +211,7 @@ class ProcessRefined(BaseAssetProcessor):
             image_paths[name] = path
         return image_paths
 
-    async def _process_tables(self, file_path: str, max_wait: int = 600) -> Dict:
+    async def _process_tables(self, file_path: str, max_wait: int = 600) -> dict:
         """Process PDF tables using table recognition API with exponential backoff"""
         base_url = "https://www.datalab.to/api/v1/tablerec"
         headers = {"X-Api-Key": os.getenv("MARKER_API_KEY")}
@@ -215,7 +228,9 @@ class ProcessRefined(BaseAssetProcessor):
             try:
                 with open(file_path, "rb") as f:
                     files = {"file": f}
-                    response = requests.post(base_url, files=files, headers=headers)
+                    response = await asyncio.to_thread(
+                        requests.post, base_url, files=files, headers=headers
+                    )
 
                 if response.ok:
                     return response.json()
@@ -234,7 +249,7 @@ class ProcessRefined(BaseAssetProcessor):
                 wait = min(wait * 2, 60)
 
             except Exception as e:
-                logger.warning(f"Table recognition error: {str(e)}")
+                logger.warning(f"Table recognition error: {e!s}")
                 return {"pages": [], "error": str(e)}
 
         return {"pages": [], "error": f"Table recognition timed out after {max_wait}s"}
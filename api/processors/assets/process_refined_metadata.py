@@ -5,6 +5,8 @@ import os
 from fastapi import HTTPException
 from processors.base import BaseAssetProcessor
 from routers.chat import chat_call
+from services.asset_results import save_asset_result
+from utils.token_utils import chunk_for_context
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +15,9 @@ class ProcessRefinedMetadata(BaseAssetProcessor):
     def __init__(self):
         super().__init__("refined_metadata", "refined_metadata")
         self.required_paths = ["markdown"]
+        self.prompt_paths = ["metadata.txt"]
+        self.output_fields = ["processed_paths.metadata"]
+        self.result_kinds = ["metadata"]
 
     async def process_asset(self, file_hash: str, asset: dict, db: dict, span):
         try:
@@ -22,10 +27,19 @@ class ProcessRefinedMetadata(BaseAssetProcessor):
             with open(processed_paths["markdown"], "r") as f:
                 file_content = f.read()
 
-            prompt = prompt_template + "\n\nDocument Content:\n" + file_content
+            framing = prompt_template + "\n\nDocument Content:\n"
+            # Metadata comes from the front matter and opening sections, so a
+            # document too long for one request is described by its first part
+            chunks = chunk_for_context(file_content, framing)
+            if len(chunks) > 1:
+                logger.info(
+                    f"Generating metadata for {file_hash} from the first of "
+                    f"{len(chunks)} parts"
+                )
+            prompt = framing + chunks[0]
 
             generation = span.generation(name="metadata_generation", input=prompt)
-            response = chat_call(query=prompt, expect_json=True)
+            response = await chat_call(query=prompt, expect_json=True)
             generation.end(output=response)
 
             if "error" in response:
@@ -59,20 +73,30 @@ class ProcessRefinedMetadata(BaseAssetProcessor):
             with open(metadata_path, "w", encoding="utf-8") as f:
                 json.dump(metadata, f, ensure_ascii=False, indent=2)
 
-            update_data = {
-                "metadata": metadata,
-                "processed_paths.metadata": metadata_path,
-            }
-            db["raw_assets"].update_one({"file_hash": file_hash}, {"$set": update_data})
+            await save_asset_result(db, file_hash, "metadata", metadata)
+            await db["raw_assets"].update_one(
+                {"file_hash": file_hash},
+                {"$set": {"processed_paths.metadata": metadata_path}},
+            )
 
             return {"status": "success", "metadata": metadata}
 
         except json.JSONDecodeError as e:
-            logger.error(f"JSON parsing error: {str(e)}")
+            logger.error(f"JSON parsing error: {e!s}")
             logger.debug(f"Response content: {response.get('message', 'No message')}")
             raise HTTPException(
-                status_code=500, detail=f"Failed to parse metadata: {str(e)}"
+                status_code=500, detail=f"Failed to parse metadata: {e!s}"
             )
         except Exception as e:
-            logger.error(f"Metadata processing error: {str(e)}")
+            logger.error(f"Metadata processing error: {e!s}")
             raise HTTPException(status_code=500, detail=str(e))
+
+    async def restore_outputs(self, file_hash: str, db, snapshot: dict):
+        """Also rewrite metadata.json, which citations reads from disk"""
+        metadata = snapshot["results"].get("metadata")
+        metadata_path = snapshot["fields"].get("processed_paths.metadata")
+        if metadata is not None and metadata_path:
+            os.makedirs(os.path.dirname(metadata_path), exist_ok=True)
+            with open(metadata_path, "w", encoding="utf-8") as f:
+                json.dump(metadata, f, ensure_ascii=False, indent=2)
+        await super().restore_outputs(file_hash, db, snapshot)
@@ -4,6 +4,8 @@ import logging
 from fastapi import HTTPException
 from processors.base import BaseAssetProcessor
 from routers.chat import chat_call
+from services.asset_results import save_asset_result
+from utils.token_utils import chunk_for_context
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +14,9 @@ class ProcessRefinedSplitting(BaseAssetProcessor):
     def __init__(self):
         super().__init__("refined_splitting", "refined_splitting")
         self.required_paths = ["markdown"]
+        self.prompt_paths = ["splitting.txt"]
+        self.output_fields = ["segment_count", "should_split"]
+        self.result_kinds = ["splitting"]
 
     async def process_asset(self, file_hash: str, asset: dict, db: dict, span):
         MIN_CHARS_FOR_SPLIT = 24000  # ~6k tokens
@@ -35,21 +40,28 @@ class ProcessRefinedSplitting(BaseAssetProcessor):
                     "totalLength": {"value": content_length, "unit": "characters"}
                 },
             }
-            prompt = None
         else:
-            prompt = (
-                self.read_prompt_template("splitting")
-                + "\n\nDocument Content:\n"
-                + file_content
+            framing = (
+                self.read_prompt_template("splitting.txt") + "\n\nDocument Content:\n"
             )
-            generation = span.generation(name="splitting_analysis", input=prompt)
-            response = chat_call(query=prompt, expect_json=True)
-            generation.end(output=response)
-
-            if "error" in response:
-                raise HTTPException(status_code=500, detail=response["error"])
-
-            results = json.loads(response["message"])
+            results = None
+            # A document too long for one request is analysed part by part
+            for chunk in chunk_for_context(file_content, framing):
+                prompt = framing + chunk
+                generation = span.generation(name="splitting_analysis", input=prompt)
+                response = await chat_call(query=prompt, expect_json=True)
+                generation.end(output=response)
+
+                if "error" in response:
+                    raise HTTPException(status_code=500, detail=response["error"])
+
+                part = json.loads(response["message"])
+                if results is None:
+                    results = part
+                else:
+                    results["splitRecommendations"].setdefault(
+                        "recommendedSplits", []
+                    ).extend(part["splitRecommendations"].get("recommendedSplits", []))
 
         should_split = content_length > MIN_CHARS_FOR_SPLIT
         if should_split:
@@ -86,11 +98,14 @@ class ProcessRefinedSplitting(BaseAssetProcessor):
         else:
             splits = []
 
+        await save_asset_result(db, file_hash, "splitting", results)
+
         update_data = {
-            "splitting": results,
             "segment_count": len(splits),
             "should_split": should_split,
         }
-        db["raw_assets"].update_one({"file_hash": file_hash}, {"$set": update_data})
+        await db["raw_assets"].update_one(
+            {"file_hash": file_hash}, {"$set": update_data}
+        )
 
         return {"status": "success", "splitting": results}
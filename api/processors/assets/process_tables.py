@@ -1,7 +1,6 @@
 import json
 import logging
 import os
-from typing import Tuple
 
 from docx import Document
 from processors.base import BaseAssetProcessor
@@ -11,7 +10,13 @@ logger = logging.getLogger(__name__)
 
 class ProcessTables(BaseAssetProcessor):
     def __init__(self):
-        super().__init__("tables", "table", requires_docx=True)
+        super().__init__(
+            "tables",
+            "table",
+            requires_docx=True,
+            output_fields=["has_tables", "table_count", "processed_paths.tables"],
+            uses_model=False,
+        )
 
     async def process_asset(self, file_hash: str, asset: dict, db: dict, span):
         processed_dir = self.get_processed_dir(file_hash)
@@ -31,7 +36,7 @@ class ProcessTables(BaseAssetProcessor):
                 tables_meta[table_name] = table_meta
 
             except Exception as e:
-                logger.error(f"Error processing table {i}: {str(e)}")
+                logger.error(f"Error processing table {i}: {e!s}")
                 continue
 
         meta_path = os.path.join(tables_dir, "tables_meta.json")
@@ -43,7 +48,9 @@ class ProcessTables(BaseAssetProcessor):
             "table_count": len(tables_paths),
             "processed_paths.tables": tables_paths,
         }
-        db["raw_assets"].update_one({"file_hash": file_hash}, {"$set": update_data})
+        await db["raw_assets"].update_one(
+            {"file_hash": file_hash}, {"$set": update_data}
+        )
         return {
             "status": "success",
             "table_count": len(tables_paths),
@@ -51,7 +58,7 @@ class ProcessTables(BaseAssetProcessor):
             "tables_meta": tables_meta,
         }
 
-    def _process_table(self, i: int, table, tables_dir: str) -> Tuple[str, dict]:
+    def _process_table(self, i: int, table, tables_dir: str) -> tuple[str, dict]:
         table_name = f"table_{i}"
         table_data = []
 
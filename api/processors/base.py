@@ -1,14 +1,74 @@
+import asyncio
 import logging
 import os
-from typing import Any, Dict, Optional
+from typing import Any
 
+import bson
+from config.chat_config import current_model_name
 from fastapi import APIRouter, Header, HTTPException
+from jobs.assets.base import AssetProcessor, record_job_progress
 from langfuse import Langfuse
-from utils.db_utils import init_mongo, update_asset_status
+from services.asset_results import get_asset_result, save_asset_result
+from services.checkpoints import StageCheckpoints
+from services.database import get_async_db
+from services.llm_batches import (
+    BATCH_PENDING,
+    batch_calls_pending,
+    llm_batch_collection,
+    run_llm_mode,
+    submit_stage_batch,
+)
+from services.stage_results import (
+    find_stage_result,
+    hash_prompts,
+    save_stage_result,
+    stage_input_key,
+)
+from services.token_usage import llm_usage_context
+from utils.db_utils import (
+    status_recorder,
+    update_asset_status,
+    update_asset_status_async,
+)
 from utils.langfuse_utils import configure_langfuse
+from utils.metrics_utils import incr_metrics_async
 
 logger = logging.getLogger(__name__)
 
+# Fields every processor needs for skip checks, tracing and run bookkeeping
+BASE_ASSET_FIELDS = [
+    "file_hash",
+    "file_type",
+    "original_name",
+    "file_size",
+    "current_run_id",
+    "processed_paths",
+    "stage_outputs",
+]
+
+STAGE_RESULT_REUSE = os.getenv("STAGE_RESULT_REUSE", "true").lower() == "true"
+
+_MISSING = object()
+
+
+def _get_field(doc: dict, dotted: str):
+    for part in dotted.split("."):
+        if not isinstance(doc, dict) or part not in doc:
+            return _MISSING
+        doc = doc[part]
+    return doc
+
+
+def _filestore_paths_exist(value) -> bool:
+    """Whether every filestore path referenced in a stored output is still on disk"""
+    if isinstance(value, str):
+        return not value.startswith("/app/filestore/") or os.path.exists(value)
+    if isinstance(value, dict):
+        return all(_filestore_paths_exist(v) for v in value.values())
+    if isinstance(value, list):
+        return all(_filestore_paths_exist(v) for v in value)
+    return True
+
 
 class BaseAssetProcessor:
     def __init__(
@@ -16,12 +76,26 @@ class BaseAssetProcessor:
         processor_name: str,
         processor_type: str,
         requires_docx: bool = False,
-        required_paths: list[str] = None,
+        required_paths: list[str] | None = None,
+        asset_fields: list[str] | None = None,
+        prompt_paths: list[str] | None = None,
+        output_fields: list[str] | None = None,
+        result_kinds: list[str] | None = None,
+        uses_model: bool = True,
     ):
         self.processor_name = processor_name
         self.processor_type = processor_type
         self.requires_docx = requires_docx
         self.required_paths = required_paths or []
+        self.asset_fields = asset_fields or []
+        # What the stage's output depends on and consists of; used to reuse
+        # stored results when a run sees the same inputs again
+        self.prompt_paths = prompt_paths or []
+        self.output_fields = output_fields or []
+        self.result_kinds = result_kinds or []
+        # Whether the stage may defer its LLM calls to a provider batch
+        self.supports_llm_batch = False
+        self.uses_model = uses_model
         self.router = APIRouter()
 
         configure_langfuse()
@@ -34,19 +108,33 @@ class BaseAssetProcessor:
     async def process(
         self,
         file_hash: str,
-        x_span_id: Optional[str] = Header(None),
-        x_run_id: Optional[str] = Header(None),
-    ) -> Dict:
-        """Base process method that handles common functionality"""
+        x_span_id: str | None = Header(None),
+        x_run_id: str | None = Header(None),
+    ) -> dict:
+        """HTTP entry point, kept for manual triggering"""
+        return await self.run(file_hash, run_id=x_run_id, span_id=x_span_id)
+
+    async def run(
+        self,
+        file_hash: str,
+        run_id: str | None = None,
+        span_id: str | None = None,
+    ) -> dict:
+        """Run this stage for an asset with status tracking and a Langfuse span"""
         span = None
+        db = None
         try:
-            db = init_mongo()
-            if isinstance(db, dict) and "error" in db:
-                raise HTTPException(status_code=500, detail=db["error"])
+            db = await get_async_db()
 
-            asset = db["raw_assets"].find_one({"file_hash": file_hash})
+            asset = await db["raw_assets"].find_one(
+                {"file_hash": file_hash}, self.asset_projection()
+            )
             if not asset:
                 raise HTTPException(status_code=404, detail="Asset not found")
+            await incr_metrics_async(
+                f"asset_reads:{self.processor_name}",
+                {"reads": 1, "bytes": len(bson.encode(asset))},
+            )
 
             if (
                 self.requires_docx
@@ -56,7 +144,12 @@ class BaseAssetProcessor:
                 logger.info(
                     f"Asset {file_hash} is not a DOCX file, skipping {self.processor_name} processing"
                 )
-                update_asset_status(file_hash, f"{self.processor_name}_skipped")
+                await update_asset_status_async(
+                    db,
+                    file_hash,
+                    f"{self.processor_name}_skipped",
+                    run_id=run_id or asset.get("current_run_id"),
+                )
                 return {"status": "skipped", "reason": "not_docx"}
 
             processed_paths = asset.get("processed_paths", {})
@@ -68,9 +161,11 @@ class BaseAssetProcessor:
                     logger.error(error_msg)
                     raise HTTPException(status_code=400, detail=error_msg)
 
-            run_id = x_run_id or asset.get("current_run_id")
+            run_id = run_id or asset.get("current_run_id")
             if not run_id:
                 raise HTTPException(status_code=400, detail="No run_id found for asset")
+            # The run this stage executes for, which checkpoints are keyed by
+            asset["current_run_id"] = run_id
 
             trace = self.langfuse.trace(
                 name="asset-processing",
@@ -84,17 +179,37 @@ class BaseAssetProcessor:
             )
 
             span = trace.span(
-                id=x_span_id,
+                id=span_id,
                 name=f"{self.processor_name}_processing",
                 metadata={"processor_type": self.processor_type, "run_id": run_id},
             )
 
-            update_asset_status(file_hash, f"processing_{self.processor_name}")
+            await update_asset_status_async(
+                db, file_hash, f"processing_{self.processor_name}", run_id=run_id
+            )
             logger.info(f"Starting {self.processor_name} processing for {file_hash}")
 
-            result = await self.process_asset(file_hash, asset, db, span)
+            with llm_usage_context(
+                processor=self.processor_name, run_id=run_id, file_hash=file_hash
+            ):
+                if self.supports_llm_batch and await run_llm_mode(run_id) == "batch":
+                    result = await self._process_in_batch_mode(
+                        file_hash, asset, db, span
+                    )
+                    if result["status"] == BATCH_PENDING:
+                        await update_asset_status_async(
+                            db,
+                            file_hash,
+                            f"{self.processor_name}_{BATCH_PENDING}",
+                            run_id=run_id,
+                        )
+                        return result
+                else:
+                    result = await self._process_or_reuse(file_hash, asset, db, span)
 
-            update_asset_status(file_hash, f"{self.processor_name}_complete")
+            await update_asset_status_async(
+                db, file_hash, f"{self.processor_name}_complete", run_id=run_id
+            )
             span.event(
                 name=f"{self.processor_name}_complete", metadata={"result": result}
             )
@@ -102,7 +217,7 @@ class BaseAssetProcessor:
             return result
 
         except Exception as e:
-            error_msg = f"Error in {self.processor_name} processing: {str(e)}"
+            error_msg = f"Error in {self.processor_name} processing: {e!s}"
             logger.error(error_msg)
             if span:
                 span.event(
@@ -110,18 +225,168 @@ class BaseAssetProcessor:
                     metadata={"error": error_msg},
                     level="error",
                 )
-            update_asset_status(
-                file_hash, f"{self.processor_name}_error", error=error_msg
-            )
+            status = f"{self.processor_name}_error"
+            if db is not None:
+                await update_asset_status_async(
+                    db, file_hash, status, error=error_msg, run_id=run_id
+                )
+            else:
+                update_asset_status(file_hash, status, error=error_msg, run_id=run_id)
             raise HTTPException(status_code=500, detail=error_msg)
 
         finally:
+            if db is not None:
+                await status_recorder.flush_async(db)
             if span:
                 span.end()
 
+    async def _process_in_batch_mode(
+        self, file_hash: str, asset: dict[str, Any], db: Any, span: Any
+    ) -> dict[str, Any]:
+        """Run the stage with its LLM calls answered from finished batches; calls
+        not answered yet are submitted together as the next batch"""
+        with llm_batch_collection() as collector:
+            try:
+                result = await self._process_or_reuse(file_hash, asset, db, span)
+            except Exception:
+                # Failing on placeholder responses is expected mid-batch
+                if not collector.pending:
+                    raise
+        if not collector.pending:
+            return result
+
+        batch_id = await submit_stage_batch(
+            collector, file_hash, asset["current_run_id"], self.processor_name
+        )
+        span.event(
+            name=f"{self.processor_name}_{BATCH_PENDING}",
+            metadata={"batch_id": batch_id, "requests": len(collector.requests)},
+        )
+        return {
+            "status": BATCH_PENDING,
+            "batch_id": batch_id,
+            "requests": len(collector.requests),
+        }
+
+    async def _process_or_reuse(
+        self, file_hash: str, asset: dict[str, Any], db: Any, span: Any
+    ) -> dict[str, Any]:
+        """Run process_asset unless a stored result for identical inputs exists"""
+        inputs = await self.stage_inputs(file_hash, asset, db)
+        key = stage_input_key(file_hash, self.processor_name, inputs)
+        current = asset.get("stage_outputs", {}).get(self.processor_name, {})
+
+        stored = await find_stage_result(db, key) if STAGE_RESULT_REUSE else None
+        if stored and _filestore_paths_exist(stored["outputs"]):
+            if current.get("key") != key:
+                await self.restore_outputs(file_hash, db, stored["outputs"])
+            output_hash = stored["output_hash"]
+            result = {"status": "success", "reused": True, "output_hash": output_hash}
+            span.event(
+                name=f"{self.processor_name}_reused",
+                metadata={"key": key, "restored": current.get("key") != key},
+            )
+            logger.info(f"Reused stored {self.processor_name} result for {file_hash}")
+        else:
+            result = await self.process_asset(file_hash, asset, db, span)
+            if batch_calls_pending():
+                return result  # Partial: not stored, and redone on resume
+            outputs = await self.snapshot_outputs(file_hash, db)
+            output_hash = await save_stage_result(
+                db, key, file_hash, self.processor_name, inputs, outputs
+            )
+
+        await incr_metrics_async(
+            f"stage_results:{self.processor_name}",
+            {"reused" if result.get("reused") else "computed": 1},
+        )
+        await db["raw_assets"].update_one(
+            {"file_hash": file_hash},
+            {
+                "$set": {
+                    f"stage_outputs.{self.processor_name}": {
+                        "key": key,
+                        "output_hash": output_hash,
+                    }
+                }
+            },
+        )
+        return result
+
+    async def stage_inputs(
+        self, file_hash: str, asset: dict[str, Any], db: Any
+    ) -> dict[str, Any]:
+        """Prompt, model and upstream output hashes this stage's output depends on"""
+        stage_outputs = asset.get("stage_outputs", {})
+        # Every ancestor, not just direct dependencies: citations reads the
+        # markdown refined wrote as well as the lexemes it depends on
+        dependencies = set()
+        pending = list(AssetProcessor.PROCESSOR_REGISTRY.get(self.processor_name, []))
+        while pending:
+            dep = pending.pop()
+            if dep not in dependencies:
+                dependencies.add(dep)
+                pending.extend(AssetProcessor.PROCESSOR_REGISTRY[dep])
+        return {
+            "prompt_hash": hash_prompts(self.prompt_paths),
+            "model": current_model_name() if self.uses_model else None,
+            "upstream": {
+                dep: stage_outputs.get(dep, {}).get("output_hash")
+                for dep in sorted(dependencies)
+            },
+        }
+
+    async def snapshot_outputs(self, file_hash: str, db: Any) -> dict[str, Any]:
+        """Capture what this stage wrote, so it can be restored without re-running"""
+        snapshot = {"fields": {}, "results": {}}
+        if self.output_fields:
+            doc = await db["raw_assets"].find_one(
+                {"file_hash": file_hash}, {field: 1 for field in self.output_fields}
+            )
+            for field in self.output_fields:
+                value = _get_field(doc or {}, field)
+                if value is not _MISSING:
+                    snapshot["fields"][field] = value
+        for kind in self.result_kinds:
+            snapshot["results"][kind] = await get_asset_result(db, file_hash, kind)
+        return snapshot
+
+    async def restore_outputs(self, file_hash: str, db: Any, snapshot: dict[str, Any]):
+        """Write a stored snapshot back in place of this stage's current outputs"""
+        if snapshot["fields"]:
+            await db["raw_assets"].update_one(
+                {"file_hash": file_hash}, {"$set": snapshot["fields"]}
+            )
+        for kind, data in snapshot["results"].items():
+            if data is not None:
+                await save_asset_result(db, file_hash, kind, data)
+
+    def checkpoints(self, db: Any, file_hash: str, asset: dict[str, Any]):
+        """Per-item checkpoints for this stage in the asset's current run"""
+        return StageCheckpoints(
+            db, asset["current_run_id"], self.processor_name, file_hash
+        )
+
+    async def report_progress(
+        self, file_hash: str, asset: dict[str, Any], done: int, total: int
+    ):
+        """Publish how far through its items this stage is, in the job's meta"""
+        await asyncio.to_thread(
+            record_job_progress,
+            self.processor_name,
+            file_hash,
+            asset["current_run_id"],
+            done,
+            total,
+        )
+
+    def asset_projection(self) -> dict[str, int]:
+        """Projection of the raw_assets fields this processor reads"""
+        return {field: 1 for field in BASE_ASSET_FIELDS + self.asset_fields}
+
     async def process_asset(
-        self, file_hash: str, asset: Dict[str, Any], db: Any, span: Any
-    ) -> Dict[str, Any]:
+        self, file_hash: str, asset: dict[str, Any], db: Any, span: Any
+    ) -> dict[str, Any]:
         """
         Override this method to implement specific processing logic.
         Returns a dictionary of results to be included in the response.
@@ -0,0 +1,61 @@
+# api/rerun.py
+"""Re-run a pipeline stage and everything downstream of it.
+
+python rerun.py citations <file_hash> [<file_hash> ...]
+python rerun.py citations --all
+python rerun.py lexemes --all --llm-batch
+"""
+
+import argparse
+import logging
+import os
+
+from jobs.assets.base import AssetProcessor
+from services.database import close_db, get_db
+from services.llm_batches import batch_mode_unavailable
+from utils.logging_utils import configure_logging
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("from_stage", choices=sorted(AssetProcessor.PROCESSOR_REGISTRY))
+    parser.add_argument("file_hashes", nargs="*")
+    parser.add_argument(
+        "--all", action="store_true", help="re-run every uploaded asset"
+    )
+    parser.add_argument(
+        "--llm-batch",
+        action="store_true",
+        help="send LLM calls through the provider's batch API (for backfills)",
+    )
+    args = parser.parse_args()
+
+    if args.all:
+        file_hashes = get_db()["raw_assets"].distinct("file_hash")
+    else:
+        file_hashes = args.file_hashes
+    if not file_hashes:
+        parser.error("give at least one file hash, or --all")
+    if args.llm_batch and (reason := batch_mode_unavailable()):
+        parser.error(f"--llm-batch is unavailable: {reason}")
+
+    for file_hash in file_hashes:
+        try:
+            rerun = AssetProcessor.queue_rerun(
+                file_hash, args.from_stage, llm_mode="batch" if args.llm_batch else None
+            )
+            print(
+                f"{file_hash}: {rerun['run_id']} queued {', '.join(rerun['job_ids'])}"
+            )
+        except Exception as e:
+            print(f"{file_hash}: failed to queue re-run: {e}")
+
+
+if __name__ == "__main__":
+    configure_logging(os.getenv("LOG_LEVEL", "WARNING"))
+    try:
+        main()
+    finally:
+        close_db()
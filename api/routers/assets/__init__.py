@@ -1,9 +1,13 @@
 # api/routers/assets/__init__.py
 
+import asyncio
 import logging
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
+from jobs.assets.base import AssetProcessor
+from jobs.assets.scheduler import PipelineDAG
 from langfuse import Langfuse
+from models.assets import RerunRequest, RerunResponse
 from processors.assets.process_citations import ProcessCitations
 from processors.assets.process_definitions import ProcessDefinitions
 from processors.assets.process_images import ProcessImages
@@ -12,6 +16,8 @@ from processors.assets.process_refined import ProcessRefined
 from processors.assets.process_refined_metadata import ProcessRefinedMetadata
 from processors.assets.process_refined_splitting import ProcessRefinedSplitting
 from processors.assets.process_tables import ProcessTables
+from services.database import AsyncDB
+from services.llm_batches import batch_mode_unavailable
 from utils.langfuse_utils import configure_langfuse
 
 logger = logging.getLogger(__name__)
@@ -35,6 +41,60 @@ processors = [
     ProcessDefinitions(),
 ]
 
+# Processors by stage name, for workers that run stages in-process
+PROCESSORS = {processor.processor_name: processor for processor in processors}
+
 # Include each processor's router
 for processor in processors:
     assets_router.include_router(processor.router)
+
+
+@assets_router.post("/rerun", response_model=RerunResponse)
+async def rerun_assets(request: RerunRequest, db: AsyncDB):
+    """Re-run a stage and its downstream stages for the given assets"""
+    try:
+        if request.from_stage not in AssetProcessor.PROCESSOR_REGISTRY:
+            raise HTTPException(
+                status_code=400, detail=f"Unknown stage: {request.from_stage}"
+            )
+
+        if request.llm_mode == "batch" and (
+            reason := await asyncio.to_thread(batch_mode_unavailable)
+        ):
+            raise HTTPException(status_code=409, detail=reason)
+
+        file_hashes = list(dict.fromkeys(request.file_hashes))
+        found = set(
+            await db["raw_assets"].distinct(
+                "file_hash", {"file_hash": {"$in": file_hashes}}
+            )
+        )
+        missing = [file_hash for file_hash in file_hashes if file_hash not in found]
+        if missing:
+            raise HTTPException(
+                status_code=404, detail=f"Assets not found: {', '.join(missing)}"
+            )
+
+        runs = {}
+        for file_hash in file_hashes:
+            rerun = await asyncio.to_thread(
+                AssetProcessor.queue_rerun,
+                file_hash,
+                request.from_stage,
+                request.llm_mode,
+            )
+            runs[file_hash] = {"run_id": rerun["run_id"], "job_ids": rerun["job_ids"]}
+
+        return RerunResponse(
+            from_stage=request.from_stage,
+            stages=PipelineDAG(AssetProcessor.PROCESSOR_REGISTRY).descendants(
+                request.from_stage
+            ),
+            runs=runs,
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error queueing re-run from {request.from_stage}: {e!s}")
+        raise HTTPException(status_code=500, detail=str(e))
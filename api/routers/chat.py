@@ -1,25 +1,48 @@
+import asyncio
 import base64
 import json
 import logging
 import os
+import random
 import re
 import tempfile
-import time
 import traceback
-from functools import partial
-from typing import Dict, List, Optional, Union
 
+import anthropic
 import openai
-from anthropic import Anthropic, AnthropicBedrock
-from config.chat_config import CURRENT_CLIENT
+from config.chat_config import (
+    LLM_MAX_TOKENS,
+    OPENAI_MODEL,
+    current_model_name,
+    current_provider,
+)
 from fastapi import APIRouter, File, Form, HTTPException, Request, UploadFile
 from models.chat import ChatRequest, ChatResponse
-from utils.rate_limit_utils import rate_limit
+from services.llm_batches import (
+    LLMBatchPending,
+    batched_completion,
+    current_batch_collector,
+)
+from services.llm_cache import (
+    LLM_CACHE_ENABLED,
+    cache_completion,
+    get_cached_completion,
+    llm_cache_key,
+)
+from services.llm_clients import get_llm_client
+from services.token_usage import record_token_usage
+from utils.metrics_utils import incr_metrics_async
+from utils.rate_limit_utils import acquire_llm_capacity, rate_limit, settle_llm_tokens
+from utils.token_utils import check_context_window, count_message_tokens
 
 logger = logging.getLogger(__name__)
 
 chat_router = APIRouter()
 
+LLM_MAX_RETRIES = 5
+LLM_RETRY_BASE_DELAY = 1
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504, 529}
+
 
 def extract_json_from_markdown(text: str) -> str:
     """Extract JSON content from markdown code blocks"""
@@ -46,141 +69,170 @@ def sanitize_message_for_logging(msg: dict) -> dict:
     return msg_copy
 
 
-def chat_call(
-    query: Optional[str] = None,
-    messages: Optional[List[Dict]] = None,
-    expect_json: bool = False,
-) -> Union[Dict[str, str], Dict[str, Union[str, dict]]]:
-    """Unified chat call interface for different clients"""
-    max_retries = 5
-    base_delay = 1
+def _is_retryable(error: Exception) -> bool:
+    """Rate limits, overload, server errors and dropped connections"""
+    if isinstance(error, (openai.APIConnectionError, anthropic.APIConnectionError)):
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES
+
+
+async def _complete(messages: list[dict], use_cache: bool = True) -> str:
+    """Send messages to the configured provider, retrying transient failures.
+    Identical requests are answered from the LLM cache unless use_cache is off;
+    in a batch-mode stage the rest are left to the stage's provider batch"""
+    cache_key = llm_cache_key(
+        current_provider(),
+        current_model_name(),
+        messages,
+        {"max_tokens": LLM_MAX_TOKENS},
+    )
+    use_cache = use_cache and LLM_CACHE_ENABLED
+    if use_cache:
+        cached = await get_cached_completion(cache_key)
+        if cached is not None:
+            await record_token_usage(current_model_name(), 0, 0, cached=True)
+            return cached
+    else:
+        await incr_metrics_async("llm_cache", {"bypass": 1})
+
+    if current_batch_collector() is not None and current_provider() == "openai":
+        # Fail oversized prompts now rather than in the batch
+        check_context_window(count_message_tokens(messages))
+        # Batch results are stored under the cache key of their request
+        return await batched_completion(
+            cache_key,
+            {
+                "model": OPENAI_MODEL,
+                "messages": messages,
+                "max_tokens": LLM_MAX_TOKENS,
+            },
+        )
 
-    for attempt in range(max_retries):
+    text = await _request_completion(messages)
+    if use_cache:
+        await cache_completion(cache_key, text)
+    return text
+
+
+async def _request_completion(messages: list[dict]) -> str:
+    client = get_llm_client()
+    model = current_model_name()
+    # Providers count max_tokens against the budget until the call finishes
+    input_tokens = count_message_tokens(messages, model)
+    # Fail now rather than after a slow round trip
+    check_context_window(input_tokens, model)
+    reserved = input_tokens + LLM_MAX_TOKENS
+    for attempt in range(LLM_MAX_RETRIES):
+        await acquire_llm_capacity(model, reserved)
+        used = reserved
         try:
-            return _chat_with_client(query, messages, expect_json)
-        except Exception as e:
-            time.sleep(base_delay * (2**attempt))
-            if "429" not in str(e) or attempt == max_retries - 1:
-                raise
-
-
-def _chat_with_client(
-    query: Optional[str] = None,
-    messages: Optional[List[Dict]] = None,
-    expect_json: bool = False,
-):
-    """Helper function to route chat requests to the current client"""
-    client = CURRENT_CLIENT  # Do not call the module
-    try:
-        if query:
-            messages = [{"role": "user", "content": query}]
-        elif messages is None:
-            messages = []
-
-        if client == openai:
-            # OpenAI API call using the new interface
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
+            if current_provider() == "openai":
+                response = await client.chat.completions.create(
+                    model=OPENAI_MODEL,
+                    messages=messages,
+                    max_tokens=LLM_MAX_TOKENS,
+                )
+                used = response.usage.total_tokens
+                await record_token_usage(
+                    model,
+                    response.usage.prompt_tokens,
+                    response.usage.completion_tokens,
+                )
+                return response.choices[0].message.content
+
+            response = await client.messages.create(
+                model=model,
+                max_tokens=LLM_MAX_TOKENS,
                 messages=messages,
-                max_tokens=4096,
             )
-            message_text = response.choices[0].message.content
-        elif isinstance(client, partial) and client.func in [
-            Anthropic,
-            AnthropicBedrock,
-        ]:
-            # Anthropic API call
-            response = client().messages.create(
-                max_tokens=4096,
-                messages=messages,
+            used = response.usage.input_tokens + response.usage.output_tokens
+            await record_token_usage(
+                model, response.usage.input_tokens, response.usage.output_tokens
             )
-            # Anthropic response parsing
-            message_text = response["completion"]
-        else:
-            raise ValueError("Unsupported client type")
+            return "".join(
+                block.text for block in response.content if block.type == "text"
+            )
+        except Exception as e:
+            if not _is_retryable(e) or attempt == LLM_MAX_RETRIES - 1:
+                raise
+            # Full jitter, so replicas throttled together don't retry together
+            delay = random.uniform(0, LLM_RETRY_BASE_DELAY * 2**attempt)
+            logger.warning(f"Retrying LLM call in {delay:.1f}s: {e!s}")
+            await asyncio.sleep(delay)
+        finally:
+            await settle_llm_tokens(model, reserved, used)
 
-        if not expect_json:
-            return {"message": message_text}
 
-        try:
-            cleaned_json = extract_json_from_markdown(message_text)
-            parsed_json = json.loads(cleaned_json)
-            return {"message": message_text, "json": parsed_json}
-        except json.JSONDecodeError as e:
-            return {
-                "message": message_text,
-                "error": f"Failed to parse JSON response: {str(e)}",
-                "raw_content": cleaned_json,
-            }
+async def chat_call(
+    query: str | None = None,
+    messages: list[dict] | None = None,
+    expect_json: bool = False,
+    use_cache: bool = True,
+) -> dict[str, str] | dict[str, str | dict]:
+    """Unified chat call interface for different clients"""
+    if query:
+        messages = [{"role": "user", "content": query}]
+    elif messages is None:
+        messages = []
 
+    try:
+        message_text = await _complete(messages, use_cache=use_cache)
+    except LLMBatchPending as e:
+        return {"error": str(e), "batch_pending": True}
     except Exception as e:
-        logger.error(f"Chat API call failed: {str(e)}")
+        logger.error(f"Chat API call failed: {e!s}")
         return {"error": str(e)}
 
+    if not expect_json:
+        return {"message": message_text}
 
-def multimodal_chat_call(image_path: str, query: str):
+    try:
+        cleaned_json = extract_json_from_markdown(message_text)
+        parsed_json = json.loads(cleaned_json)
+        return {"message": message_text, "json": parsed_json}
+    except json.JSONDecodeError as e:
+        return {
+            "message": message_text,
+            "error": f"Failed to parse JSON response: {e!s}",
+            "raw_content": cleaned_json,
+        }
+
+
+async def multimodal_chat_call(image_path: str, query: str, use_cache: bool = True):
     """Multimodal chat using the configured client"""
-    client = CURRENT_CLIENT  # Do not call the module
     try:
         # Prepare the image as base64 encoded data
         encoded_image = get_base64_encoded_image(image_path)
 
-        # Prepare the messages payload
-        if client == openai:
+        if current_provider() == "openai":
             # OpenAI's API expects the query and image separately
-            messages = [
+            content = [
+                {"type": "text", "text": query},
                 {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": query},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{encoded_image}"
-                            },
-                        },
-                    ],
-                }
+                    "type": "image_url",
+                    "image_url": {"url": f"data:image/png;base64,{encoded_image}"},
+                },
             ]
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages,
-                max_tokens=4096,
-            )
-            message_text = response.choices[0].message.content
-        elif isinstance(client, partial) and client.func in [
-            Anthropic,
-            AnthropicBedrock,
-        ]:
-            messages = [
+        else:
+            content = [
                 {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "data": encoded_image,
-                                "media_type": "image/png",
-                            },
-                        },
-                        {"type": "text", "text": query},
-                    ],
-                }
+                    "type": "image",
+                    "source": {
+                        "type": "base64",
+                        "data": encoded_image,
+                        "media_type": "image/png",
+                    },
+                },
+                {"type": "text", "text": query},
             ]
-            response = client().messages.create(
-                max_tokens=4096,
-                messages=messages,
-            )
-            # Anthropic response parsing
-            message_text = response["completion"]
-        else:
-            raise ValueError("Unsupported client type")
 
+        message_text = await _complete(
+            [{"role": "user", "content": content}], use_cache=use_cache
+        )
         return {"message": message_text}
 
     except Exception as e:
-        logger.error(f"Multimodal chat API call failed: {str(e)}")
+        logger.error(f"Multimodal chat API call failed: {e!s}")
         return {"error": str(e)}
 
 
@@ -189,10 +241,11 @@ def multimodal_chat_call(image_path: str, query: str):
 async def chat(request: Request, chat_request: ChatRequest):
     """Standard chat endpoint for text-only messages"""
     try:
-        response = chat_call(
+        response = await chat_call(
             query=chat_request.query,
             messages=chat_request.messages,
             expect_json=chat_request.expect_json,
+            use_cache=chat_request.use_cache,
         )
 
         if "error" in response:
@@ -205,7 +258,7 @@ async def chat(request: Request, chat_request: ChatRequest):
             raw_content=response.get("raw_content"),
         )
     except Exception as e:
-        logger.error(f"Chat endpoint error: {str(e)}")
+        logger.error(f"Chat endpoint error: {e!s}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -229,12 +282,16 @@ async def chat_with_image(
             temp_path = temp_file.name
 
         try:
-            response = multimodal_chat_call(temp_path, query)
-            message_text = response.content[0].text
-            return ChatResponse(message=message_text)
+            response = await multimodal_chat_call(temp_path, query)
+            if "error" in response:
+                raise HTTPException(status_code=500, detail=response["error"])
+            return ChatResponse(message=response["message"])
+
+        except HTTPException:
+            raise
 
         except Exception as e:
-            logger.error(f"Claude API call failed: {str(e)}")
+            logger.error(f"Claude API call failed: {e!s}")
             raise HTTPException(status_code=500, detail=str(e))
         finally:
             # Clean up temp file
@@ -244,7 +301,5 @@ async def chat_with_image(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(
-            f"Chat with image endpoint error: {str(e)}\n{traceback.format_exc()}"
-        )
+        logger.error(f"Chat with image endpoint error: {e!s}\n{traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=str(e))
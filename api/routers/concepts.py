@@ -1,11 +1,17 @@
 import logging
-import os
 from datetime import datetime
-from typing import List
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
 from models.concepts import Concept, ConceptCreate, ConceptUpdate
-from pymongo import MongoClient
+from services.collection_versions import (
+    bump_collection_version,
+    collection_etag,
+    is_not_modified,
+    not_modified,
+    set_etag,
+)
+from services.database import AsyncDB
+from utils.streaming_utils import ndjson_response, wants_ndjson
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -14,31 +20,31 @@ logger = logging.getLogger(__name__)
 concepts_router = APIRouter()
 
 
-def get_db():
+@concepts_router.get("/concepts", response_model=list[Concept])
+async def get_concepts(
+    request: Request,
+    response: Response,
+    db: AsyncDB,
+):
+    """Get all concepts; streamed as NDJSON when requested via Accept"""
     try:
-        client = MongoClient(os.getenv("MONGODB_URI", "mongodb://db:27017/"))
-        db = client["chelle"]
-        client.admin.command("ping")
-        logger.debug("Successfully connected to MongoDB")
-        return db
-    except Exception as e:
-        logger.error(f"Failed to connect to MongoDB: {str(e)}")
-        raise HTTPException(status_code=500, detail="Database connection failed")
-
+        etag = await collection_etag(request, "concepts")
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+        if wants_ndjson(request):
+            return set_etag(
+                ndjson_response(db["concepts"].find({}, {"_id": 0}), Concept), etag
+            )
 
-@concepts_router.get("/concepts", response_model=List[Concept])
-async def get_concepts():
-    """Get all concepts"""
-    try:
         logger.debug("Attempting to fetch concepts from MongoDB")
-        db = get_db()
         concepts_collection = db["concepts"]
 
-        count = concepts_collection.count_documents({})
+        count = await concepts_collection.count_documents({})
         logger.debug(f"Found {count} concepts in database")
 
         concepts = []
-        for concept in concepts_collection.find():
+        async for concept in concepts_collection.find():
             logger.debug(f"Processing concept: {concept.get('name', 'unknown')}")
             concept_dict = {
                 "name": concept["name"],
@@ -54,47 +60,48 @@ async def get_concepts():
         return concepts
 
     except Exception as e:
-        logger.error(f"Error fetching concepts: {str(e)}")
+        logger.error(f"Error fetching concepts: {e!s}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @concepts_router.post("/concepts", response_model=Concept)
-async def create_concept(concept: ConceptCreate):
+async def create_concept(concept: ConceptCreate, db: AsyncDB):
     """Create a new concept"""
     try:
         logger.debug(f"Attempting to create concept: {concept.name}")
-        db = get_db()
         concepts_collection = db["concepts"]
 
-        if concepts_collection.find_one({"name": concept.name}):
+        if await concepts_collection.find_one({"name": concept.name}):
             raise HTTPException(status_code=400, detail="Concept already exists")
 
         concept_dict = concept.model_dump()
         concept_dict["created_at"] = datetime.now().strftime("%Y-%m-%d")
 
-        result = concepts_collection.insert_one(concept_dict)
+        result = await concepts_collection.insert_one(concept_dict)
+        await bump_collection_version("concepts")
         logger.debug(f"Created concept with ID: {result.inserted_id}")
 
-        created_concept = concepts_collection.find_one({"_id": result.inserted_id})
+        created_concept = await concepts_collection.find_one(
+            {"_id": result.inserted_id}
+        )
         created_concept.pop("_id")
         return created_concept
 
     except HTTPException as he:
         raise he
     except Exception as e:
-        logger.error(f"Error creating concept: {str(e)}")
+        logger.error(f"Error creating concept: {e!s}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @concepts_router.get("/concepts/{name}", response_model=Concept)
-async def get_concept(name: str):
+async def get_concept(name: str, db: AsyncDB):
     """Get a specific concept by name"""
     try:
         logger.debug(f"Attempting to fetch concept: {name}")
-        db = get_db()
         concepts_collection = db["concepts"]
 
-        concept = concepts_collection.find_one({"name": name})
+        concept = await concepts_collection.find_one({"name": name})
         if not concept:
             raise HTTPException(status_code=404, detail="Concept not found")
 
@@ -104,16 +111,19 @@ async def get_concept(name: str):
     except HTTPException as he:
         raise he
     except Exception as e:
-        logger.error(f"Error fetching concept: {str(e)}")
+        logger.error(f"Error fetching concept: {e!s}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @concepts_router.put("/concepts/{name}", response_model=Concept)
-async def update_concept(name: str, concept_update: ConceptUpdate):
+async def update_concept(
+    name: str,
+    concept_update: ConceptUpdate,
+    db: AsyncDB,
+):
     """Update a concept"""
     try:
         logger.debug(f"Attempting to update concept: {name}")
-        db = get_db()
         concepts_collection = db["concepts"]
 
         update_data = {
@@ -122,38 +132,41 @@ async def update_concept(name: str, concept_update: ConceptUpdate):
         if not update_data:
             raise HTTPException(status_code=400, detail="No valid update data provided")
 
-        result = concepts_collection.update_one({"name": name}, {"$set": update_data})
+        result = await concepts_collection.update_one(
+            {"name": name}, {"$set": update_data}
+        )
 
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Concept not found")
+        await bump_collection_version("concepts")
 
-        updated_concept = concepts_collection.find_one({"name": name})
+        updated_concept = await concepts_collection.find_one({"name": name})
         updated_concept.pop("_id")
         return updated_concept
 
     except HTTPException as he:
         raise he
     except Exception as e:
-        logger.error(f"Error updating concept: {str(e)}")
+        logger.error(f"Error updating concept: {e!s}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @concepts_router.delete("/concepts/{name}")
-async def delete_concept(name: str):
+async def delete_concept(name: str, db: AsyncDB):
     """Delete a concept"""
     try:
         logger.debug(f"Attempting to delete concept: {name}")
-        db = get_db()
         concepts_collection = db["concepts"]
 
-        result = concepts_collection.delete_one({"name": name})
+        result = await concepts_collection.delete_one({"name": name})
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Concept not found")
+        await bump_collection_version("concepts")
 
         return {"message": "Concept deleted successfully"}
 
     except HTTPException as he:
         raise he
     except Exception as e:
-        logger.error(f"Error deleting concept: {str(e)}")
+        logger.error(f"Error deleting concept: {e!s}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,45 @@
+# api/routers/events.py
+
+import json
+import logging
+
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import StreamingResponse
+from services.events import asset_events
+
+logger = logging.getLogger(__name__)
+
+events_router = APIRouter()
+
+
+@events_router.get("/events/assets")
+async def stream_asset_events(
+    request: Request,
+    file_hash: list[str] | None = Query(None),
+    run_id: list[str] | None = Query(None),
+):
+    """Server-sent events for asset status and pipeline job transitions.
+
+    Filter with repeated ?file_hash= or ?run_id=; with neither, every asset's
+    events are sent.
+    """
+
+    async def stream():
+        yield "retry: 5000\n\n"
+        try:
+            async for event in asset_events(file_hash, run_id):
+                if await request.is_disconnected():
+                    break
+                if event is None:
+                    yield ": keep-alive\n\n"
+                else:
+                    yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        except Exception as e:
+            logger.error(f"Error streaming asset events: {e!s}")
+            raise
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,17 +1,40 @@
 # api/routers/files.py
+import asyncio
 import json
 import logging
 import os
+import zipfile
+from collections.abc import Iterator
 from datetime import datetime
-from typing import List
+from typing import BinaryIO
 
 from bson import ObjectId
-from fastapi import APIRouter, File, HTTPException, Request, UploadFile
+from fastapi import (
+    APIRouter,
+    File,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+)
 from fastapi.responses import FileResponse as FastAPIFileResponse
+from jobs.assets.admission import (
+    DEFER,
+    REJECT,
+    decide_admission,
+    defer_run,
+    drain_backlog,
+)
 from jobs.assets.base import AssetProcessor
+from jobs.assets.batches import BATCHES_COLLECTION, enqueue_batch
 from models.files import FileDetailResponse, FileResponse, ProcessedPaths
-from services.database import get_db
-from utils import format_datetime, save_file
+from pymongo import UpdateOne
+from services.asset_results import get_asset_result, get_asset_results
+from services.database import AsyncDB, get_async_db
+from utils import format_datetime, save_file, save_file_stream
+from utils.db_utils import summarize_stage_timings
+from utils.pagination_utils import encode_cursor, keyset_filter
 from utils.table_utils import convert_table_paths
 
 logging.basicConfig(level=logging.DEBUG)
@@ -20,150 +43,387 @@ logger = logging.getLogger(__name__)
 
 files_router = APIRouter()
 
+ALLOWED_FILE_TYPES = {
+    "application/pdf": ".pdf",
+    "image/png": ".png",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": ".docx",
+}
+EXTENSION_FILE_TYPES = {
+    ext: content_type for content_type, ext in ALLOWED_FILE_TYPES.items()
+}
+ZIP_CONTENT_TYPES = {"application/zip", "application/x-zip-compressed"}
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "5000"))
+
+
+def _file_type_error(filename: str, content_type: str) -> str | None:
+    """Why an upload's type is not accepted, or None if it is"""
+    if content_type not in ALLOWED_FILE_TYPES:
+        return f"Unsupported file type: {content_type}. Supported types are: {', '.join(ALLOWED_FILE_TYPES.keys())}"
+    file_ext = os.path.splitext(filename)[1].lower()
+    if file_ext != ALLOWED_FILE_TYPES[content_type]:
+        return (
+            f"File extension '{file_ext}' does not match content type '{content_type}'"
+        )
+    return None
+
+
+def _asset_record(file_details: dict) -> dict:
+    return {
+        "original_name": file_details["original_name"],
+        "stored_name": file_details["stored_name"],
+        "file_path": file_details["file_path"],
+        "file_hash": file_details["file_hash"],
+        "file_type": file_details["file_type"],
+        "file_size": file_details["file_size"],
+        "upload_date": datetime.now(),
+        "status": "uploaded",
+        "processed": False,
+    }
+
+
+def _expand_upload(
+    filename: str, content_type: str, stream: BinaryIO
+) -> Iterator[tuple[str, str, BinaryIO]]:
+    """Yield (name, content type, stream) for an upload, unpacking zip archives.
+
+    Each member's stream is only valid until the next one is yielded.
+    """
+    if content_type not in ZIP_CONTENT_TYPES and not filename.lower().endswith(".zip"):
+        yield filename, content_type, stream
+        return
+
+    with zipfile.ZipFile(stream) as archive:
+        for member in archive.infolist():
+            name = os.path.basename(member.filename)
+            if (
+                member.is_dir()
+                or not name
+                or name.startswith(".")
+                or "__MACOSX" in member.filename
+            ):
+                continue
+            ext = os.path.splitext(name)[1].lower()
+            with archive.open(member) as member_stream:
+                yield (
+                    name,
+                    EXTENSION_FILE_TYPES.get(ext, "application/octet-stream"),
+                    member_stream,
+                )
+
 
 @files_router.post("/upload")
 async def upload_file(
-    request: Request, file: UploadFile = File(...), queue_processing: bool = True
+    request: Request,
+    db: AsyncDB,
+    file: UploadFile = File(...),
+    queue_processing: bool = True,
 ):
     try:
-        allowed_types = {
-            "application/pdf": ".pdf",
-            "image/png": ".png",
-            "application/vnd.openxmlformats-officedocument.wordprocessingml.document": ".docx",
-        }
-        if file.content_type not in allowed_types:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Unsupported file type: {file.content_type}. Supported types are: {', '.join(allowed_types.keys())}",
-            )
+        if type_error := _file_type_error(file.filename, file.content_type):
+            raise HTTPException(status_code=400, detail=type_error)
+
+        admission = None
+        if queue_processing:
+            await asyncio.to_thread(drain_backlog)
+            admission = await asyncio.to_thread(decide_admission)
+            if admission["action"] == REJECT:
+                retry_after = admission["retry_after_seconds"]
+                raise HTTPException(
+                    status_code=429,
+                    detail=f"Processing queues are full; retry in {retry_after} seconds",
+                    headers={"Retry-After": str(retry_after)},
+                )
 
-        file_ext = os.path.splitext(file.filename)[1].lower()
-        if file_ext != allowed_types[file.content_type]:
-            raise HTTPException(
-                status_code=400,
-                detail=f"File extension '{file_ext}' does not match content type '{file.content_type}'",
-            )
         file_content = await file.read()
         file_details = save_file(file_content, file.filename, file.content_type)
         if "error" in file_details:
             raise HTTPException(status_code=500, detail=file_details["error"])
 
-        db = get_db()
-        if isinstance(db, dict) and "error" in db:
-            raise HTTPException(status_code=500, detail=db["error"])
         raw_assets = db["raw_assets"]
 
-        asset_record = {
-            "original_name": file_details["original_name"],
-            "stored_name": file_details["stored_name"],
-            "file_path": file_details["file_path"],
-            "file_hash": file_details["file_hash"],
-            "file_type": file_details["file_type"],
-            "file_size": file_details["file_size"],
-            "upload_date": datetime.now(),
-            "status": "uploaded",
-            "processed": False,
-        }
-
-        result = raw_assets.insert_one(asset_record)
+        result = await raw_assets.insert_one(_asset_record(file_details))
         logger.info(file_details)
 
-        if queue_processing:
-            AssetProcessor.queue_initial_processors(file_details["file_hash"])
+        status = "uploaded"
+        if admission and admission["action"] == DEFER:
+            await asyncio.to_thread(defer_run, file_details["file_hash"])
+            status = "deferred"
+        elif admission:
+            await asyncio.to_thread(
+                AssetProcessor.queue_initial_processors, file_details["file_hash"]
+            )
+            status = "processing_queued"
 
         return FileResponse(
             id=str(result.inserted_id),
+            file_hash=file_details["file_hash"],
             name=file_details["original_name"],
             size=file_details["file_size"],
             type=file_details["file_type"],
-            status="processing_queued",
+            status=status,
             upload_date=datetime.now().isoformat(),
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Upload failed: {str(e)}")
+        logger.error(f"Upload failed: {e!s}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@files_router.get("/files", response_model=List[FileResponse])
-async def list_files():
-    """Get list of all files"""
-    try:
-        logger.debug("Fetching file list")
-        db = get_db()
-        if isinstance(db, dict) and "error" in db:
-            raise HTTPException(status_code=500, detail=db["error"])
-        raw_assets = db["raw_assets"]
-
-        count = raw_assets.count_documents({})
-        logger.debug(f"Found {count} documents in raw_assets")
+@files_router.post("/upload/batch")
+async def upload_batch(
+    db: AsyncDB,
+    files: list[UploadFile] = File(...),
+):
+    """Upload many files (or zip archives of them) as one batch run.
 
-        files = []
-        cursor = raw_assets.find().sort("upload_date", -1)
+    Files are registered together and their pipeline runs are admitted from a
+    shared backlog, BATCH_MAX_ACTIVE_RUNS at a time across all batches.
+    """
+    try:
+        batch_id = f"batch-{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+        accepted = {}
+        rejected = []
 
-        for asset in cursor:
+        # Uploads and zip members are streamed to disk one at a time, so a
+        # large batch is never held in memory
+        for upload in files:
             try:
-                logger.debug(
-                    f"Processing asset: {asset.get('original_name', 'unknown')}"
+                for name, content_type, stream in _expand_upload(
+                    upload.filename, upload.content_type, upload.file
+                ):
+                    if type_error := _file_type_error(name, content_type):
+                        rejected.append({"name": name, "reason": type_error})
+                        continue
+                    if len(accepted) >= BATCH_MAX_FILES:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"Batches are limited to {BATCH_MAX_FILES} files",
+                        )
+                    file_details = await asyncio.to_thread(
+                        save_file_stream, stream, name, content_type
+                    )
+                    if "error" in file_details:
+                        rejected.append({"name": name, "reason": file_details["error"]})
+                        continue
+                    accepted[file_details["file_hash"]] = file_details
+            except zipfile.BadZipFile:
+                rejected.append(
+                    {"name": upload.filename, "reason": "Invalid zip archive"}
                 )
 
-                asset_id = str(asset["_id"])
+        if not accepted:
+            raise HTTPException(
+                status_code=400,
+                detail={"message": "No supported files in batch", "rejected": rejected},
+            )
 
-                upload_date = format_datetime(asset["upload_date"])
-                processed_date = (
-                    format_datetime(asset.get("processed_date"))
-                    if asset.get("processed_date")
-                    else None
+        # Re-uploaded files keep their record and join this batch
+        operations = []
+        for file_hash, file_details in accepted.items():
+            record = _asset_record(file_details)
+            del record["status"]
+            operations.append(
+                UpdateOne(
+                    {"file_hash": file_hash},
+                    {
+                        "$setOnInsert": record,
+                        "$set": {"batch_id": batch_id, "status": "batch_queued"},
+                    },
+                    upsert=True,
                 )
+            )
+        await db["raw_assets"].bulk_write(operations, ordered=False)
+
+        await db[BATCHES_COLLECTION].insert_one(
+            {
+                "_id": batch_id,
+                "status": "processing",
+                "file_hashes": list(accepted),
+                "total": len(accepted),
+                "admitted": 0,
+                "completed": 0,
+                "failed": 0,
+                "rejected": rejected,
+                "created_at": datetime.now(),
+            }
+        )
+        await asyncio.to_thread(enqueue_batch, batch_id, list(accepted))
 
-                processed_paths = asset.get("processed_paths", {})
-                if not isinstance(processed_paths, dict):
-                    processed_paths = {}
+        return {"batch_id": batch_id, "total": len(accepted), "rejected": rejected}
 
-                tables = processed_paths.get("tables", {})
-                converted_tables = convert_table_paths(tables)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Batch upload failed: {e!s}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-                paths = ProcessedPaths(
-                    markdown=processed_paths.get("markdown", ""),
-                    images=processed_paths.get("images", {}),
-                    tables=converted_tables,
-                    meta=processed_paths.get("meta", ""),
-                    metadata=processed_paths.get("metadata", ""),
-                )
-                metadata = asset.get("metadata")
-                if metadata:
-                    logger.debug(f"Found metadata for {asset_id}: {metadata}")
-
-                file_response = FileResponse(
-                    id=asset_id,
-                    name=asset["original_name"],
-                    size=asset["file_size"],
-                    type=asset["file_type"],
-                    status=asset.get("status", "unknown"),
-                    upload_date=upload_date,
-                    processed_date=processed_date,
-                    error=asset.get("error"),
-                    processed_paths=paths,
-                    has_images=bool(asset.get("has_images", False)),
-                    image_count=asset.get("image_count", 0),
-                    has_tables=bool(asset.get("has_tables", False)),
-                    table_count=asset.get("table_count", 0),
-                    metadata=metadata,
-                    file_path=asset.get("file_path"),
-                )
 
-                logger.debug(f"Created FileResponse for {asset_id}")
-                files.append(file_response)
+@files_router.get("/batches/{batch_id}")
+async def get_batch(batch_id: str, db: AsyncDB):
+    """Get a batch upload's progress"""
+    try:
+        batch = await db[BATCHES_COLLECTION].find_one(
+            {"_id": batch_id}, {"file_hashes": 0}
+        )
+        if not batch:
+            raise HTTPException(status_code=404, detail="Batch not found")
+
+        statuses = {
+            doc["_id"]: doc["count"]
+            async for doc in db["raw_assets"].aggregate(
+                [
+                    {"$match": {"batch_id": batch_id}},
+                    {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+                ]
+            )
+        }
+        finished = batch["completed"] + batch["failed"]
+        return {
+            "batch_id": batch_id,
+            "status": batch["status"],
+            "created_at": format_datetime(batch["created_at"]),
+            "completed_at": format_datetime(batch.get("completed_at")),
+            "total": batch["total"],
+            "queued": batch["total"] - batch["admitted"],
+            "running": batch["admitted"] - finished,
+            "completed": batch["completed"],
+            "failed": batch["failed"],
+            "rejected": batch["rejected"],
+            "statuses": statuses,
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting batch: {e!s}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+FILES_PAGE_SIZE = int(os.getenv("FILES_PAGE_SIZE", "100"))
+FILES_MAX_PAGE_SIZE = 500
+
+# Fields read for every listed file; the rest are opt-in via ?fields=
+FILE_SUMMARY_FIELDS = {
+    "original_name": 1,
+    "file_size": 1,
+    "file_type": 1,
+    "file_hash": 1,
+    "status": 1,
+    "upload_date": 1,
+    "processed_date": 1,
+    "error": 1,
+    "has_images": 1,
+    "image_count": 1,
+    "has_tables": 1,
+    "table_count": 1,
+    "file_path": 1,
+}
+FILE_OPTIONAL_FIELDS = {"processed_paths", "metadata"}
+
+
+def _processed_paths_response(processed_paths) -> ProcessedPaths:
+    if not isinstance(processed_paths, dict):
+        processed_paths = {}
+    return ProcessedPaths(
+        markdown=processed_paths.get("markdown", ""),
+        images=processed_paths.get("images", {}),
+        tables=convert_table_paths(processed_paths.get("tables", {})),
+        meta=processed_paths.get("meta", ""),
+        metadata=processed_paths.get("metadata", ""),
+    )
+
+
+@files_router.get("/files", response_model=list[FileResponse])
+async def list_files(
+    response: Response,
+    db: AsyncDB,
+    limit: int = Query(FILES_PAGE_SIZE, ge=1, le=FILES_MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    status: list[str] | None = Query(None),
+    file_type: list[str] | None = Query(None, alias="type"),
+    fields: str | None = None,
+):
+    """List files newest first, one page at a time.
+
+    The cursor for the next page is returned in the X-Next-Cursor header.
+    Pass fields=processed_paths,metadata to include the heavier fields.
+    """
+    try:
+        extra_fields = set(fields.split(",")) if fields else set()
+        unknown = extra_fields - FILE_OPTIONAL_FIELDS
+        if unknown:
+            raise HTTPException(
+                status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+            )
 
+        query = keyset_filter("upload_date", cursor)
+        if status:
+            query["status"] = {"$in": status}
+        if file_type:
+            query["file_type"] = {"$in": file_type}
+
+        projection = dict(FILE_SUMMARY_FIELDS)
+        if "processed_paths" in extra_fields:
+            projection["processed_paths"] = 1
+
+        assets = (
+            await db["raw_assets"]
+            .find(query, projection)
+            .sort([("upload_date", -1), ("_id", -1)])
+            .limit(limit)
+            .to_list(length=limit)
+        )
+
+        metadata_by_hash = {}
+        if "metadata" in extra_fields:
+            metadata_by_hash = await get_asset_results(
+                db, [asset.get("file_hash") for asset in assets], "metadata"
+            )
+
+        files = []
+        for asset in assets:
+            try:
+                files.append(
+                    FileResponse(
+                        id=str(asset["_id"]),
+                        file_hash=asset.get("file_hash"),
+                        name=asset["original_name"],
+                        size=asset["file_size"],
+                        type=asset["file_type"],
+                        status=asset.get("status", "unknown"),
+                        upload_date=format_datetime(asset["upload_date"]),
+                        processed_date=format_datetime(asset.get("processed_date")),
+                        error=asset.get("error"),
+                        processed_paths=_processed_paths_response(
+                            asset.get("processed_paths")
+                        )
+                        if "processed_paths" in extra_fields
+                        else None,
+                        has_images=bool(asset.get("has_images", False)),
+                        image_count=asset.get("image_count", 0),
+                        has_tables=bool(asset.get("has_tables", False)),
+                        table_count=asset.get("table_count", 0),
+                        metadata=metadata_by_hash.get(asset.get("file_hash")),
+                        file_path=asset.get("file_path"),
+                    )
+                )
             except Exception as e:
-                logger.error(f"Error processing file record: {str(e)}", exc_info=True)
-                continue
+                logger.error(f"Error processing file record {asset['_id']}: {e!s}")
+
+        if len(assets) == limit:
+            last = assets[-1]
+            response.headers["X-Next-Cursor"] = encode_cursor(
+                last["upload_date"], last["_id"]
+            )
 
-        logger.debug(f"Returning {len(files)} files")
         return files
 
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error listing files: {str(e)}", exc_info=True)
+        logger.error(f"Error listing files: {e!s}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -171,9 +431,7 @@ async def get_file_details(file_id: str):
     """Get detailed information about a specific file"""
     try:
         logger.debug(f"Fetching details for file: {file_id}")
-        db = get_db()
-        if isinstance(db, dict) and "error" in db:
-            raise HTTPException(status_code=500, detail=db["error"])
+        db = await get_async_db()
         raw_assets = db["raw_assets"]
 
         try:
@@ -181,7 +439,7 @@ async def get_file_details(file_id: str):
         except Exception:
             raise HTTPException(status_code=400, detail="Invalid file ID format")
 
-        asset = raw_assets.find_one({"_id": obj_id})
+        asset = await raw_assets.find_one({"_id": obj_id}, {"status_history": 0})
         if not asset:
             raise HTTPException(status_code=404, detail="File not found")
 
@@ -191,10 +449,11 @@ async def get_file_details(file_id: str):
                 with open(asset["processed_paths"]["markdown"], "r") as f:
                     preview = f.read(1000)  # First 1000 characters as preview
             except Exception as e:
-                logger.error(f"Error reading preview: {str(e)}")
+                logger.error(f"Error reading preview: {e!s}")
 
         return FileDetailResponse(
             id=str(asset["_id"]),
+            file_hash=asset.get("file_hash"),
             name=asset["original_name"],
             size=asset["file_size"],
             type=asset["file_type"],
@@ -211,19 +470,96 @@ async def get_file_details(file_id: str):
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error getting file details: {str(e)}")
+        logger.error(f"Error getting file details: {e!s}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@files_router.get("/files/{file_id}/history")
+async def get_file_history(
+    file_id: str,
+    db: AsyncDB,
+    run_id: str | None = None,
+):
+    """Get the status history and per-stage timings for a file"""
+    try:
+        asset = await db["raw_assets"].find_one(
+            {"_id": ObjectId(file_id)},
+            {"status": 1, "current_run_id": 1, "status_history": 1},
+        )
+        if not asset:
+            raise HTTPException(status_code=404, detail="File not found")
+
+        run_id = run_id or asset.get("current_run_id")
+        history = asset.get("status_history", [])
+        return {
+            "status": asset.get("status", "unknown"),
+            "run_id": run_id,
+            "history": [
+                {**entry, "timestamp": format_datetime(entry["timestamp"])}
+                for entry in history
+                if not run_id or entry.get("run_id") == run_id
+            ],
+            "stages": {
+                stage: {key: format_datetime(value) for key, value in timing.items()}
+                for stage, timing in summarize_stage_timings(history, run_id).items()
+            },
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting file history: {e!s}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@files_router.get("/files/{file_id}/metadata")
+async def get_file_metadata(file_id: str, db: AsyncDB):
+    """Get the document metadata extracted for a file"""
+    try:
+        asset = await db["raw_assets"].find_one(
+            {"_id": ObjectId(file_id)}, {"file_hash": 1}
+        )
+        if not asset:
+            raise HTTPException(status_code=404, detail="File not found")
+
+        metadata = await get_asset_result(db, asset["file_hash"], "metadata")
+        if metadata is None:
+            raise HTTPException(status_code=404, detail="Metadata not ready")
+        return metadata
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting file metadata: {e!s}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@files_router.get("/files/{file_id}/paths", response_model=ProcessedPaths)
+async def get_file_paths(file_id: str, db: AsyncDB):
+    """Get the processed outputs (images, tables, ...) listed for a file"""
+    try:
+        asset = await db["raw_assets"].find_one(
+            {"_id": ObjectId(file_id)}, {"processed_paths": 1}
+        )
+        if not asset:
+            raise HTTPException(status_code=404, detail="File not found")
+        return _processed_paths_response(asset.get("processed_paths"))
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting file paths: {e!s}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @files_router.get("/files/{file_id}/content")
-async def get_file_content(request: Request, file_id: str):
+async def get_file_content(request: Request, file_id: str, db: AsyncDB):
     try:
-        db = get_db()
-        if isinstance(db, dict) and "error" in db:
-            raise HTTPException(status_code=500, detail=db["error"])
         raw_assets = db["raw_assets"]
 
-        asset = raw_assets.find_one({"_id": ObjectId(file_id)})
+        asset = await raw_assets.find_one(
+            {"_id": ObjectId(file_id)}, {"status": 1, "processed_paths": 1}
+        )
         if not asset:
             raise HTTPException(status_code=404, detail="File not found")
 
@@ -263,7 +599,7 @@ async def get_file_content(request: Request, file_id: str):
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error getting file content: {str(e)}")
+        logger.error(f"Error getting file content: {e!s}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -271,16 +607,15 @@ logger = logging.getLogger(__name__)
 
 
 @files_router.get("/files/{file_id}/tables/metadata")
-async def get_file_tables_metadata(file_id: str):
+async def get_file_tables_metadata(file_id: str, db: AsyncDB):
     """Get metadata for all tables in a file"""
     try:
         logger.debug(f"Fetching table metadata for file {file_id}")
-        db = get_db()
-        if isinstance(db, dict) and "error" in db:
-            raise HTTPException(status_code=500, detail=db["error"])
         raw_assets = db["raw_assets"]
 
-        asset = raw_assets.find_one({"_id": ObjectId(file_id)})
+        asset = await raw_assets.find_one(
+            {"_id": ObjectId(file_id)}, {"processed_paths.tables": 1}
+        )
         if not asset:
             logger.error(f"File not found: {file_id}")
             raise HTTPException(status_code=404, detail="File not found")
@@ -316,27 +651,26 @@ async def get_file_tables_metadata(file_id: str):
 
                 return metadata
         except json.JSONDecodeError as e:
-            logger.error(f"Error parsing metadata JSON: {str(e)}")
+            logger.error(f"Error parsing metadata JSON: {e!s}")
             raise HTTPException(status_code=500, detail="Error reading table metadata")
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error serving table metadata: {str(e)}", exc_info=True)
+        logger.error(f"Error serving table metadata: {e!s}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @files_router.get("/files/{file_id}/tables/{table_name}")
-async def get_file_table(file_id: str, table_name: str):
+async def get_file_table(file_id: str, table_name: str, db: AsyncDB):
     """Get a specific table's content"""
     try:
         logger.debug(f"Fetching table {table_name} for file {file_id}")
-        db = get_db()
-        if isinstance(db, dict) and "error" in db:
-            raise HTTPException(status_code=500, detail=db["error"])
         raw_assets = db["raw_assets"]
 
-        asset = raw_assets.find_one({"_id": ObjectId(file_id)})
+        asset = await raw_assets.find_one(
+            {"_id": ObjectId(file_id)}, {"processed_paths.tables": 1}
+        )
         if not asset:
             logger.error(f"File not found: {file_id}")
             raise HTTPException(status_code=404, detail="File not found")
@@ -369,28 +703,27 @@ async def get_file_table(file_id: str, table_name: str):
                 logger.debug(f"Successfully read table content ({len(content)} bytes)")
                 return {"content": content}
         except Exception as e:
-            logger.error(f"Error reading CSV file: {str(e)}")
+            logger.error(f"Error reading CSV file: {e!s}")
             raise HTTPException(status_code=500, detail="Error reading table content")
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error serving table: {str(e)}")
+        logger.error(f"Error serving table: {e!s}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @files_router.get("/files/{file_id}/images/{image_name}")
-async def get_file_image(file_id: str, image_name: str):
+async def get_file_image(file_id: str, image_name: str, db: AsyncDB):
     """Get a specific image from a file"""
     try:
-        db = get_db()
-        if isinstance(db, dict) and "error" in db:
-            raise HTTPException(status_code=500, detail=db["error"])
         raw_assets = db["raw_assets"]
 
         from bson import ObjectId
 
-        asset = raw_assets.find_one({"_id": ObjectId(file_id)})
+        asset = await raw_assets.find_one(
+            {"_id": ObjectId(file_id)}, {"processed_paths.images": 1}
+        )
         if not asset:
             raise HTTPException(status_code=404, detail="File not found")
 
@@ -411,5 +744,5 @@ async def get_file_image(file_id: str, image_name: str):
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error serving image: {str(e)}")
+        logger.error(f"Error serving image: {e!s}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,11 +1,24 @@
 import logging
 from datetime import datetime
-from typing import List
 
-from fastapi import APIRouter, HTTPException
-from models.operations import (Implementation, ImplementationCreate, Procedure,
-                               ProcedureCreate, Tool, ToolCreate)
-from services.database import get_db
+from fastapi import APIRouter, HTTPException, Request, Response
+from models.operations import (
+    Implementation,
+    ImplementationCreate,
+    Procedure,
+    ProcedureCreate,
+    Tool,
+    ToolCreate,
+)
+from services.collection_versions import (
+    bump_collection_version,
+    collection_etag,
+    is_not_modified,
+    not_modified,
+    set_etag,
+)
+from services.database import AsyncDB
+from utils.streaming_utils import ndjson_response, wants_ndjson
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -14,34 +27,47 @@ logger = logging.getLogger(__name__)
 operations_router = APIRouter()
 
 
-@operations_router.get("/implementations", response_model=List[Implementation])
-async def get_implementations():
-    """Get all implementations"""
+@operations_router.get("/implementations", response_model=list[Implementation])
+async def get_implementations(
+    request: Request,
+    response: Response,
+    db: AsyncDB,
+):
+    """Get all implementations; streamed as NDJSON when requested via Accept"""
     try:
+        etag = await collection_etag(request, "implementations")
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+        if wants_ndjson(request):
+            return set_etag(
+                ndjson_response(
+                    db["implementations"].find({}, {"_id": 0}), Implementation
+                ),
+                etag,
+            )
+
         logger.debug("Fetching all implementations")
-        db = get_db()
-        if isinstance(db, dict) and "error" in db:
-            raise HTTPException(status_code=500, detail=db["error"])
-        implementations = list(db["implementations"].find())
+        implementations = await db["implementations"].find().to_list(length=None)
         return implementations
     except Exception as e:
-        logger.error(f"Error fetching implementations: {str(e)}")
+        logger.error(f"Error fetching implementations: {e!s}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @operations_router.post("/implementations", response_model=Implementation)
-async def create_implementation(implementation: ImplementationCreate):
+async def create_implementation(
+    implementation: ImplementationCreate,
+    db: AsyncDB,
+):
     """Create a new implementation"""
     try:
         logger.debug(f"Creating implementation: {implementation.name}")
-        db = get_db()
-        if isinstance(db, dict) and "error" in db:
-            raise HTTPException(status_code=500, detail=db["error"])
 
-        if db["implementations"].find_one({"name": implementation.name}):
+        if await db["implementations"].find_one({"name": implementation.name}):
             raise HTTPException(status_code=400, detail="Implementation already exists")
 
-        if not db["concepts"].find_one({"name": implementation.concept}):
+        if not await db["concepts"].find_one({"name": implementation.concept}):
             raise HTTPException(
                 status_code=400, detail="Referenced concept does not exist"
             )
@@ -49,8 +75,9 @@ async def create_implementation(implementation: ImplementationCreate):
         implementation_dict = implementation.model_dump()
         implementation_dict["created_at"] = datetime.now().strftime("%Y-%m-%d")
 
-        result = db["implementations"].insert_one(implementation_dict)
-        created_implementation = db["implementations"].find_one(
+        result = await db["implementations"].insert_one(implementation_dict)
+        await bump_collection_version("implementations")
+        created_implementation = await db["implementations"].find_one(
             {"_id": result.inserted_id}
         )
         created_implementation.pop("_id")
@@ -58,19 +85,16 @@ async def create_implementation(implementation: ImplementationCreate):
     except HTTPException as he:
         raise he
     except Exception as e:
-        logger.error(f"Error creating implementation: {str(e)}")
+        logger.error(f"Error creating implementation: {e!s}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @operations_router.get("/implementations/{name}", response_model=Implementation)
-async def get_implementation(name: str):
+async def get_implementation(name: str, db: AsyncDB):
     """Get a specific implementation"""
     try:
         logger.debug(f"Fetching implementation: {name}")
-        db = get_db()
-        if isinstance(db, dict) and "error" in db:
-            raise HTTPException(status_code=500, detail=db["error"])
-        implementation = db["implementations"].find_one({"name": name})
+        implementation = await db["implementations"].find_one({"name": name})
         if not implementation:
             raise HTTPException(status_code=404, detail="Implementation not found")
         implementation.pop("_id")
@@ -78,40 +102,47 @@ async def get_implementation(name: str):
     except HTTPException as he:
         raise he
     except Exception as e:
-        logger.error(f"Error fetching implementation: {str(e)}")
+        logger.error(f"Error fetching implementation: {e!s}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@operations_router.get("/procedures", response_model=List[Procedure])
-async def get_procedures():
-    """Get all procedures"""
+@operations_router.get("/procedures", response_model=list[Procedure])
+async def get_procedures(
+    request: Request,
+    response: Response,
+    db: AsyncDB,
+):
+    """Get all procedures; streamed as NDJSON when requested via Accept"""
     try:
+        etag = await collection_etag(request, "procedures")
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+        if wants_ndjson(request):
+            return set_etag(
+                ndjson_response(db["procedures"].find({}, {"_id": 0}), Procedure), etag
+            )
+
         logger.debug("Fetching all procedures")
-        db = get_db()
-        if isinstance(db, dict) and "error" in db:
-            raise HTTPException(status_code=500, detail=db["error"])
-        procedures = list(db["procedures"].find())
+        procedures = await db["procedures"].find().to_list(length=None)
         for proc in procedures:
             proc.pop("_id")
         return procedures
     except Exception as e:
-        logger.error(f"Error fetching procedures: {str(e)}")
+        logger.error(f"Error fetching procedures: {e!s}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @operations_router.post("/procedures", response_model=Procedure)
-async def create_procedure(procedure: ProcedureCreate):
+async def create_procedure(procedure: ProcedureCreate, db: AsyncDB):
     """Create a new procedure"""
     try:
         logger.debug(f"Creating procedure: {procedure.name}")
-        db = get_db()
-        if isinstance(db, dict) and "error" in db:
-            raise HTTPException(status_code=500, detail=db["error"])
 
-        if db["procedures"].find_one({"name": procedure.name}):
+        if await db["procedures"].find_one({"name": procedure.name}):
             raise HTTPException(status_code=400, detail="Procedure already exists")
 
-        if not db["concepts"].find_one({"name": procedure.concept}):
+        if not await db["concepts"].find_one({"name": procedure.concept}):
             raise HTTPException(
                 status_code=400, detail="Referenced concept does not exist"
             )
@@ -119,48 +150,56 @@ async def create_procedure(procedure: ProcedureCreate):
         procedure_dict = procedure.model_dump()
         procedure_dict["created_at"] = datetime.now().strftime("%Y-%m-%d")
 
-        result = db["procedures"].insert_one(procedure_dict)
-        created_procedure = db["procedures"].find_one({"_id": result.inserted_id})
+        result = await db["procedures"].insert_one(procedure_dict)
+        await bump_collection_version("procedures")
+        created_procedure = await db["procedures"].find_one({"_id": result.inserted_id})
         created_procedure.pop("_id")
         return created_procedure
     except HTTPException as he:
         raise he
     except Exception as e:
-        logger.error(f"Error creating procedure: {str(e)}")
+        logger.error(f"Error creating procedure: {e!s}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@operations_router.get("/tools", response_model=List[Tool])
-async def get_tools():
-    """Get all tools"""
+@operations_router.get("/tools", response_model=list[Tool])
+async def get_tools(
+    request: Request,
+    response: Response,
+    db: AsyncDB,
+):
+    """Get all tools; streamed as NDJSON when requested via Accept"""
     try:
+        etag = await collection_etag(request, "tools")
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+        if wants_ndjson(request):
+            return set_etag(
+                ndjson_response(db["tools"].find({}, {"_id": 0}), Tool), etag
+            )
+
         logger.debug("Fetching all tools")
-        db = get_db()
-        if isinstance(db, dict) and "error" in db:
-            raise HTTPException(status_code=500, detail=db["error"])
-        tools = list(db["tools"].find())
+        tools = await db["tools"].find().to_list(length=None)
         for tool in tools:
             tool.pop("_id")
         return tools
     except Exception as e:
-        logger.error(f"Error fetching tools: {str(e)}")
+        logger.error(f"Error fetching tools: {e!s}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @operations_router.post("/tools", response_model=Tool)
-async def create_tool(tool: ToolCreate):
+async def create_tool(tool: ToolCreate, db: AsyncDB):
     """Create a new tool"""
     try:
         logger.debug(f"Creating tool: {tool.name}")
-        db = get_db()
-        if isinstance(db, dict) and "error" in db:
-            raise HTTPException(status_code=500, detail=db["error"])
 
-        if db["tools"].find_one({"name": tool.name}):
+        if await db["tools"].find_one({"name": tool.name}):
             raise HTTPException(status_code=400, detail="Tool already exists")
 
         for concept in tool.concepts:
-            if not db["concepts"].find_one({"name": concept}):
+            if not await db["concepts"].find_one({"name": concept}):
                 raise HTTPException(
                     status_code=400,
                     detail=f"Referenced concept does not exist: {concept}",
@@ -169,38 +208,40 @@ async def create_tool(tool: ToolCreate):
         tool_dict = tool.model_dump()
         tool_dict["created_at"] = datetime.now().strftime("%Y-%m-%d")
 
-        result = db["tools"].insert_one(tool_dict)
-        created_tool = db["tools"].find_one({"_id": result.inserted_id})
+        result = await db["tools"].insert_one(tool_dict)
+        await bump_collection_version("tools")
+        created_tool = await db["tools"].find_one({"_id": result.inserted_id})
         created_tool.pop("_id")
         return created_tool
     except HTTPException as he:
         raise he
     except Exception as e:
-        logger.error(f"Error creating tool: {str(e)}")
+        logger.error(f"Error creating tool: {e!s}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @operations_router.get("/concepts/{concept_name}/operations")
-async def get_operations_by_concept(concept_name: str):
+async def get_operations_by_concept(concept_name: str, db: AsyncDB):
     """Get all operational elements related to a specific concept"""
     try:
         logger.debug(f"Fetching operations for concept: {concept_name}")
-        db = get_db()
-        if isinstance(db, dict) and "error" in db:
-            raise HTTPException(status_code=500, detail=db["error"])
 
-        if not db["concepts"].find_one({"name": concept_name}):
+        if not await db["concepts"].find_one({"name": concept_name}):
             raise HTTPException(status_code=404, detail="Concept not found")
 
-        implementations = list(db["implementations"].find({"concept": concept_name}))
+        implementations = await (
+            db["implementations"].find({"concept": concept_name}).to_list(length=None)
+        )
         for impl in implementations:
             impl.pop("_id")
 
-        procedures = list(db["procedures"].find({"concept": concept_name}))
+        procedures = await (
+            db["procedures"].find({"concept": concept_name}).to_list(length=None)
+        )
         for proc in procedures:
             proc.pop("_id")
 
-        tools = list(db["tools"].find({"concepts": concept_name}))
+        tools = await db["tools"].find({"concepts": concept_name}).to_list(length=None)
         for tool in tools:
             tool.pop("_id")
 
@@ -212,5 +253,5 @@ async def get_operations_by_concept(concept_name: str):
     except HTTPException as he:
         raise he
     except Exception as e:
-        logger.error(f"Error fetching operations for concept: {str(e)}")
+        logger.error(f"Error fetching operations for concept: {e!s}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,12 +1,23 @@
 import logging
 from datetime import datetime
-from typing import List
 
 import networkx as nx
-from fastapi import APIRouter, HTTPException
-from models.relationships import (Relationship, RelationshipCreate,
-                                  RelationshipMetrics, RelationshipUpdate)
-from services.database import get_db
+from fastapi import APIRouter, HTTPException, Request, Response
+from models.relationships import (
+    Relationship,
+    RelationshipCreate,
+    RelationshipMetrics,
+    RelationshipUpdate,
+)
+from services.collection_versions import (
+    bump_collection_version,
+    collection_etag,
+    is_not_modified,
+    not_modified,
+    set_etag,
+)
+from services.database import AsyncDB
+from utils.streaming_utils import ndjson_response, wants_ndjson
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -15,18 +26,29 @@ logger = logging.getLogger(__name__)
 relationships_router = APIRouter()
 
 
-@relationships_router.get("/relationships", response_model=List[Relationship])
-async def get_relationships():
-    """Get all relationships"""
+@relationships_router.get("/relationships", response_model=list[Relationship])
+async def get_relationships(
+    request: Request,
+    response: Response,
+    db: AsyncDB,
+):
+    """Get all relationships; streamed as NDJSON when requested via Accept"""
     try:
+        etag = await collection_etag(request, "relationships")
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+        if wants_ndjson(request):
+            return set_etag(
+                ndjson_response(db["relationships"].find({}, {"_id": 0}), Relationship),
+                etag,
+            )
+
         logger.debug("Attempting to fetch relationships from MongoDB")
-        db = get_db()
-        if isinstance(db, dict) and "error" in db:
-            raise HTTPException(status_code=500, detail=db["error"])
         relationships_collection = db["relationships"]
 
         relationships = []
-        for rel in relationships_collection.find():
+        async for rel in relationships_collection.find():
             relationship_dict = {
                 "source": rel["source"],
                 "target": rel["target"],
@@ -41,23 +63,20 @@ async def get_relationships():
         return relationships
 
     except Exception as e:
-        logger.error(f"Error fetching relationships: {str(e)}")
+        logger.error(f"Error fetching relationships: {e!s}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @relationships_router.post("/relationships", response_model=Relationship)
-async def create_relationship(relationship: RelationshipCreate):
+async def create_relationship(relationship: RelationshipCreate, db: AsyncDB):
     """Create a new relationship"""
     try:
         logger.debug(
             f"Attempting to create relationship between {relationship.source} and {relationship.target}"
         )
-        db = get_db()
-        if isinstance(db, dict) and "error" in db:
-            raise HTTPException(status_code=500, detail=db["error"])
         relationships_collection = db["relationships"]
 
-        existing = relationships_collection.find_one(
+        existing = await relationships_collection.find_one(
             {
                 "$or": [
                     {"source": relationship.source, "target": relationship.target},
@@ -71,10 +90,11 @@ async def create_relationship(relationship: RelationshipCreate):
         relationship_dict = relationship.model_dump()
         relationship_dict["created_at"] = datetime.now().strftime("%Y-%m-%d")
 
-        result = relationships_collection.insert_one(relationship_dict)
+        result = await relationships_collection.insert_one(relationship_dict)
+        await bump_collection_version("relationships")
         logger.debug(f"Created relationship with ID: {result.inserted_id}")
 
-        created_relationship = relationships_collection.find_one(
+        created_relationship = await relationships_collection.find_one(
             {"_id": result.inserted_id}
         )
         created_relationship.pop("_id")
@@ -83,21 +103,26 @@ async def create_relationship(relationship: RelationshipCreate):
     except HTTPException as he:
         raise he
     except Exception as e:
-        logger.error(f"Error creating relationship: {str(e)}")
+        logger.error(f"Error creating relationship: {e!s}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @relationships_router.get("/relationships/metrics", response_model=RelationshipMetrics)
-async def get_relationship_metrics():
+async def get_relationship_metrics(
+    request: Request,
+    response: Response,
+    db: AsyncDB,
+):
     """Get relationship network metrics"""
     try:
+        etag = await collection_etag(request, "relationships")
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
         logger.debug("Calculating relationship metrics")
-        db = get_db()
-        if isinstance(db, dict) and "error" in db:
-            raise HTTPException(status_code=500, detail=db["error"])
         relationships_collection = db["relationships"]
 
-        relationships = list(relationships_collection.find())
+        relationships = await relationships_collection.find().to_list(length=None)
 
         if not relationships:
             return RelationshipMetrics(
@@ -119,7 +144,7 @@ async def get_relationship_metrics():
         )
 
     except Exception as e:
-        logger.error(f"Error calculating metrics: {str(e)}")
+        logger.error(f"Error calculating metrics: {e!s}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -127,14 +152,14 @@ async def get_relationship_metrics():
     "/relationships/{source}/{target}", response_model=Relationship
 )
 async def update_relationship(
-    source: str, target: str, relationship: RelationshipUpdate
+    source: str,
+    target: str,
+    relationship: RelationshipUpdate,
+    db: AsyncDB,
 ):
     """Update a relationship"""
     try:
         logger.debug(f"Attempting to update relationship between {source} and {target}")
-        db = get_db()
-        if isinstance(db, dict) and "error" in db:
-            raise HTTPException(status_code=500, detail=db["error"])
         relationships_collection = db["relationships"]
 
         update_data = {
@@ -143,7 +168,7 @@ async def update_relationship(
         if not update_data:
             raise HTTPException(status_code=400, detail="No valid update data provided")
 
-        result = relationships_collection.update_one(
+        result = await relationships_collection.update_one(
             {
                 "$or": [
                     {"source": source, "target": target},
@@ -155,8 +180,9 @@ async def update_relationship(
 
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Relationship not found")
+        await bump_collection_version("relationships")
 
-        updated_relationship = relationships_collection.find_one(
+        updated_relationship = await relationships_collection.find_one(
             {
                 "$or": [
                     {"source": source, "target": target},
@@ -170,21 +196,18 @@ async def update_relationship(
     except HTTPException as he:
         raise he
     except Exception as e:
-        logger.error(f"Error updating relationship: {str(e)}")
+        logger.error(f"Error updating relationship: {e!s}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @relationships_router.delete("/relationships/{source}/{target}")
-async def delete_relationship(source: str, target: str):
+async def delete_relationship(source: str, target: str, db: AsyncDB):
     """Delete a relationship"""
     try:
         logger.debug(f"Attempting to delete relationship between {source} and {target}")
-        db = get_db()
-        if isinstance(db, dict) and "error" in db:
-            raise HTTPException(status_code=500, detail=db["error"])
         relationships_collection = db["relationships"]
 
-        result = relationships_collection.delete_one(
+        result = await relationships_collection.delete_one(
             {
                 "$or": [
                     {"source": source, "target": target},
@@ -195,11 +218,12 @@ async def delete_relationship(source: str, target: str):
 
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Relationship not found")
+        await bump_collection_version("relationships")
 
         return {"message": "Relationship deleted successfully"}
 
     except HTTPException as he:
         raise he
     except Exception as e:
-        logger.error(f"Error deleting relationship: {str(e)}")
+        logger.error(f"Error deleting relationship: {e!s}")
         raise HTTPException(status_code=500, detail=str(e))
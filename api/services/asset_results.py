@@ -0,0 +1,47 @@
+import logging
+from collections.abc import Iterable
+from datetime import datetime
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# Bulky per-asset analysis results live outside raw_assets, one collection per
+# kind and one document per asset (_id is the file hash).
+RESULT_COLLECTIONS = {
+    "lexemes": "asset_lexemes",
+    "definitions": "asset_definitions",
+    "splitting": "asset_splitting",
+    "metadata": "asset_metadata",
+}
+
+
+def result_collection(db, kind: str):
+    """Return the collection holding results of the given kind"""
+    if kind not in RESULT_COLLECTIONS:
+        raise ValueError(f"Unknown asset result kind: {kind}")
+    return db[RESULT_COLLECTIONS[kind]]
+
+
+async def save_asset_result(db, file_hash: str, kind: str, data: Any):
+    """Store (replace) an asset's result of the given kind"""
+    await result_collection(db, kind).replace_one(
+        {"_id": file_hash},
+        {"file_hash": file_hash, "data": data, "updated_at": datetime.now()},
+        upsert=True,
+    )
+
+
+async def get_asset_result(db, file_hash: str, kind: str, default: Any = None) -> Any:
+    """Load an asset's result of the given kind"""
+    doc = await result_collection(db, kind).find_one({"_id": file_hash}, {"data": 1})
+    return doc["data"] if doc else default
+
+
+async def get_asset_results(
+    db, file_hashes: Iterable[str], kind: str
+) -> dict[str, Any]:
+    """Load results of one kind for many assets in a single query"""
+    cursor = result_collection(db, kind).find(
+        {"_id": {"$in": list(file_hashes)}}, {"data": 1}
+    )
+    return {doc["_id"]: doc["data"] async for doc in cursor}
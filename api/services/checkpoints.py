@@ -0,0 +1,64 @@
+# api/services/checkpoints.py
+
+import logging
+from datetime import datetime
+from typing import Any
+
+from services.llm_batches import batch_calls_pending
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINTS_COLLECTION = "pipeline_checkpoints"
+
+
+class StageCheckpoints:
+    """Per-item results of one stage in one run, so a retried job resumes
+    from the first unfinished item instead of paying for every item again"""
+
+    def __init__(self, db, run_id: str, stage: str, file_hash: str):
+        self.collection = db[CHECKPOINTS_COLLECTION]
+        self.run_id = run_id
+        self.stage = stage
+        self.file_hash = file_hash
+
+    def _id(self, item: str) -> str:
+        return f"{self.run_id}:{self.stage}:{self.file_hash}:{item}"
+
+    def _filter(self) -> dict[str, str]:
+        # Run ids are not unique to one asset (batch runs, re-runs)
+        return {"run_id": self.run_id, "stage": self.stage, "file_hash": self.file_hash}
+
+    async def load(self) -> dict[str, Any]:
+        """Results already checkpointed for this run and asset, keyed by item"""
+        results = {}
+        async for doc in self.collection.find(self._filter(), {"item": 1, "result": 1}):
+            results[doc["item"]] = doc["result"]
+        if results:
+            logger.info(
+                f"Resuming {self.stage} for {self.file_hash} with "
+                f"{len(results)} checkpointed items"
+            )
+        return results
+
+    async def save(self, item: str, result: Any):
+        if batch_calls_pending():
+            # Built from placeholder responses; the resumed stage redoes it
+            return
+        await self.collection.replace_one(
+            {"_id": self._id(item)},
+            {
+                "run_id": self.run_id,
+                "stage": self.stage,
+                "file_hash": self.file_hash,
+                "item": item,
+                "result": result,
+                "created_at": datetime.now(),
+            },
+            upsert=True,
+        )
+
+    async def clear(self):
+        """Drop the checkpoints once the stage's own outputs are written"""
+        if batch_calls_pending():
+            return  # The stage is not done; it resumes from these
+        await self.collection.delete_many(self._filter())
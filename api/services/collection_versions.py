@@ -0,0 +1,72 @@
+import hashlib
+import logging
+import uuid
+
+from fastapi import Request, Response
+from services.queue import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+VERSION_PREFIX = "collection_version"
+# Regenerated whenever Redis loses its data, so restarted counters can never
+# reproduce an ETag that was handed out before.
+EPOCH_KEY = f"{VERSION_PREFIX}:epoch"
+
+
+async def bump_collection_version(*collections: str):
+    """Mark collections as changed; call after every successful write"""
+    try:
+        pipeline = get_async_redis().pipeline(transaction=False)
+        for collection in collections:
+            pipeline.incr(f"{VERSION_PREFIX}:{collection}")
+        await pipeline.execute()
+    except Exception as e:
+        logger.warning(f"Failed to bump version of {collections}: {e!s}")
+
+
+async def collection_etag(request: Request, *collections: str) -> str | None:
+    """Strong ETag for a response derived only from the given collections.
+
+    Call it before reading the data, so a racing write can only make the ETag
+    stale, never newer than the body. Returns None when Redis is unavailable,
+    in which case callers serve the response without validators.
+    """
+    try:
+        redis = get_async_redis()
+        await redis.set(EPOCH_KEY, uuid.uuid4().hex, nx=True)
+        values = await redis.mget(
+            [EPOCH_KEY] + [f"{VERSION_PREFIX}:{c}" for c in collections]
+        )
+    except Exception as e:
+        logger.warning(f"Failed to read versions of {collections}: {e!s}")
+        return None
+
+    epoch, *versions = [(v or b"0").decode() for v in values]
+    key = "|".join(
+        [
+            request.url.path,
+            str(request.url.query),
+            request.headers.get("accept", ""),
+            epoch,
+            *(f"{c}={v}" for c, v in zip(collections, versions)),
+        ]
+    )
+    return f'"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
+
+
+def is_not_modified(request: Request, etag: str | None) -> bool:
+    if not etag:
+        return False
+    if_none_match = request.headers.get("if-none-match", "")
+    return etag in [tag.strip() for tag in if_none_match.split(",")]
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Vary": "Accept"})
+
+
+def set_etag(response: Response, etag: str | None) -> Response:
+    if etag:
+        response.headers["ETag"] = etag
+        response.headers["Vary"] = "Accept"
+    return response
@@ -1,13 +1,178 @@
+import asyncio
+import logging
 import os
+import threading
+import weakref
+from typing import Annotated
 
-from pymongo import MongoClient
+from fastapi import Depends
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import MongoClient, monitoring
 
+logger = logging.getLogger(__name__)
 
-def get_db():
+DATABASE_NAME = "chelle"
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+# Motor clients are bound to the event loop they were first used on, so keep
+# one per loop (the API has a single loop; workers may run several).
+_async_clients = weakref.WeakKeyDictionary()
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Track checked-out and waiting connections across the client's pools"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked_out = 0
+        self.waiting = 0
+        self.created = 0
+        self.closed = 0
+        self.checkout_failures = 0
+
+    def _adjust(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def connection_check_out_started(self, event):
+        self._adjust(waiting=1)
+
+    def connection_check_out_failed(self, event):
+        self._adjust(waiting=-1, checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        self._adjust(waiting=-1, checked_out=1)
+
+    def connection_checked_in(self, event):
+        self._adjust(checked_out=-1)
+
+    def connection_created(self, event):
+        self._adjust(created=1)
+
+    def connection_closed(self, event):
+        self._adjust(closed=1)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checked_out": self.checked_out,
+                "waiting": self.waiting,
+                "open": self.created - self.closed,
+                "created": self.created,
+                "closed": self.closed,
+                "checkout_failures": self.checkout_failures,
+            }
+
+
+pool_stats = PoolStatsListener()
+
+
+def _pool_options() -> dict:
+    return {
+        "maxPoolSize": int(os.getenv("MONGODB_MAX_POOL_SIZE", "50")),
+        "minPoolSize": int(os.getenv("MONGODB_MIN_POOL_SIZE", "0")),
+        "maxIdleTimeMS": int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "300000")),
+        "event_listeners": [pool_stats],
+    }
+
+
+def connect_db() -> MongoClient:
+    """Create the process-wide pooled MongoDB client if it does not exist yet.
+
+    The client is recreated after a fork so RQ work-horses never share sockets
+    with their parent process.
+    """
+    global _client, _client_pid, pool_stats
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            return _client
+
+        pool_stats = PoolStatsListener()
+        _client = MongoClient(
+            os.getenv("MONGODB_URI", "mongodb://db:27017/"), **_pool_options()
+        )
+        _client_pid = os.getpid()
+        logger.info("Created pooled MongoDB client")
+        return _client
+
+
+def close_db():
+    """Close the process-wide MongoDB client and this loop's async client"""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+            logger.info("Closed pooled MongoDB client")
+        _client = None
+        _client_pid = None
+
+    close_async_db()
+
+
+def close_async_db():
+    """Close the async MongoDB client bound to the running event loop, if any"""
     try:
-        client = MongoClient(os.getenv("MONGODB_URI", "mongodb://db:27017/"))
-        db = client["chelle"]
-        client.admin.command("ping")
-        return db
-    except Exception as e:
-        return {"error": str(e)}
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    async_client = _async_clients.pop(loop, None)
+    if async_client is not None:
+        async_client.close()
+        logger.info("Closed async MongoDB client")
+
+
+def connect_async_db() -> AsyncIOMotorClient:
+    """Return the async MongoDB client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        connect_db()  # make sure pool_stats belongs to this process
+        client = AsyncIOMotorClient(
+            os.getenv("MONGODB_URI", "mongodb://db:27017/"),
+            io_loop=loop,
+            **_pool_options(),
+        )
+        _async_clients[loop] = client
+        logger.info("Created async MongoDB client")
+    return client
+
+
+def get_db():
+    """Return the shared database handle; usable as a FastAPI dependency"""
+    return connect_db()[DATABASE_NAME]
+
+
+async def get_async_db():
+    """Return the async database handle; usable as a FastAPI dependency"""
+    return connect_async_db()[DATABASE_NAME]
+
+
+# Route parameter type that has FastAPI inject the async database
+AsyncDB = Annotated[AsyncIOMotorDatabase, Depends(get_async_db)]
+
+
+def get_pool_stats() -> dict:
+    """Return connection pool statistics for the shared client"""
+    stats = pool_stats.snapshot()
+    stats["max_pool_size"] = int(os.getenv("MONGODB_MAX_POOL_SIZE", "50"))
+    stats["connected"] = _client is not None and _client_pid == os.getpid()
+    return stats
@@ -0,0 +1,70 @@
+# api/services/events.py
+
+import json
+import logging
+import os
+from collections.abc import AsyncIterator, Iterable
+from datetime import datetime
+
+from services.queue import get_async_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+ASSET_EVENTS_CHANNEL = "events:assets"
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+
+
+def _event_message(event_type: str, file_hash: str, **fields) -> str:
+    event = {
+        "type": event_type,
+        "file_hash": file_hash,
+        "timestamp": datetime.now().isoformat(),
+    }
+    event.update({key: value for key, value in fields.items() if value is not None})
+    return json.dumps(event, default=str)
+
+
+def publish_asset_event(event_type: str, file_hash: str, **fields):
+    """Publish a pipeline event for an asset to every subscribed client"""
+    try:
+        get_redis().publish(
+            ASSET_EVENTS_CHANNEL, _event_message(event_type, file_hash, **fields)
+        )
+    except Exception as e:
+        logger.warning(f"Failed to publish {event_type} event: {e!s}")
+
+
+async def publish_asset_event_async(event_type: str, file_hash: str, **fields):
+    """Async variant of publish_asset_event"""
+    try:
+        await get_async_redis().publish(
+            ASSET_EVENTS_CHANNEL, _event_message(event_type, file_hash, **fields)
+        )
+    except Exception as e:
+        logger.warning(f"Failed to publish {event_type} event: {e!s}")
+
+
+async def asset_events(
+    file_hashes: Iterable[str] | None = None,
+    run_ids: Iterable[str] | None = None,
+) -> AsyncIterator[dict | None]:
+    """Yield published events matching the filters, and None as a heartbeat
+    whenever nothing arrived for EVENTS_HEARTBEAT_SECONDS"""
+    file_hashes = set(file_hashes or [])
+    run_ids = set(run_ids or [])
+    pubsub = get_async_redis().pubsub(ignore_subscribe_messages=True)
+    await pubsub.subscribe(ASSET_EVENTS_CHANNEL)
+    try:
+        while True:
+            message = await pubsub.get_message(timeout=EVENTS_HEARTBEAT_SECONDS)
+            if message is None:
+                yield None
+                continue
+            event = json.loads(message["data"])
+            if file_hashes and event["file_hash"] not in file_hashes:
+                continue
+            if run_ids and event.get("run_id") not in run_ids:
+                continue
+            yield event
+    finally:
+        await pubsub.aclose()
@@ -0,0 +1,272 @@
+# api/services/llm_batches.py
+
+import asyncio
+import json
+import logging
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+from config.chat_config import current_provider
+from services.database import get_async_db
+from services.llm_cache import cache_completion
+from services.llm_clients import get_llm_client
+from services.queue import get_async_redis, get_redis
+from services.token_usage import llm_usage_context, record_token_usage
+
+logger = logging.getLogger(__name__)
+
+# "interactive" sends each LLM call as it is made; "batch" lets stages that
+# support it submit their calls to the provider's batch API instead
+LLM_EXECUTION_MODE = os.getenv("LLM_EXECUTION_MODE", "interactive")
+LLM_EXECUTION_MODES = ("interactive", "batch")
+LLM_BATCH_COMPLETION_WINDOW = os.getenv("LLM_BATCH_COMPLETION_WINDOW", "24h")
+# Submissions allowed for one stage of one run before it is failed; each
+# round only submits the calls that depend on the previous round's results
+LLM_BATCH_MAX_ROUNDS = int(os.getenv("LLM_BATCH_MAX_ROUNDS", "5"))
+LLM_BATCH_RESULT_TTL_SECONDS = 14 * 24 * 3600
+RUN_STATE_TTL = int(os.getenv("PIPELINE_RUN_STATE_TTL", str(7 * 24 * 3600)))
+
+LLM_BATCHES_COLLECTION = "llm_batches"
+LLM_BATCH_RESULTS_COLLECTION = "llm_batch_results"
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_PENDING = "batch_pending"
+# Refreshed by whichever worker polls for finished batches
+POLLER_HEARTBEAT_KEY = "llm_batches:poller_heartbeat"
+
+# Provider batch states that will not change any more
+TERMINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+
+
+class LLMBatchPending(Exception):
+    """Raised by an LLM call whose result will come from a provider batch"""
+
+
+class BatchCollector:
+    """LLM requests a stage deferred to a provider batch in this attempt"""
+
+    def __init__(self):
+        self.requests: dict[str, dict] = {}
+
+    @property
+    def pending(self) -> bool:
+        return bool(self.requests)
+
+
+_batch_collector: ContextVar[BatchCollector | None] = ContextVar(
+    "llm_batch_collector", default=None
+)
+
+
+@contextmanager
+def llm_batch_collection():
+    """Defer the LLM calls made inside the block to a provider batch"""
+    collector = BatchCollector()
+    token = _batch_collector.set(collector)
+    try:
+        yield collector
+    finally:
+        _batch_collector.reset(token)
+
+
+def current_batch_collector() -> BatchCollector | None:
+    return _batch_collector.get()
+
+
+def batch_calls_pending() -> bool:
+    """Whether the running stage has deferred calls, so its results are partial"""
+    collector = _batch_collector.get()
+    return collector is not None and collector.pending
+
+
+def _run_mode_key(run_id: str) -> str:
+    return f"pipeline:{run_id}:llm_mode"
+
+
+def set_run_llm_mode(run_id: str, mode: str):
+    """Record how a pipeline run's stages should make their LLM calls"""
+    get_redis().set(_run_mode_key(run_id), mode, ex=RUN_STATE_TTL)
+
+
+def mark_batch_poller_alive(ttl: int):
+    get_redis().set(POLLER_HEARTBEAT_KEY, 1, ex=ttl)
+
+
+def batch_poller_alive() -> bool:
+    """Whether a worker is polling for finished batches to resume stages"""
+    return bool(get_redis().exists(POLLER_HEARTBEAT_KEY))
+
+
+def _provider_unsupported() -> str | None:
+    if current_provider() != "openai":
+        return f"LLM batch mode needs the OpenAI provider, not {current_provider()}"
+    return None
+
+
+def batch_mode_unavailable() -> str | None:
+    """Why a run cannot use batch mode right now, or None if it can"""
+    if reason := _provider_unsupported():
+        return reason
+    if not batch_poller_alive():
+        return "No worker is polling LLM batches; batch mode unavailable"
+    return None
+
+
+async def run_llm_mode(run_id: str | None) -> str:
+    redis_conn = get_async_redis()
+    mode = await redis_conn.get(_run_mode_key(run_id)) if run_id else None
+    mode = mode.decode() if mode else LLM_EXECUTION_MODE
+    if mode != "batch":
+        return mode
+
+    reason = _provider_unsupported()
+    if not reason and not await redis_conn.exists(POLLER_HEARTBEAT_KEY):
+        # A batched stage would never be resumed
+        reason = "No LLM batch poller running"
+    if reason:
+        logger.warning(f"{reason}; {run_id} calls interactively")
+        if run_id:
+            # So the run reports the mode its calls actually use
+            await redis_conn.set(_run_mode_key(run_id), "interactive", ex=RUN_STATE_TTL)
+        return "interactive"
+    return mode
+
+
+async def batched_completion(key: str, body: dict) -> str:
+    """Result of a request from a finished batch, else queue it for the next one"""
+    db = await get_async_db()
+    result = await db[LLM_BATCH_RESULTS_COLLECTION].find_one({"_id": key})
+    if result is not None:
+        return result["text"]
+    _batch_collector.get().requests[key] = body
+    raise LLMBatchPending("LLM call deferred to a provider batch")
+
+
+async def submit_stage_batch(
+    collector: BatchCollector, file_hash: str, run_id: str, stage: str
+) -> str:
+    """Send a stage's deferred calls to the provider as one batch"""
+    db = await get_async_db()
+    rounds = await db[LLM_BATCHES_COLLECTION].count_documents(
+        {"run_id": run_id, "stage": stage}
+    )
+    if rounds >= LLM_BATCH_MAX_ROUNDS:
+        raise Exception(
+            f"{stage} still has {len(collector.requests)} calls outstanding "
+            f"after {rounds} batches"
+        )
+
+    lines = [
+        json.dumps(
+            {"custom_id": key, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+        )
+        for key, body in collector.requests.items()
+    ]
+    client = get_llm_client()
+    upload = await client.files.create(
+        file=(f"{stage}-{run_id}.jsonl", "\n".join(lines).encode()), purpose="batch"
+    )
+    batch = await client.batches.create(
+        input_file_id=upload.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=LLM_BATCH_COMPLETION_WINDOW,
+        metadata={"file_hash": file_hash, "run_id": run_id, "stage": stage},
+    )
+    await db[LLM_BATCHES_COLLECTION].insert_one(
+        {
+            "_id": batch.id,
+            "file_hash": file_hash,
+            "run_id": run_id,
+            "stage": stage,
+            "status": "submitted",
+            "provider_status": batch.status,
+            "request_count": len(lines),
+            "round": rounds + 1,
+            "submitted_at": datetime.now(),
+        }
+    )
+    logger.info(f"Submitted {len(lines)} {stage} calls for {file_hash} as {batch.id}")
+    return batch.id
+
+
+async def _store_batch_results(db, client, batch, record: dict) -> int:
+    """Save a finished batch's successful responses where stages look them up"""
+    if not batch.output_file_id:
+        return 0
+    content = await client.files.content(batch.output_file_id)
+    stored = 0
+    with llm_usage_context(
+        processor=record["stage"],
+        run_id=record["run_id"],
+        file_hash=record["file_hash"],
+    ):
+        for line in filter(None, content.text.splitlines()):
+            output = json.loads(line)
+            response = output.get("response") or {}
+            if response.get("status_code") != 200:
+                # Left out, so the resumed stage asks for it again
+                continue
+            body = response["body"]
+            text = body["choices"][0]["message"]["content"]
+            await db[LLM_BATCH_RESULTS_COLLECTION].replace_one(
+                {"_id": output["custom_id"]},
+                {"text": text, "batch_id": batch.id, "created_at": datetime.now()},
+                upsert=True,
+            )
+            await cache_completion(output["custom_id"], text)
+            usage = body.get("usage") or {}
+            await record_token_usage(
+                body.get("model", ""),
+                usage.get("prompt_tokens", 0),
+                usage.get("completion_tokens", 0),
+            )
+            stored += 1
+    return stored
+
+
+async def poll_llm_batches() -> list[str]:
+    """Collect the results of finished batches and resume the stages waiting
+    on them; returns the ids of the batches handled"""
+    # Imported lazily: jobs.assets.base imports this module
+    from jobs.assets.base import AssetProcessor
+
+    db = await get_async_db()
+    client = get_llm_client()
+    handled = []
+    async for record in db[LLM_BATCHES_COLLECTION].find({"status": "submitted"}):
+        try:
+            batch = await client.batches.retrieve(record["_id"])
+            if batch.status not in TERMINAL_STATES:
+                await db[LLM_BATCHES_COLLECTION].update_one(
+                    {"_id": record["_id"]}, {"$set": {"provider_status": batch.status}}
+                )
+                continue
+
+            stored = await _store_batch_results(db, client, batch, record)
+            await db[LLM_BATCHES_COLLECTION].update_one(
+                {"_id": record["_id"]},
+                {
+                    "$set": {
+                        "status": batch.status,
+                        "provider_status": batch.status,
+                        "result_count": stored,
+                        "completed_at": datetime.now(),
+                    }
+                },
+            )
+            logger.info(
+                f"Batch {record['_id']} {batch.status} with {stored}/"
+                f"{record['request_count']} results; resuming {record['stage']}"
+            )
+            # Calls without a result are deferred again when the stage resumes
+            await asyncio.to_thread(
+                AssetProcessor.resume_stage,
+                record["file_hash"],
+                record["stage"],
+                record["run_id"],
+            )
+            handled.append(record["_id"])
+        except Exception as e:
+            logger.error(f"Error polling batch {record['_id']}: {e!s}")
+    return handled
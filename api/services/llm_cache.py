@@ -0,0 +1,106 @@
+# api/services/llm_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import time
+
+from services.queue import get_async_redis
+from utils.metrics_utils import incr_metrics_async
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000"))
+
+ENTRY_PREFIX = "llm_cache:entry:"
+LRU_KEY = "llm_cache:lru"
+
+# Returns a cached response and marks it as recently used.
+# KEYS[1] = entry, KEYS[2] = entry hashes scored by last use (sorted set)
+# ARGV[1] = now, ARGV[2] = entry hash
+_GET = """
+local value = redis.call('GET', KEYS[1])
+if value then
+    redis.call('ZADD', KEYS[2], ARGV[1], ARGV[2])
+else
+    redis.call('ZREM', KEYS[2], ARGV[2])
+end
+return value
+"""
+
+# Stores a response, then drops expired and least recently used entries until
+# the cache is back within its bound. Returns the number of entries evicted.
+# KEYS[1] = entry, KEYS[2] = entry hashes scored by last use (sorted set)
+# ARGV[1] = response, ARGV[2] = ttl, ARGV[3] = now, ARGV[4] = max entries,
+# ARGV[5] = entry hash, ARGV[6] = entry key prefix
+_SET = """
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[5])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', tonumber(ARGV[3]) - tonumber(ARGV[2]))
+local excess = redis.call('ZCARD', KEYS[2]) - tonumber(ARGV[4])
+if excess <= 0 then
+    return 0
+end
+local evicted = redis.call('ZRANGE', KEYS[2], 0, excess - 1)
+for _, entry in ipairs(evicted) do
+    redis.call('DEL', ARGV[6] .. entry)
+end
+redis.call('ZREMRANGEBYRANK', KEYS[2], 0, excess - 1)
+return excess
+"""
+
+
+def llm_cache_key(provider: str, model: str, messages: list[dict], params: dict):
+    """Hash of everything that determines a completion"""
+    messages_hash = hashlib.sha256(
+        json.dumps(messages, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    request = {
+        "provider": provider,
+        "model": model,
+        "messages": messages_hash,
+        "params": params,
+    }
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+
+async def get_cached_completion(key: str) -> str | None:
+    """Cached response text for a request, or None on a miss"""
+    try:
+        lookup = get_async_redis().register_script(_GET)
+        value = await lookup(
+            keys=[ENTRY_PREFIX + key, LRU_KEY], args=[time.time(), key]
+        )
+    except Exception as e:
+        # The cache is an optimisation; never fail the call over it
+        logger.warning(f"LLM cache lookup failed: {e!s}")
+        return None
+    await incr_metrics_async("llm_cache", {"hit" if value is not None else "miss": 1})
+    return value.decode() if value is not None else None
+
+
+async def cache_completion(key: str, text: str):
+    """Store a response, evicting the least recently used beyond the bound"""
+    try:
+        store = get_async_redis().register_script(_SET)
+        evicted = await store(
+            keys=[ENTRY_PREFIX + key, LRU_KEY],
+            args=[
+                text,
+                LLM_CACHE_TTL_SECONDS,
+                time.time(),
+                LLM_CACHE_MAX_ENTRIES,
+                key,
+                ENTRY_PREFIX,
+            ],
+        )
+    except Exception as e:
+        logger.warning(f"Failed to cache LLM response: {e!s}")
+        return
+    counters = {"stored": 1}
+    if evicted:
+        counters["evicted"] = evicted
+    await incr_metrics_async("llm_cache", counters)
@@ -0,0 +1,67 @@
+# api/services/llm_clients.py
+
+import asyncio
+import os
+import weakref
+
+import httpx
+import openai
+from anthropic import Anthropic, AnthropicBedrock, AsyncAnthropic, AsyncAnthropicBedrock
+from config.chat_config import CURRENT_CLIENT
+
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "60"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "300"))
+
+ASYNC_ANTHROPIC_CLIENTS = {
+    Anthropic: AsyncAnthropic,
+    AnthropicBedrock: AsyncAnthropicBedrock,
+}
+
+# Like Motor and Redis, httpx connection pools are bound to the loop they were
+# created on
+_clients = weakref.WeakKeyDictionary()
+
+
+def _http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_SECONDS,
+        ),
+        timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=10.0),
+    )
+
+
+def _build_client(config):
+    # Retries are handled by chat_call, with jitter, so the SDKs' are disabled
+    if config is openai:
+        return openai.AsyncOpenAI(http_client=_http_client(), max_retries=0)
+    client_class = ASYNC_ANTHROPIC_CLIENTS[config.func]
+    # The model is a per-request parameter, not a client option
+    options = {key: value for key, value in config.keywords.items() if key != "model"}
+    return client_class(http_client=_http_client(), max_retries=0, **options)
+
+
+def get_llm_client():
+    """Return the keep-alive async client of the configured provider for the
+    running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _build_client(CURRENT_CLIENT)
+        _clients[loop] = client
+    return client
+
+
+async def close_llm_client():
+    """Close the running loop's LLM client and its connection pool, if any"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    client = _clients.pop(loop, None)
+    if client is not None:
+        await client.close()
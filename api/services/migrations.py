@@ -0,0 +1,231 @@
+import logging
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING, ReplaceOne, UpdateOne
+from pymongo.errors import OperationFailure
+from services.asset_results import RESULT_COLLECTIONS
+from services.llm_batches import LLM_BATCH_RESULT_TTL_SECONDS
+from services.token_usage import USAGE_DIMENSIONS
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_COLLECTION = "schema_migrations"
+
+CHECKPOINT_TTL_SECONDS = 7 * 24 * 3600
+
+DUPLICATE_KEY = 11000
+INDEX_CONFLICT_CODES = {85, 86}  # IndexOptionsConflict, IndexKeySpecsConflict
+
+# Hot lookups the routers and processors issue, used to verify index coverage
+HOT_QUERIES = {
+    "raw_assets.file_hash": ("raw_assets", {"file_hash": "x"}),
+    "raw_assets.status": ("raw_assets", {"status": "x"}),
+    "raw_assets.file_type": ("raw_assets", {"file_type": "x"}),
+    "raw_assets.batch_id": ("raw_assets", {"batch_id": "x"}),
+    "concepts.name": ("concepts", {"name": "x"}),
+    "relationships.source": ("relationships", {"source": "x"}),
+    "relationships.target": ("relationships", {"target": "x"}),
+    "implementations.concept": ("implementations", {"concept": "x"}),
+    "procedures.concept": ("procedures", {"concept": "x"}),
+    "tools.concepts": ("tools", {"concepts": "x"}),
+    "citations.lexeme": ("citations", {"lexeme": "x"}),
+    "citations.documents": ("citations", {"documents": "x"}),
+}
+
+
+def _ensure_index(db, collection: str, keys: list, unique: bool = False, **options):
+    """Create an index, tolerating pre-existing equivalents and legacy duplicates"""
+    try:
+        db[collection].create_index(keys, unique=unique, **options)
+    except OperationFailure as e:
+        if unique and e.code == DUPLICATE_KEY:
+            logger.error(
+                f"Duplicate values prevent a unique index on {collection} {keys}; "
+                f"creating a non-unique index instead: {e}"
+            )
+            db[collection].create_index(keys)
+        elif e.code in INDEX_CONFLICT_CODES:
+            logger.warning(f"Keeping existing index on {collection} {keys}: {e}")
+        else:
+            raise
+
+
+def _create_hot_lookup_indexes(db):
+    """Indexes for every filter the routers and processors run on a hot path"""
+    _ensure_index(db, "raw_assets", [("file_hash", ASCENDING)])
+    _ensure_index(db, "raw_assets", [("upload_date", DESCENDING)])
+
+    # Routers pre-check these with find_one before inserting
+    _ensure_index(db, "concepts", [("name", ASCENDING)], unique=True)
+    _ensure_index(db, "implementations", [("name", ASCENDING)], unique=True)
+    _ensure_index(db, "procedures", [("name", ASCENDING)], unique=True)
+    _ensure_index(db, "tools", [("name", ASCENDING)], unique=True)
+    _ensure_index(
+        db,
+        "relationships",
+        [("source", ASCENDING), ("target", ASCENDING)],
+        unique=True,
+    )
+
+    _ensure_index(db, "relationships", [("target", ASCENDING)])
+    _ensure_index(db, "implementations", [("concept", ASCENDING)])
+    _ensure_index(db, "procedures", [("concept", ASCENDING)])
+    _ensure_index(db, "tools", [("concepts", ASCENDING)])
+    _ensure_index(db, "citations", [("lexeme", ASCENDING)])
+
+
+def _move_asset_results(db, batch_size: int = 100):
+    """Move bulky analysis results from raw_assets into per-kind collections"""
+    for kind, collection in RESULT_COLLECTIONS.items():
+        cursor = db["raw_assets"].find(
+            {kind: {"$exists": True}}, {"file_hash": 1, kind: 1}
+        )
+        copies, unsets = [], []
+        for asset in cursor:
+            copies.append(
+                ReplaceOne(
+                    {"_id": asset["file_hash"]},
+                    {
+                        "file_hash": asset["file_hash"],
+                        "data": asset[kind],
+                        "updated_at": datetime.now(),
+                    },
+                    upsert=True,
+                )
+            )
+            unsets.append(UpdateOne({"_id": asset["_id"]}, {"$unset": {kind: ""}}))
+            if len(copies) >= batch_size:
+                _copy_then_unset(db, collection, copies, unsets)
+                copies, unsets = [], []
+        if copies:
+            _copy_then_unset(db, collection, copies, unsets)
+
+    # Definitions now look up citations by the documents that cite a lexeme
+    _ensure_index(db, "citations", [("documents", ASCENDING)])
+
+
+def _copy_then_unset(db, collection: str, copies: list, unsets: list):
+    # Only drop the field once its copy is written, so a crash can be re-run
+    db[collection].bulk_write(copies, ordered=False)
+    db["raw_assets"].bulk_write(unsets, ordered=False)
+    logger.info(f"Moved {len(copies)} results into {collection}")
+
+
+def _create_file_listing_indexes(db):
+    """Keyset pagination indexes for the /files listing and its filters"""
+    _ensure_index(db, "raw_assets", [("upload_date", DESCENDING), ("_id", DESCENDING)])
+    for field in ("status", "file_type"):
+        _ensure_index(
+            db,
+            "raw_assets",
+            [(field, ASCENDING), ("upload_date", DESCENDING), ("_id", DESCENDING)],
+        )
+
+
+def _create_batch_indexes(db):
+    """Lookup of a batch upload's assets for its progress summary"""
+    _ensure_index(db, "raw_assets", [("batch_id", ASCENDING)])
+
+
+def _create_checkpoint_indexes(db):
+    """Checkpoint lookup by run, stage and asset; abandoned runs' checkpoints
+    expire"""
+    _ensure_index(
+        db,
+        "pipeline_checkpoints",
+        [("run_id", ASCENDING), ("stage", ASCENDING), ("file_hash", ASCENDING)],
+    )
+    _ensure_index(
+        db,
+        "pipeline_checkpoints",
+        [("created_at", ASCENDING)],
+        expireAfterSeconds=CHECKPOINT_TTL_SECONDS,
+    )
+
+
+def _create_token_usage_indexes(db):
+    """One totals document per processor, run, file and model; reporting by file"""
+    _ensure_index(
+        db,
+        "token_usage",
+        [(field, ASCENDING) for field in USAGE_DIMENSIONS],
+        unique=True,
+    )
+    _ensure_index(db, "token_usage", [("file_hash", ASCENDING)])
+
+
+def _create_llm_batch_indexes(db):
+    """Polling of submitted batches, rounds per stage; batch results expire"""
+    _ensure_index(db, "llm_batches", [("status", ASCENDING)])
+    _ensure_index(db, "llm_batches", [("run_id", ASCENDING), ("stage", ASCENDING)])
+    _ensure_index(
+        db,
+        "llm_batch_results",
+        [("created_at", ASCENDING)],
+        expireAfterSeconds=LLM_BATCH_RESULT_TTL_SECONDS,
+    )
+
+
+# Ordered list of (version, description, function); append only
+MIGRATIONS = [
+    (1, "Create hot lookup indexes", _create_hot_lookup_indexes),
+    (2, "Move asset analysis results into side collections", _move_asset_results),
+    (3, "Create file listing indexes", _create_file_listing_indexes),
+    (4, "Create batch upload indexes", _create_batch_indexes),
+    (5, "Create pipeline checkpoint indexes", _create_checkpoint_indexes),
+    (6, "Create token usage indexes", _create_token_usage_indexes),
+    (7, "Create LLM batch indexes", _create_llm_batch_indexes),
+]
+
+
+def run_migrations(db) -> int:
+    """Apply pending migrations in order and return the current schema version.
+
+    Every migration must be idempotent: API replicas and workers all run this at
+    startup and may race on the same version.
+    """
+    applied = {doc["_id"] for doc in db[MIGRATIONS_COLLECTION].find({}, {"_id": 1})}
+    current = max(applied, default=0)
+
+    for version, description, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+
+        logger.info(f"Applying migration {version}: {description}")
+        migrate(db)
+        db[MIGRATIONS_COLLECTION].update_one(
+            {"_id": version},
+            {
+                "$setOnInsert": {
+                    "description": description,
+                    "applied_at": datetime.now(),
+                }
+            },
+            upsert=True,
+        )
+        current = max(current, version)
+
+    return current
+
+
+def _plan_stages(plan: dict) -> list[str]:
+    """Flatten the stage names of an explain() plan tree"""
+    stages = []
+    if "stage" in plan:
+        stages.append(plan["stage"])
+    if "queryPlan" in plan:
+        stages.extend(_plan_stages(plan["queryPlan"]))
+    if "inputStage" in plan:
+        stages.extend(_plan_stages(plan["inputStage"]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+
+def explain_hot_queries(db) -> dict[str, list[str]]:
+    """Return the winning plan stages for each hot query (expect IXSCAN)"""
+    plans = {}
+    for name, (collection, query) in HOT_QUERIES.items():
+        explanation = db[collection].find(query).explain()
+        plans[name] = _plan_stages(explanation["queryPlanner"]["winningPlan"])
+    return plans
@@ -1,14 +1,41 @@
+import asyncio
 import os
+import weakref
 
 from fastapi import HTTPException
 from redis import Redis
+from redis import asyncio as aioredis
 from rq import Queue
 
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379")
+
+_redis = None
+
+# Like Motor, asyncio Redis clients are bound to the loop they were created on
+_async_redis = weakref.WeakKeyDictionary()
+
+
+def get_redis() -> Redis:
+    """Return the process-wide Redis client (thread-safe, pooled)"""
+    global _redis
+    if _redis is None:
+        _redis = Redis.from_url(REDIS_URL)
+    return _redis
+
+
+def get_async_redis() -> aioredis.Redis:
+    """Return the asyncio Redis client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_redis.get(loop)
+    if client is None:
+        client = aioredis.Redis.from_url(REDIS_URL)
+        _async_redis[loop] = client
+    return client
+
 
 def get_redis_queue(logger):
     try:
-        redis_conn = Redis.from_url(os.getenv("REDIS_URL", "redis://redis:6379"))
-        return Queue("default", connection=redis_conn)
+        return Queue("default", connection=get_redis())
     except Exception as e:
-        logger.error(f"Failed to connect to Redis: {str(e)}")
+        logger.error(f"Failed to connect to Redis: {e!s}")
         raise HTTPException(status_code=500, detail="Redis connection failed")
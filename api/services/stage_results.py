@@ -0,0 +1,75 @@
+import hashlib
+import json
+import logging
+import os
+from collections.abc import Iterable
+from datetime import datetime
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+STAGE_RESULTS_COLLECTION = "stage_results"
+PROMPTS_ROOT = os.path.join("/app", "prompts", "assets")
+
+
+def hash_value(value: Any) -> str:
+    """Stable content hash of a JSON-compatible value"""
+    encoded = json.dumps(value, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def hash_prompts(paths: Iterable[str]) -> str:
+    """Hash prompt templates (files or whole directories) under prompts/assets"""
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        full_path = os.path.join(PROMPTS_ROOT, path)
+        if os.path.isdir(full_path):
+            files = sorted(
+                os.path.join(root, name)
+                for root, _, names in os.walk(full_path)
+                for name in names
+            )
+        else:
+            files = [full_path]
+        for file_path in files:
+            digest.update(os.path.relpath(file_path, PROMPTS_ROOT).encode())
+            try:
+                with open(file_path, "rb") as f:
+                    digest.update(f.read())
+            except FileNotFoundError:
+                digest.update(b"<missing>")
+    return digest.hexdigest()
+
+
+def stage_input_key(file_hash: str, stage: str, inputs: dict[str, Any]) -> str:
+    """Content address of everything a stage's output depends on"""
+    return hash_value({"file_hash": file_hash, "stage": stage, **inputs})
+
+
+async def find_stage_result(db, key: str) -> dict | None:
+    return await db[STAGE_RESULTS_COLLECTION].find_one({"_id": key})
+
+
+async def save_stage_result(
+    db,
+    key: str,
+    file_hash: str,
+    stage: str,
+    inputs: dict,
+    outputs: dict,
+) -> str:
+    """Store a stage's outputs under its input key; returns the output hash"""
+    output_hash = hash_value(outputs)
+    await db[STAGE_RESULTS_COLLECTION].replace_one(
+        {"_id": key},
+        {
+            "file_hash": file_hash,
+            "stage": stage,
+            "inputs": inputs,
+            "outputs": outputs,
+            "output_hash": output_hash,
+            "created_at": datetime.now(),
+        },
+        upsert=True,
+    )
+    return output_hash
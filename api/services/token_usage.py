@@ -0,0 +1,82 @@
+# api/services/token_usage.py
+
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+from services.database import get_async_db
+
+logger = logging.getLogger(__name__)
+
+TOKEN_USAGE_COLLECTION = "token_usage"
+USAGE_DIMENSIONS = ("processor", "run_id", "file_hash", "model")
+
+# Who an LLM call is made for; set around a stage so chat_call needn't be told
+_usage_context: ContextVar[dict | None] = ContextVar("llm_usage_context", default=None)
+
+
+@contextmanager
+def llm_usage_context(**fields):
+    """Attribute the LLM calls made inside the block to processor/run/file"""
+    token = _usage_context.set({**(_usage_context.get() or {}), **fields})
+    try:
+        yield
+    finally:
+        _usage_context.reset(token)
+
+
+async def record_token_usage(
+    model: str, input_tokens: int, output_tokens: int, cached: bool = False
+):
+    """Add one call's tokens to the totals of its processor, run and file"""
+    context = _usage_context.get() or {}
+    key = {
+        "processor": context.get("processor", "chat"),
+        "run_id": context.get("run_id"),
+        "file_hash": context.get("file_hash"),
+        "model": model,
+    }
+    if cached:
+        counters = {"cached_calls": 1}
+    else:
+        counters = {
+            "calls": 1,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+        }
+    try:
+        db = await get_async_db()
+        await db[TOKEN_USAGE_COLLECTION].update_one(
+            key,
+            {
+                "$inc": counters,
+                "$set": {"updated_at": datetime.now()},
+                "$setOnInsert": {"created_at": datetime.now()},
+            },
+            upsert=True,
+        )
+    except Exception as e:
+        logger.warning(f"Failed to record token usage: {e!s}")
+
+
+async def token_usage_report(db, group_by: list[str], **filters) -> list[dict]:
+    """Token totals grouped by any of processor, run_id, file_hash and model"""
+    match = {field: value for field, value in filters.items() if value is not None}
+    pipeline = [
+        {"$match": match},
+        {
+            "$group": {
+                "_id": {field: f"${field}" for field in group_by},
+                "calls": {"$sum": "$calls"},
+                "cached_calls": {"$sum": "$cached_calls"},
+                "input_tokens": {"$sum": "$input_tokens"},
+                "output_tokens": {"$sum": "$output_tokens"},
+            }
+        },
+        {"$sort": {"input_tokens": -1}},
+    ]
+    report = []
+    async for row in db[TOKEN_USAGE_COLLECTION].aggregate(pipeline):
+        report.append({**row.pop("_id"), **row})
+    return report
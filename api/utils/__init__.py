@@ -1,7 +1,11 @@
 import hashlib
 import logging
 import os
+import tempfile
 from datetime import datetime
+from typing import BinaryIO
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
 
 def format_datetime(dt) -> str:
@@ -46,3 +50,40 @@ def save_file(file_data: bytes, original_filename: str, content_type: str) -> di
         }
     except Exception as e:
         return {"error": str(e)}
+
+
+def save_file_stream(
+    stream: BinaryIO, original_filename: str, content_type: str
+) -> dict:
+    """Save an upload to disk chunk by chunk and return file details, like save_file"""
+    tmp_path = None
+    try:
+        raw_dir = os.path.join("/app", "filestore", "raw")
+        os.makedirs(raw_dir, exist_ok=True)
+
+        digest = hashlib.sha256()
+        file_size = 0
+        with tempfile.NamedTemporaryFile(dir=raw_dir, delete=False) as tmp:
+            tmp_path = tmp.name
+            while chunk := stream.read(UPLOAD_CHUNK_SIZE):
+                digest.update(chunk)
+                tmp.write(chunk)
+                file_size += len(chunk)
+
+        file_hash = digest.hexdigest()
+        stored_filename = f"{file_hash}{os.path.splitext(original_filename)[1]}"
+        filepath = os.path.join(raw_dir, stored_filename)
+        os.replace(tmp_path, filepath)
+
+        return {
+            "file_hash": file_hash,
+            "original_name": original_filename,
+            "stored_name": stored_filename,
+            "file_path": filepath,
+            "file_type": content_type,
+            "file_size": file_size,
+        }
+    except Exception as e:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return {"error": str(e)}
@@ -1,35 +1,169 @@
 # api/utils/db_utils.py
 
 import logging
-import os
+import threading
 from datetime import datetime
 
-from pymongo import MongoClient
+from pymongo import UpdateOne
+from services.database import get_db
+from services.events import publish_asset_event, publish_asset_event_async
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+STATUS_HISTORY_LIMIT = 500
+
 
 def init_mongo():
-    """Initialize MongoDB connection"""
-    client = MongoClient(os.getenv("MONGODB_URI"))
-    return client["chelle"]
+    """Return the shared MongoDB database handle"""
+    return get_db()
+
+
+def _is_flush_due(status: str) -> bool:
+    """Skips ride along with the stage's final flush; everything else, including
+    a stage starting, is written as soon as it is recorded"""
+    return not status.endswith("_skipped")
+
+
+class AssetStatusRecorder:
+    """Write-behind buffer for asset status transitions.
+
+    Transitions are collected per asset and written with a single bulk_write,
+    which sets the latest status and appends timestamped entries to the asset's
+    status_history.
+    """
+
+    def __init__(self, history_limit: int = STATUS_HISTORY_LIMIT):
+        self.history_limit = history_limit
+        self._pending: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        file_hash: str,
+        status: str,
+        error: str | None = None,
+        job_ids: dict | None = None,
+        run_id: str | None = None,
+    ) -> bool:
+        """Buffer a transition and return whether it should be flushed now"""
+        timestamp = datetime.now()
+        entry = {"status": status, "timestamp": timestamp}
+        if run_id:
+            entry["run_id"] = run_id
+        if error:
+            entry["error"] = error
+
+        with self._lock:
+            pending = self._pending.setdefault(file_hash, {"set": {}, "history": []})
+            pending["set"]["status"] = status
+            pending["set"]["status_updated_at"] = timestamp
+            if error:
+                pending["set"]["error"] = error
+            if status == "complete":
+                pending["set"]["processed_date"] = timestamp
+            if job_ids:
+                pending["set"]["job_ids"] = job_ids
+            pending["history"].append(entry)
+
+        return _is_flush_due(status)
+
+    def _drain(self) -> list[UpdateOne]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        return [
+            UpdateOne(
+                {"file_hash": file_hash},
+                {
+                    "$set": changes["set"],
+                    "$push": {
+                        "status_history": {
+                            "$each": changes["history"],
+                            "$slice": -self.history_limit,
+                        }
+                    },
+                },
+            )
+            for file_hash, changes in pending.items()
+        ]
+
+    def flush(self, db=None) -> int:
+        """Write all buffered transitions; returns the number of assets updated"""
+        operations = self._drain()
+        if not operations:
+            return 0
+        db = db if db is not None else init_mongo()
+        db["raw_assets"].bulk_write(operations, ordered=False)
+        logger.debug(f"Flushed status updates for {len(operations)} assets")
+        return len(operations)
+
+    async def flush_async(self, db) -> int:
+        """Async variant of flush for callers holding a Motor database"""
+        operations = self._drain()
+        if not operations:
+            return 0
+        await db["raw_assets"].bulk_write(operations, ordered=False)
+        logger.debug(f"Flushed status updates for {len(operations)} assets")
+        return len(operations)
+
+
+status_recorder = AssetStatusRecorder()
 
 
 def update_asset_status(
-    file_hash: str, status: str, error: str = None, job_ids: dict = None
+    file_hash: str,
+    status: str,
+    error: str | None = None,
+    job_ids: dict | None = None,
+    run_id: str | None = None,
 ):
-    """Update asset status in database"""
-    db = init_mongo()
-    assets = db["raw_assets"]
-
-    update_data = {"status": status}
-    if error:
-        update_data["error"] = error
-    if status == "complete":
-        update_data["processed_date"] = datetime.now()
-    if job_ids:
-        update_data["job_ids"] = job_ids
-
-    assets.update_one({"file_hash": file_hash}, {"$set": update_data})
+    """Record an asset status transition, flushing when the transition is final"""
+    if status_recorder.record(file_hash, status, error, job_ids, run_id):
+        status_recorder.flush()
+    publish_asset_event("status", file_hash, status=status, run_id=run_id, error=error)
     logger.info(f"Updated status for {file_hash} to {status}")
+
+
+async def update_asset_status_async(
+    db,
+    file_hash: str,
+    status: str,
+    error: str | None = None,
+    job_ids: dict | None = None,
+    run_id: str | None = None,
+):
+    """Async variant of update_asset_status for callers holding a Motor database"""
+    if status_recorder.record(file_hash, status, error, job_ids, run_id):
+        await status_recorder.flush_async(db)
+    await publish_asset_event_async(
+        "status", file_hash, status=status, run_id=run_id, error=error
+    )
+    logger.info(f"Updated status for {file_hash} to {status}")
+
+
+def summarize_stage_timings(
+    history: list[dict], run_id: str | None = None
+) -> dict[str, dict]:
+    """Derive per-stage start, end and duration from a status history"""
+    timings = {}
+    for entry in history:
+        if run_id and entry.get("run_id") != run_id:
+            continue
+        status = entry["status"]
+        if status.startswith("processing_") and status != "processing_queued":
+            stage = status[len("processing_") :]
+            timings.setdefault(stage, {})["started_at"] = entry["timestamp"]
+            continue
+        for outcome in ("complete", "error", "skipped"):
+            suffix = f"_{outcome}"
+            if status.endswith(suffix):
+                stage = status[: -len(suffix)]
+                timing = timings.setdefault(stage, {})
+                timing["ended_at"] = entry["timestamp"]
+                timing["outcome"] = outcome
+                if "started_at" in timing:
+                    timing["duration_seconds"] = (
+                        timing["ended_at"] - timing["started_at"]
+                    ).total_seconds()
+    return timings
@@ -0,0 +1,47 @@
+# api/utils/metrics_utils.py
+
+import logging
+
+from services.queue import get_async_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+METRICS_PREFIX = "metrics"
+
+
+def _metric_key(name: str) -> str:
+    return f"{METRICS_PREFIX}:{name}"
+
+
+def incr_metrics(name: str, counters: dict[str, int]):
+    """Add to the counters of a metric shared by every API replica and worker"""
+    try:
+        pipeline = get_redis().pipeline(transaction=False)
+        for field, amount in counters.items():
+            pipeline.hincrby(_metric_key(name), field, amount)
+        pipeline.execute()
+    except Exception as e:
+        logger.warning(f"Failed to record metric {name}: {e!s}")
+
+
+async def incr_metrics_async(name: str, counters: dict[str, int]):
+    """Async variant of incr_metrics"""
+    try:
+        pipeline = get_async_redis().pipeline(transaction=False)
+        for field, amount in counters.items():
+            pipeline.hincrby(_metric_key(name), field, amount)
+        await pipeline.execute()
+    except Exception as e:
+        logger.warning(f"Failed to record metric {name}: {e!s}")
+
+
+def get_metrics() -> dict[str, dict[str, int]]:
+    """Return every recorded metric as {name: {counter: value}}"""
+    redis = get_redis()
+    metrics = {}
+    for key in redis.scan_iter(match=f"{METRICS_PREFIX}:*"):
+        name = key.decode()[len(METRICS_PREFIX) + 1 :]
+        metrics[name] = {
+            field.decode(): int(value) for field, value in redis.hgetall(key).items()
+        }
+    return dict(sorted(metrics.items()))
@@ -0,0 +1,37 @@
+# api/utils/pagination_utils.py
+
+import base64
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+
+
+def encode_cursor(sort_value: datetime, doc_id: ObjectId) -> str:
+    """Opaque cursor pointing just past the given (sort value, _id) pair"""
+    payload = json.dumps({"v": sort_value.isoformat(), "id": str(doc_id)})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, ObjectId]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(payload["v"]), ObjectId(payload["id"])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_filter(field: str, cursor: str | None) -> dict:
+    """Filter for the page after `cursor` when sorting by (field, _id) descending"""
+    if not cursor:
+        return {}
+    value, doc_id = decode_cursor(cursor)
+    return {
+        "$or": [
+            {field: {"$lt": value}},
+            {field: value, "_id": {"$lt": doc_id}},
+        ]
+    }
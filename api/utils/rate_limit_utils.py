@@ -1,49 +1,176 @@
-# api/utils/rate_limit.py
+# api/utils/rate_limit_utils.py
 import asyncio
 import logging
-import time
+import os
+import random
 from functools import wraps
 
-from redis import Redis
+from fastapi import HTTPException
+from services.queue import get_async_redis
+
+from utils.metrics_utils import incr_metrics_async
 
 logger = logging.getLogger(__name__)
 
+RATE_LIMIT_PREFIX = "rate_limit"
+# Budgets of models without an entry in LLM_RATE_LIMITS
+LLM_DEFAULT_RPM = int(os.getenv("LLM_DEFAULT_RPM", "500"))
+LLM_DEFAULT_TPM = int(os.getenv("LLM_DEFAULT_TPM", "200000"))
+# Give up on a call that has waited this long for budget
+LLM_RATE_LIMIT_MAX_WAIT_SECONDS = float(
+    os.getenv("LLM_RATE_LIMIT_MAX_WAIT_SECONDS", "600")
+)
+
+# Takes `cost` from every bucket, or from none of them.
+# Returns "0" when taken, otherwise the seconds until all of them could pay.
+# KEYS = buckets (hashes of tokens, updated_at)
+# ARGV = capacity, refill per second, cost for each bucket in turn
+_TAKE = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 3 - 2])
+    local rate = tonumber(ARGV[i * 3 - 1])
+    local cost = tonumber(ARGV[i * 3])
+    local state = redis.call('HMGET', key, 'tokens', 'updated_at')
+    local tokens = tonumber(state[1]) or capacity
+    local updated_at = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+    levels[i] = tokens
+    if tokens < cost then
+        wait = math.max(wait, (cost - tokens) / rate)
+    end
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 3 - 2])
+    local rate = tonumber(ARGV[i * 3 - 1])
+    redis.call('HSET', key, 'tokens', levels[i] - tonumber(ARGV[i * 3]), 'updated_at', now)
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 60)
+end
+return '0'
+"""
+
+# Returns unused tokens to a bucket, or takes the overrun, once the real cost
+# of a call is known. The bucket may go negative to carry the debt forward.
+# KEYS[1] = bucket
+# ARGV[1] = capacity, ARGV[2] = refill per second, ARGV[3] = tokens to add
+_ADJUST = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1]) or capacity
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+tokens = math.min(capacity, tokens + tonumber(ARGV[3]))
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(tokens)
+"""
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a call waited longer than allowed for rate limit budget"""
+
+
+def parse_rate_limits(spec: str) -> dict[str, tuple[int, int]]:
+    """Parse per-model budgets, e.g. gpt-4o-mini=5000/2000000 (RPM/TPM)"""
+    limits = {}
+    for entry in filter(None, spec.split(",")):
+        model, budget = entry.rsplit("=", 1)
+        rpm, tpm = budget.split("/")
+        limits[model.strip()] = (int(rpm), int(tpm))
+    return limits
+
 
-class RateLimiter:
-    def __init__(
-        self, redis_client, key_prefix="rate_limit", max_requests=3, per_seconds=1
-    ):
-        self.redis = redis_client
-        self.key_prefix = key_prefix
-        self.max_requests = max_requests
-        self.per_seconds = per_seconds
+LLM_RATE_LIMITS = parse_rate_limits(os.getenv("LLM_RATE_LIMITS", ""))
 
-    async def acquire(self):
-        redis_key = f"{self.key_prefix}:claude"
-        current_time = int(time.time())
 
-        pipeline = self.redis.pipeline()
-        pipeline.zremrangebyscore(redis_key, 0, current_time - self.per_seconds)
-        pipeline.zcard(redis_key)
-        pipeline.zadd(redis_key, {str(current_time): current_time})
-        pipeline.expire(redis_key, self.per_seconds)
+def model_budget(model: str) -> tuple[int, int]:
+    """Requests and tokens per minute allowed for a model"""
+    return LLM_RATE_LIMITS.get(model, (LLM_DEFAULT_RPM, LLM_DEFAULT_TPM))
 
-        _, current_requests, *_ = pipeline.execute()
-        return current_requests < self.max_requests
 
+async def _take(
+    buckets: dict[str, tuple[float, float, float]],
+    name: str,
+    max_wait: float = LLM_RATE_LIMIT_MAX_WAIT_SECONDS,
+):
+    """Wait, with jitter, until every bucket can pay its cost"""
+    take = get_async_redis().register_script(_TAKE)
+    args = [value for bucket in buckets.values() for value in bucket]
+    waited = 0.0
+    while True:
+        wait = float(await take(keys=list(buckets), args=args))
+        if not wait:
+            break
+        if waited + wait > max_wait:
+            await incr_metrics_async("rate_limit", {f"{name}:timeout": 1})
+            raise RateLimitTimeout(f"Rate limit budget for {name} exhausted")
+        # Jitter spreads out the callers that were all told the same wait
+        delay = wait + random.uniform(0, min(wait, 1.0))
+        waited += delay
+        await asyncio.sleep(delay)
+    await incr_metrics_async(
+        "rate_limit", {f"{name}:acquired": 1, f"{name}:waited_ms": int(waited * 1000)}
+    )
+
+
+async def acquire_llm_capacity(model: str, tokens: int):
+    """Wait for a request and `tokens` tokens of the model's shared budget"""
+    rpm, tpm = model_budget(model)
+    await _take(
+        {
+            f"{RATE_LIMIT_PREFIX}:llm:{model}:requests": (rpm, rpm / 60, 1),
+            # A request bigger than the whole budget would otherwise never run
+            f"{RATE_LIMIT_PREFIX}:llm:{model}:tokens": (
+                tpm,
+                tpm / 60,
+                min(tokens, tpm),
+            ),
+        },
+        model,
+    )
+
+
+async def settle_llm_tokens(model: str, reserved: int, used: int):
+    """Correct the model's token budget once a call's actual usage is known"""
+    if used == reserved:
+        return
+    _, tpm = model_budget(model)
+    try:
+        adjust = get_async_redis().register_script(_ADJUST)
+        await adjust(
+            keys=[f"{RATE_LIMIT_PREFIX}:llm:{model}:tokens"],
+            args=[tpm, tpm / 60, min(reserved, tpm) - used],
+        )
+    except Exception as e:
+        logger.warning(f"Failed to settle token budget for {model}: {e!s}")
+
+
+def rate_limit(
+    key: str, max_requests: int = 3, per_seconds: float = 1, max_wait: float = 30
+):
+    """Limit an endpoint to max_requests per per_seconds across all replicas"""
 
-def rate_limit(key="anthropic", max_requests=3, per_seconds=1):
     def decorator(func):
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            redis_client = Redis.from_url("redis://redis:6379")
-            limiter = RateLimiter(
-                redis_client, max_requests=max_requests, per_seconds=per_seconds
-            )
-
-            while not await limiter.acquire(key):
-                await asyncio.sleep(1)
-
+            bucket = (max_requests, max_requests / per_seconds, 1)
+            try:
+                await _take({f"{RATE_LIMIT_PREFIX}:route:{key}": bucket}, key, max_wait)
+            except RateLimitTimeout as e:
+                raise HTTPException(
+                    status_code=429,
+                    detail=str(e),
+                    headers={"Retry-After": str(int(per_seconds))},
+                )
             return await func(*args, **kwargs)
 
         return wrapper
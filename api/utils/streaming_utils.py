@@ -0,0 +1,45 @@
+# api/utils/streaming_utils.py
+
+import logging
+import os
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+
+
+def wants_ndjson(request: Request) -> bool:
+    """Whether the client asked for a streamed NDJSON response"""
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def ndjson_response(
+    cursor, model: type[BaseModel], batch_size: int = STREAM_BATCH_SIZE
+) -> StreamingResponse:
+    """Stream a Motor cursor as NDJSON, one validated model per line.
+
+    Rows are fetched and written batch_size at a time, so memory stays bounded
+    by the batch rather than the collection.
+    """
+
+    async def rows():
+        lines = []
+        try:
+            async for doc in cursor.batch_size(batch_size):
+                lines.append(model.model_validate(doc).model_dump_json())
+                if len(lines) >= batch_size:
+                    yield "\n".join(lines) + "\n"
+                    lines = []
+            if lines:
+                yield "\n".join(lines) + "\n"
+        except Exception as e:
+            # Headers are already sent; all we can do is cut the stream short
+            logger.error(f"Error streaming {model.__name__} rows: {e!s}")
+            raise
+
+    return StreamingResponse(rows(), media_type=NDJSON_MEDIA_TYPE)
@@ -0,0 +1,126 @@
+# api/utils/token_utils.py
+
+import logging
+import os
+from functools import cache
+
+import tiktoken
+from config.chat_config import LLM_MAX_TOKENS, current_model_name
+
+logger = logging.getLogger(__name__)
+
+# Input plus output tokens each model accepts
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4o-mini": 128000,
+    "claude-3-5-sonnet-latest": 200000,
+    "anthropic.claude-3-sonnet-20240229-v1:0": 200000,
+}
+LLM_DEFAULT_CONTEXT_WINDOW = int(os.getenv("LLM_DEFAULT_CONTEXT_WINDOW", "128000"))
+# Headroom for the counting being approximate for non-OpenAI tokenizers
+CONTEXT_SAFETY_MARGIN = float(os.getenv("LLM_CONTEXT_SAFETY_MARGIN", "0.05"))
+
+MESSAGE_OVERHEAD_TOKENS = 4
+IMAGE_TOKEN_ESTIMATE = 1600
+
+
+class ContextWindowExceeded(Exception):
+    """Raised, before sending, for a request the model could not accept"""
+
+
+@cache
+def _encoding(model: str) -> tiktoken.Encoding | None:
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Not an OpenAI model; o200k is a close enough count for budgeting
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # The encoding files are downloaded on first use and may be unreachable
+        logger.warning(f"No tokenizer for {model}, estimating: {e!s}")
+        return None
+
+
+def count_tokens(text: str, model: str | None = None) -> int:
+    """Tokens in a piece of text for the model (default: the current one)"""
+    encoding = _encoding(model or current_model_name())
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: list[dict], model: str | None = None) -> int:
+    """Input tokens of a chat request, images at a flat estimate"""
+    tokens = 0
+    for message in messages:
+        tokens += MESSAGE_OVERHEAD_TOKENS
+        content = message.get("content")
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        for part in content or []:
+            if part.get("type") == "text":
+                tokens += count_tokens(part["text"], model)
+            else:
+                tokens += IMAGE_TOKEN_ESTIMATE
+    return tokens
+
+
+def context_window(model: str | None = None) -> int:
+    return MODEL_CONTEXT_WINDOWS.get(
+        model or current_model_name(), LLM_DEFAULT_CONTEXT_WINDOW
+    )
+
+
+def input_token_budget(model: str | None = None) -> int:
+    """Input tokens a request can use and still leave room for the response"""
+    window = context_window(model)
+    return int(window * (1 - CONTEXT_SAFETY_MARGIN)) - LLM_MAX_TOKENS
+
+
+def check_context_window(input_tokens: int, model: str | None = None):
+    budget = input_token_budget(model)
+    if input_tokens > budget:
+        raise ContextWindowExceeded(
+            f"Request has ~{input_tokens} input tokens; "
+            f"{model or current_model_name()} accepts {budget}"
+        )
+
+
+def chunk_for_context(
+    content: str, *framing: str, model: str | None = None
+) -> list[str]:
+    """Split content, on paragraph boundaries where possible, into chunks that
+    each fit the context window alongside the framing text (prompt etc.)"""
+    budget = input_token_budget(model) - sum(count_tokens(t, model) for t in framing)
+    if budget <= 0:
+        raise ContextWindowExceeded("Prompt alone exceeds the context window")
+    if count_tokens(content, model) <= budget:
+        return [content]
+
+    chunks, current, current_tokens = [], [], 0
+    for paragraph in _pieces(content, budget, model):
+        tokens = count_tokens(paragraph, model)
+        if current and current_tokens + tokens > budget:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(paragraph)
+        current_tokens += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    logger.info(f"Split {len(content)} characters into {len(chunks)} chunks")
+    return chunks
+
+
+def _pieces(content: str, budget: int, model: str | None) -> list[str]:
+    """Paragraphs, with any paragraph over the budget cut into budget-sized parts"""
+    pieces = []
+    for paragraph in content.split("\n\n"):
+        tokens = count_tokens(paragraph, model)
+        if tokens <= budget:
+            pieces.append(paragraph)
+            continue
+        # Cut by characters in proportion to the token count
+        size = max(1, len(paragraph) * budget // tokens)
+        pieces.extend(
+            paragraph[start : start + size] for start in range(0, len(paragraph), size)
+        )
+    return pieces
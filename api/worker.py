@@ -1,11 +1,41 @@
 # api/worker.py
 
+import asyncio
 import logging
 import os
+import signal
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime
 
 import redis
+from jobs.assets.admission import drain_backlog
+from jobs.assets.base import (
+    CURRENT_JOB,
+    PROCESSOR_EXECUTION_MODE,
+    AssetProcessor,
+    flush_stage_traces,
+)
 from langfuse import Langfuse
-from rq import Connection, Worker
+from rq import Queue, Worker
+from rq.defaults import (
+    DEFAULT_FAILURE_TTL,
+    DEFAULT_MAINTENANCE_TASK_INTERVAL,
+    DEFAULT_RESULT_TTL,
+)
+from rq.exceptions import DequeueTimeout
+from rq.job import JobStatus
+from rq.registry import (
+    FailedJobRegistry,
+    FinishedJobRegistry,
+    StartedJobRegistry,
+    clean_registries,
+)
+from services.database import close_db, connect_db, get_db
+from services.llm_batches import mark_batch_poller_alive, poll_llm_batches
+from services.llm_clients import close_llm_client
+from services.migrations import run_migrations
 from utils.logging_utils import configure_logging
 
 logging_level = os.getenv("LOG_LEVEL", "INFO")
@@ -15,6 +45,34 @@ configure_logging(logging_level)
 redis_url = os.getenv("REDIS_URL", "redis://redis:6379")
 conn = redis.from_url(redis_url)
 
+WORKER_MODE = os.getenv("WORKER_MODE", "rq")
+# Queues are polled in order, so list earlier stages first; "default" holds
+# jobs enqueued before stages had their own queues
+WORKER_QUEUES = (
+    os.getenv("WORKER_QUEUES", "").split(",")
+    if os.getenv("WORKER_QUEUES")
+    else AssetProcessor.stage_queues() + ["default"]
+)
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "8"))
+DEQUEUE_TIMEOUT = 5
+
+
+def parse_pools(spec: str) -> dict[str, int]:
+    """Parse per-queue concurrency caps, e.g. assets_citations=4,assets_definitions=2"""
+    pools = {}
+    for entry in filter(None, spec.split(",")):
+        name, size = entry.split("=")
+        pools[name.strip()] = int(size)
+    return pools
+
+
+WORKER_POOLS = parse_pools(os.getenv("WORKER_POOLS", ""))
+LLM_BATCH_POLL_SECONDS = int(os.getenv("LLM_BATCH_POLL_SECONDS", "60"))
+LLM_BATCH_POLL_LOCK = "llm_batches:poll_lock"
+ADMISSION_DRAIN_SECONDS = int(os.getenv("ADMISSION_DRAIN_SECONDS", "30"))
+ADMISSION_DRAIN_LOCK = "admission:drain_lock"
+REGISTRY_CLEAN_LOCK = "worker:registry_clean_lock"
+
 langfuse = Langfuse(
     public_key=os.getenv("LANGFUSE_PUBLIC_KEY"),
     secret_key=os.getenv("LANGFUSE_SECRET_KEY"),
@@ -22,9 +80,90 @@ langfuse = Langfuse(
 )
 
 
+async def _every(connection, stopping: asyncio.Event, seconds: int, lock: str, task):
+    """Run `task` every `seconds` until `stopping` is set; the lock keeps it
+    to one run per interval across worker replicas"""
+    while not stopping.is_set():
+        try:
+            if await asyncio.to_thread(connection.set, lock, 1, nx=True, ex=seconds):
+                await task()
+        except Exception as e:
+            logger.error(f"Error in periodic task {task.__name__}: {e}")
+        try:
+            await asyncio.wait_for(stopping.wait(), seconds)
+        except TimeoutError:
+            pass
+
+
+async def _poll_llm_batches():
+    # Outlives the poll interval, so it lapses only when no replica is polling
+    await asyncio.to_thread(mark_batch_poller_alive, 3 * LLM_BATCH_POLL_SECONDS)
+    await poll_llm_batches()
+
+
+async def _drain_backlog():
+    # Deferred uploads otherwise wait for the next upload or finished run
+    await asyncio.to_thread(drain_backlog)
+
+
+def _clean_queue_registries(connection):
+    for name in WORKER_QUEUES:
+        clean_registries(Queue(name, connection=connection))
+
+
+async def run_periodic_tasks(connection, stopping: asyncio.Event):
+    """Resume stages whose provider batches have finished, start deferred
+    uploads once the queues have room, and fail jobs a dead worker left
+    started"""
+
+    async def clean_job_registries():
+        await asyncio.to_thread(_clean_queue_registries, connection)
+
+    await asyncio.gather(
+        _every(
+            connection,
+            stopping,
+            LLM_BATCH_POLL_SECONDS,
+            LLM_BATCH_POLL_LOCK,
+            _poll_llm_batches,
+        ),
+        _every(
+            connection,
+            stopping,
+            ADMISSION_DRAIN_SECONDS,
+            ADMISSION_DRAIN_LOCK,
+            _drain_backlog,
+        ),
+        _every(
+            connection,
+            stopping,
+            DEFAULT_MAINTENANCE_TASK_INTERVAL,
+            REGISTRY_CLEAN_LOCK,
+            clean_job_registries,
+        ),
+    )
+
+
+def start_periodic_thread(connection):
+    """Run the periodic tasks beside a classic RQ worker, which has no loop"""
+
+    def run():
+        asyncio.run(run_periodic_tasks(connection, asyncio.Event()))
+
+    threading.Thread(target=run, name="periodic-tasks", daemon=True).start()
+
+
 class LangfuseWorker(Worker):
     """Custom worker class that ensures Langfuse connection is flushed on shutdown"""
 
+    def perform_job(self, job, queue):
+        try:
+            return super().perform_job(job, queue)
+        finally:
+            if PROCESSOR_EXECUTION_MODE == "inprocess":
+                # RQ work-horses exit right after the job; don't lose its spans
+                flush_stage_traces()
+
     def shutdown(self):
         """Ensure all Langfuse events are sent before shutdown"""
         try:
@@ -35,7 +174,175 @@ class LangfuseWorker(Worker):
             super().shutdown()
 
 
+class AsyncWorker:
+    """Runs up to `concurrency` RQ jobs at once on a single event loop.
+
+    Pipeline stages spend nearly all their time waiting on LLM and Marker
+    calls, so one process can keep many of them in flight. Coroutine job
+    functions are awaited; plain functions run in the thread pool. `pools`
+    caps how many of those slots a single queue may hold, so a burst of slow
+    stages cannot starve the quick ones.
+    """
+
+    def __init__(
+        self,
+        queues,
+        connection,
+        concurrency: int = WORKER_CONCURRENCY,
+        pools: dict[str, int] | None = None,
+    ):
+        self.connection = connection
+        self.queues = [Queue(name, connection=connection) for name in queues]
+        self.concurrency = concurrency
+        self.pools = pools or {}
+        self._running = {queue.name: 0 for queue in self.queues}
+        self._pool_freed = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._tasks = set()
+
+    def request_stop(self):
+        logger.info("Stop requested; finishing in-flight jobs")
+        self._stopping.set()
+
+    async def work(self):
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=self.concurrency))
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.request_stop)
+
+        slots = asyncio.Semaphore(self.concurrency)
+        logger.info(
+            f"Async worker listening on {[q.name for q in self.queues]} "
+            f"with concurrency {self.concurrency} and pools {self.pools}"
+        )
+
+        periodic = asyncio.create_task(
+            run_periodic_tasks(self.connection, self._stopping)
+        )
+
+        def finished(task, queue_name):
+            self._tasks.discard(task)
+            self._running[queue_name] -= 1
+            self._pool_freed.set()
+            slots.release()
+
+        try:
+            while not self._stopping.is_set():
+                await slots.acquire()
+                open_queues = [
+                    queue
+                    for queue in self.queues
+                    if self._running[queue.name]
+                    < self.pools.get(queue.name, self.concurrency)
+                ]
+                if not open_queues:
+                    slots.release()
+                    self._pool_freed.clear()
+                    await self._pool_freed.wait()
+                    continue
+
+                dequeued = await asyncio.to_thread(self._dequeue, open_queues)
+                if dequeued is None:
+                    slots.release()
+                    continue
+
+                job, queue = dequeued
+                if self._stopping.is_set():
+                    # Popped while the stop was requested; leave it for the next worker
+                    await asyncio.to_thread(queue.push_job_id, job.id, at_front=True)
+                    slots.release()
+                    break
+
+                self._running[queue.name] += 1
+                task = asyncio.create_task(self._perform(job, queue))
+                self._tasks.add(task)
+                task.add_done_callback(lambda t, name=queue.name: finished(t, name))
+
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+        finally:
+            periodic.cancel()
+            await close_llm_client()
+            try:
+                langfuse.flush()
+            except Exception as e:
+                logger.error(f"Error flushing Langfuse events: {e}")
+
+    def _dequeue(self, queues):
+        try:
+            return Queue.dequeue_any(
+                queues, DEQUEUE_TIMEOUT, connection=self.connection
+            )
+        except DequeueTimeout:
+            return None
+
+    async def _perform(self, job, queue):
+        started = StartedJobRegistry(queue.name, connection=self.connection)
+        await asyncio.to_thread(self._mark_started, job, started)
+        token = CURRENT_JOB.set(job)
+        try:
+            if asyncio.iscoroutinefunction(job.func):
+                call = job.func(*job.args, **job.kwargs)
+            else:
+                call = asyncio.to_thread(job.func, *job.args, **job.kwargs)
+            timeout = job.timeout if job.timeout and job.timeout > 0 else None
+            await asyncio.wait_for(call, timeout)
+        except Exception:
+            logger.error(f"Job {job.id} failed")
+            await asyncio.to_thread(
+                self._mark_done, job, started, JobStatus.FAILED, traceback.format_exc()
+            )
+        else:
+            await asyncio.to_thread(self._mark_done, job, started, JobStatus.FINISHED)
+        finally:
+            CURRENT_JOB.reset(token)
+
+    def _mark_started(self, job, started: StartedJobRegistry):
+        job.started_at = datetime.now(UTC)
+        with self.connection.pipeline() as pipeline:
+            job.set_status(JobStatus.STARTED, pipeline=pipeline)
+            job.save(pipeline=pipeline, include_meta=False)
+            started.add(job, job.timeout or 180, pipeline=pipeline)
+            pipeline.execute()
+
+    def _mark_done(self, job, started, status: str, exc_string: str | None = None):
+        """Record the outcome the way RQ's own worker does, expiring the job
+        hash along with its registry entry"""
+        job.ended_at = datetime.now(UTC)
+        with self.connection.pipeline() as pipeline:
+            job.set_status(status, pipeline=pipeline)
+            # Meta holds the progress the job itself wrote; don't clobber it
+            job.save(pipeline=pipeline, include_meta=False)
+            started.remove(job, pipeline=pipeline)
+            if status == JobStatus.FAILED:
+                ttl = (
+                    job.failure_ttl
+                    if job.failure_ttl is not None
+                    else DEFAULT_FAILURE_TTL
+                )
+                FailedJobRegistry(job.origin, connection=self.connection).add(
+                    job, ttl=ttl, exc_string=exc_string, pipeline=pipeline
+                )
+            else:
+                ttl = (
+                    job.result_ttl if job.result_ttl is not None else DEFAULT_RESULT_TTL
+                )
+                FinishedJobRegistry(job.origin, connection=self.connection).add(
+                    job, ttl, pipeline=pipeline
+                )
+            job.cleanup(ttl, pipeline=pipeline, remove_from_queue=False)
+            pipeline.execute()
+
+
 if __name__ == "__main__":
-    with Connection(conn):
-        worker = LangfuseWorker(logging_level=logging_level, queues=["default"])
-        worker.work()
+    connect_db()
+    run_migrations(get_db())
+    try:
+        if WORKER_MODE == "async":
+            asyncio.run(AsyncWorker(WORKER_QUEUES, conn, pools=WORKER_POOLS).work())
+        else:
+            start_periodic_thread(conn)
+            worker = LangfuseWorker(WORKER_QUEUES, connection=conn)
+            worker.work(logging_level=logging_level)
+    finally:
+        close_db()
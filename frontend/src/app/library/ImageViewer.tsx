@@ -17,17 +17,29 @@ import { Image } from 'lucide-react';
 const ImageViewer = ({ file }) => {
   const [selectedImage, setSelectedImage] = useState(null);
   const [isModalOpen, setIsModalOpen] = useState(false);
+  const [images, setImages] = useState(file.processed_paths?.images || null);
 
   // Early return if file has no images
-  if (!file.has_images || !file.processed_paths?.images) {
+  if (!file.has_images) {
     return null;
   }
 
-  const images = file.processed_paths.images;
+  // The listing leaves out processed paths; load them when the menu opens
+  const loadImages = async (open) => {
+    if (!open || images) return;
+    try {
+      const response = await fetch(`/api/files/${file.id}/paths`);
+      if (!response.ok) throw new Error('Failed to load image list');
+      const paths = await response.json();
+      setImages(paths.images);
+    } catch (error) {
+      console.error('Error loading images:', error);
+    }
+  };
 
   return (
     <>
-      <DropdownMenu>
+      <DropdownMenu onOpenChange={loadImages}>
         <DropdownMenuTrigger asChild>
           <Button variant="ghost" size="icon" className="relative">
             <Image className="h-4 w-4" />
@@ -37,7 +49,7 @@ const ImageViewer = ({ file }) => {
           </Button>
         </DropdownMenuTrigger>
         <DropdownMenuContent align="end" className="w-48">
-          {Object.entries(images).map(([filename, path]) => (
+          {Object.entries(images || {}).map(([filename, path]) => (
             <DropdownMenuItem
               key={filename}
               onClick={() => {
@@ -23,12 +23,25 @@ const TableViewer = ({ file }) => {
   const [loading, setLoading] = useState(false);
   const [debugInfo, setDebugInfo] = useState(null);
 
+  const [tables, setTables] = useState(file.processed_paths?.tables || null);
+
   // Early return if file has no tables
-  if (!file.has_tables || !file.processed_paths?.tables) {
+  if (!file.has_tables) {
     return null;
   }
 
-  const tables = file.processed_paths.tables;
+  // The listing leaves out processed paths; load them when the menu opens
+  const loadTables = async (open) => {
+    if (!open || tables) return;
+    try {
+      const response = await fetch(`/api/files/${file.id}/paths`);
+      if (!response.ok) throw new Error('Failed to load table list');
+      const paths = await response.json();
+      setTables(paths.tables);
+    } catch (error) {
+      console.error('Error loading tables:', error);
+    }
+  };
 
   const loadTableContent = async (tableName) => {
     try {
@@ -132,7 +145,7 @@ const TableViewer = ({ file }) => {
 
   return (
     <>
-      <DropdownMenu>
+      <DropdownMenu onOpenChange={loadTables}>
         <DropdownMenuTrigger asChild>
           <Button variant="ghost" size="icon" className="relative">
             <TableIcon className="h-4 w-4" />
@@ -142,7 +155,7 @@ const TableViewer = ({ file }) => {
           </Button>
         </DropdownMenuTrigger>
         <DropdownMenuContent align="end" className="w-48">
-          {Object.entries(tables).map(([tableName]) => (
+          {Object.entries(tables || {}).map(([tableName]) => (
             <DropdownMenuItem
               key={tableName}
               onClick={async () => {
@@ -232,6 +232,60 @@ const DocumentTypeBadge = ({ type, subType }) => {
   // ... existing DocumentTypeBadge component code ...
 };
 
+// Metadata is not part of the listing; each row asks for its own once shown
+const FileRow = ({ file, formatFileType, onViewContent, onDeleteClick }) => {
+  const [metadata, setMetadata] = useState(null);
+
+  useEffect(() => {
+    // Tried again on status changes until the metadata stage has run
+    if (metadata) return;
+    let cancelled = false;
+    const fetchMetadata = async () => {
+      try {
+        const response = await fetch(`/api/files/${file.id}/metadata`);
+        if (!response.ok) return;
+        const data = await response.json();
+        if (!cancelled) setMetadata(data);
+      } catch (error) {
+        console.error('Error fetching metadata:', error);
+      }
+    };
+    fetchMetadata();
+    return () => {
+      cancelled = true;
+    };
+  }, [file.id, file.status]);
+
+  const rowFile = metadata ? { ...file, metadata } : file;
+
+  return (
+    <TableRow>
+      <TableCell className="font-medium">{file.name}</TableCell>
+      <TableCell>{formatFileType(file.type)}</TableCell>
+      <TableCell>
+        <DocumentTypeBadge 
+          type={metadata?.documentMetadata?.primaryType?.category}
+          subType={metadata?.documentMetadata?.primaryType?.subType}
+        />
+      </TableCell>
+      <TableCell>{(file.size / 1024).toFixed(2)} KB</TableCell>
+      <TableCell>{new Date(file.upload_date).toLocaleString()}</TableCell>
+      <TableCell>
+        <Badge className={statusColors[file.status]}>
+          {file.status.charAt(0).toUpperCase() + file.status.slice(1)}
+        </Badge>
+      </TableCell>
+      <TableCell className="text-right">
+        <FileRowActions
+          file={rowFile}
+          onViewContent={() => onViewContent(rowFile)}
+          onDeleteClick={() => onDeleteClick(file)}
+        />
+      </TableCell>
+    </TableRow>
+  );
+};
+
 export default function LibraryPage() {
   const [files, setFiles] = useState([]);
   const [loading, setLoading] = useState(true);
@@ -243,13 +297,24 @@ export default function LibraryPage() {
   const [fileToDelete, setFileToDelete] = useState(null);
   const [toastState, setToastState] = useState({ open: false, message: '', variant: 'default' });
 
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+
+  // One page of summary fields; metadata and paths are fetched per row
+  const fetchPage = async (cursor = null) => {
+    const params = new URLSearchParams();
+    if (cursor) params.set('cursor', cursor);
+    const response = await fetch(`/api/files?${params}`);
+    if (!response.ok) throw new Error('Failed to fetch files');
+    const page = await response.json();
+    setNextCursor(response.headers.get('X-Next-Cursor'));
+    return page;
+  };
+
   const fetchFiles = async () => {
     try {
       setLoading(true);
-      const response = await fetch('/api/files');
-      if (!response.ok) throw new Error('Failed to fetch files');
-      const data = await response.json();
-      setFiles(data);
+      setFiles(await fetchPage());
     } catch (error) {
       setError(error.message);
     } finally {
@@ -257,10 +322,36 @@ export default function LibraryPage() {
     }
   };
 
+  const loadMore = async () => {
+    try {
+      setLoadingMore(true);
+      const page = await fetchPage(nextCursor);
+      setFiles((current) => [...current, ...page]);
+    } catch (error) {
+      setError(error.message);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     fetchFiles();
   }, []);
 
+  // Status changes are pushed by the API, so the list never needs re-polling
+  useEffect(() => {
+    const events = new EventSource('/api/events/assets');
+    events.addEventListener('status', (message) => {
+      const event = JSON.parse(message.data);
+      setFiles((current) =>
+        current.map((file) =>
+          file.file_hash === event.file_hash ? { ...file, status: event.status } : file
+        )
+      );
+    });
+    return () => events.close();
+  }, []);
+
   const handleUploadComplete = async () => {
     setToastState({
       open: true,
@@ -393,39 +484,30 @@ export default function LibraryPage() {
               </TableHeader>
               <TableBody>
                 {files.map((file) => (
-                  <TableRow key={file.id}>
-                    <TableCell className="font-medium">{file.name}</TableCell>
-                    <TableCell>{formatFileType(file.type)}</TableCell>
-                    <TableCell>
-                      <DocumentTypeBadge 
-                        type={file.metadata?.documentMetadata?.primaryType?.category}
-                        subType={file.metadata?.documentMetadata?.primaryType?.subType}
-                      />
-                    </TableCell>
-                    <TableCell>{(file.size / 1024).toFixed(2)} KB</TableCell>
-                    <TableCell>{new Date(file.upload_date).toLocaleString()}</TableCell>
-                    <TableCell>
-                      <Badge className={statusColors[file.status]}>
-                        {file.status.charAt(0).toUpperCase() + file.status.slice(1)}
-                      </Badge>
-                    </TableCell>
-                    <TableCell className="text-right">
-                      <FileRowActions
-                        file={file}
-                        onViewContent={() => {
-                          setSelectedFile(file);
-                          setIsFileModalOpen(true);
-                        }}
-                        onDeleteClick={() => {
-                          setFileToDelete(file);
-                          setDeleteDialogOpen(true);
-                        }}
-                      />
-                    </TableCell>
-                  </TableRow>
+                  <FileRow
+                    key={file.id}
+                    file={file}
+                    formatFileType={formatFileType}
+                    onViewContent={(file) => {
+                      setSelectedFile(file);
+                      setIsFileModalOpen(true);
+                    }}
+                    onDeleteClick={(file) => {
+                      setFileToDelete(file);
+                      setDeleteDialogOpen(true);
+                    }}
+                  />
                 ))}
               </TableBody>
             </Table>
+
+            {nextCursor && (
+              <div className="mt-4 flex justify-center">
+                <Button variant="outline" onClick={loadMore} disabled={loadingMore}>
+                  {loadingMore ? 'Loading...' : 'Load more'}
+                </Button>
+              </div>
+            )}
           </CardContent>
         </Card>
 
@@ -44,7 +44,8 @@ def wait_for_services():
 
 
 def upload_fixture_files():
-    """Upload all fixture files to the API"""
+    """Upload all fixture files to the API as one batch"""
+    files = []
     for filename, mime_type in SAMPLE_FILES.items():
         fixture_path = f"/app/fixtures/{filename}"
 
@@ -52,26 +53,24 @@ def upload_fixture_files():
             print(f"Error: Fixture file not found at {fixture_path}")
             continue
 
-        try:
-            with open(fixture_path, "rb") as f:
-                files = {
-                    "file": (
-                        filename,
-                        f,
-                        mime_type,
-                    )
-                }
-                print(f"Uploading {filename}...")
-                response = requests.post("http://nginx:80/upload", files=files)
+        with open(fixture_path, "rb") as f:
+            files.append(("files", (filename, f.read(), mime_type)))
 
-            if response.status_code == 200:
-                print(f"Successfully uploaded {filename}!")
-                print(response.json())
-            else:
-                print(f"Failed to upload {filename}: {response.text}")
+    if not files:
+        return
+
+    try:
+        print(f"Uploading {len(files)} fixture files...")
+        response = requests.post("http://nginx:80/upload/batch", files=files)
+
+        if response.status_code == 200:
+            print("Successfully uploaded fixtures!")
+            print(response.json())
+        else:
+            print(f"Failed to upload fixtures: {response.text}")
 
-        except Exception as e:
-            print(f"Error uploading {filename}: {str(e)}")
+    except Exception as e:
+        print(f"Error uploading fixtures: {e!s}")
 
 
 if __name__ == "__main__":